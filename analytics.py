@@ -0,0 +1,221 @@
+"""
+実行ログ（metrics.jsonl）の集計
+
+処理の肝:
+- metrics.jsonl は追記専用。前回読み終えたバイト位置（offset）から先だけを読み、改行で終わっている完全な行だけをパースする
+  （書きかけの末尾行は次回に回す）
+- 実行ごとのレコードを日付（started_at の日付）ごとの集計に畳み込み、offset と一緒に
+  cache/analytics_rollups.json に保存する。プロセスを立ち上げ直しても、そこから続きを読む
+- ファイルの先頭行のハッシュも保存し、ファイルが作り直された（削除・ローテーション）ら最初から読み直す
+
+採用理由: Streamlit は操作のたびにスクリプトを再実行する。何年分のログでも、再実行ごとの読み込みは
+          前回からの追記分だけで済み、画面は日ごとの集計だけから描ける
+注意点: 集計の形を変えたら ROLLUP_VERSION を上げる（古い集計は捨てて読み直す）
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+from config_store import load_json, save_json
+from metrics import METRICS_FILE
+
+ROLLUP_FILE = os.path.join("cache", "analytics_rollups.json")
+ROLLUP_VERSION = 1
+
+# プロファイルごとの結果のうち、日ごとに合計する件数
+COUNT_FIELDS = ("trends", "new_trends", "filtered", "exact_duplicates", "near_duplicates", "dead_links", "from_reserve")
+
+_HEAD_BYTES = 4096
+
+
+def _empty_day():
+    return {
+        "runs": 0,
+        "duration_sec": 0.0,
+        "duration_max": 0.0,
+        "statuses": {},
+        "delivered": 0,
+        "items": [],
+        "models": {},
+        **{field: 0 for field in COUNT_FIELDS},
+    }
+
+
+class RunLogAnalytics:
+    def __init__(self, metrics_path=METRICS_FILE, rollup_path=ROLLUP_FILE, max_items_per_day=100):
+        """
+        Args:
+            metrics_path: 実行ログ（metrics.jsonl）
+            rollup_path: 日ごとの集計と読み終えた位置の保存先
+            max_items_per_day: 1日分として残す通知済みトレンドの最大件数
+        """
+        self.metrics_path = metrics_path
+        self.rollup_path = rollup_path
+        self.max_items_per_day = max_items_per_day
+        self._lock = threading.Lock()
+        self.state = load_json(rollup_path, None)
+        if not self._state_valid(self.state):
+            self.state = self._empty_state()
+
+    def _empty_state(self):
+        return {"version": ROLLUP_VERSION, "path": self.metrics_path, "offset": 0, "head": None, "days": {}}
+
+    def _state_valid(self, state):
+        return (isinstance(state, dict) and state.get("version") == ROLLUP_VERSION
+                and state.get("path") == self.metrics_path)
+
+    # --- 追記分の読み込み ---
+
+    def refresh(self):
+        """
+        前回の続きから実行ログを読み、集計に加える
+
+        Returns:
+            新たに集計した実行の数
+        """
+        with self._lock:
+            try:
+                size = os.path.getsize(self.metrics_path)
+            except OSError:
+                return 0
+            if size == self.state["offset"]:
+                return 0
+
+            with open(self.metrics_path, "rb") as f:
+                head = hashlib.sha256(f.read(_HEAD_BYTES).split(b"\n", 1)[0]).hexdigest()
+                if size < self.state["offset"] or (self.state["head"] and head != self.state["head"]):
+                    # 作り直されたファイルは最初から読む
+                    self.state = self._empty_state()
+                self.state["head"] = head
+                f.seek(self.state["offset"])
+                data = f.read(size - self.state["offset"])
+
+            end = data.rfind(b"\n")
+            if end < 0:
+                return 0  # 書きかけの1行だけ
+            runs = 0
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 壊れた行は飛ばす
+                self._fold(record)
+                runs += 1
+            self.state["offset"] += end + 1
+            self._save()
+            return runs
+
+    def _fold(self, record):
+        """1実行分のレコードを日ごとの集計に加える"""
+        day_key = str(record.get("started_at", ""))[:10]
+        if not day_key:
+            return
+        day = self.state["days"].setdefault(day_key, _empty_day())
+        duration = record.get("duration_sec", 0) or 0
+        day["runs"] += 1
+        day["duration_sec"] = round(day["duration_sec"] + duration, 6)
+        day["duration_max"] = max(day["duration_max"], duration)
+
+        for name, profile in (record.get("profiles") or {}).items():
+            status = profile.get("status")
+            if status:
+                day["statuses"][status] = day["statuses"].get(status, 0) + 1
+            for field in COUNT_FIELDS:
+                value = profile.get(field)
+                if isinstance(value, (int, float)):
+                    day[field] += value
+            delivered = profile.get("delivered") or []
+            day["delivered"] += len(delivered)
+            room = self.max_items_per_day - len(day["items"])
+            day["items"].extend([name, item] for item in delivered[:max(0, room)])
+
+        for span in record.get("spans") or []:
+            if span.get("name") != "gemini.generate" or not span.get("model"):
+                continue
+            model = day["models"].setdefault(span["model"], {"attempts": 0, "ok": 0, "sec": 0.0, "ok_sec": 0.0})
+            model["attempts"] += 1
+            model["sec"] = round(model["sec"] + span.get("sec", 0), 6)
+            if span.get("ok"):
+                model["ok"] += 1
+                model["ok_sec"] = round(model["ok_sec"] + span.get("sec", 0), 6)
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.rollup_path) or ".", exist_ok=True)
+            save_json(self.rollup_path, self.state, indent=None)
+        except IOError as e:
+            print(f"Warning: Failed to save analytics rollups: {e}")
+
+    # --- 集計の取り出し ---
+
+    def days(self, last_days=None):
+        """
+        日ごとの集計を日付順に返す
+
+        Args:
+            last_days: 直近何日分か（None なら全期間）
+        """
+        with self._lock:
+            items = sorted(self.state["days"].items())
+        if last_days:
+            since = (date.today() - timedelta(days=last_days - 1)).isoformat()
+            items = [(d, r) for d, r in items if d >= since]
+        return items
+
+    def daily_rows(self, last_days=None):
+        """グラフ用の日ごとの行"""
+        rows = []
+        for day, r in self.days(last_days):
+            seen = r["trends"] or 0
+            rows.append({
+                "date": day,
+                "runs": r["runs"],
+                "delivered": r["delivered"],
+                "avg_duration_sec": round(r["duration_sec"] / r["runs"], 3) if r["runs"] else 0.0,
+                "max_duration_sec": round(r["duration_max"], 3),
+                "duplicate_rate": round((r["exact_duplicates"] + r["near_duplicates"]) / seen, 3) if seen else 0.0,
+                "filtered_rate": round(r["filtered"] / seen, 3) if seen else 0.0,
+                "dead_link_rate": round(r["dead_links"] / seen, 3) if seen else 0.0,
+            })
+        return rows
+
+    def model_rows(self, last_days=None):
+        """モデルごとの成功率・所要時間"""
+        totals = {}
+        for _, r in self.days(last_days):
+            for model, m in r["models"].items():
+                t = totals.setdefault(model, {"attempts": 0, "ok": 0, "sec": 0.0, "ok_sec": 0.0})
+                for key in t:
+                    t[key] += m[key]
+        rows = []
+        for model, t in sorted(totals.items(), key=lambda kv: -kv[1]["attempts"]):
+            rows.append({
+                "model": model,
+                "attempts": t["attempts"],
+                "success_rate": round(t["ok"] / t["attempts"], 3) if t["attempts"] else 0.0,
+                "avg_sec": round(t["sec"] / t["attempts"], 3) if t["attempts"] else 0.0,
+                "avg_ok_sec": round(t["ok_sec"] / t["ok"], 3) if t["ok"] else None,
+            })
+        return rows
+
+    def status_totals(self, last_days=None):
+        totals = {}
+        for _, r in self.days(last_days):
+            for status, count in r["statuses"].items():
+                totals[status] = totals.get(status, 0) + count
+        return totals
+
+    def delivered_items(self, last_days=None, limit=100):
+        """通知済みのトレンド（新しい日付から）"""
+        rows = []
+        for day, r in reversed(self.days(last_days)):
+            for profile, name in r["items"]:
+                rows.append({"date": day, "profile": profile, "trend": name})
+                if len(rows) >= limit:
+                    return rows
+        return rows
@@ -1,6 +1,40 @@
 import os
 import json
-import google.generativeai as genai
+import queue
+import threading
+import time
+from config_store import load_json
+from prompt_builder import PromptBuilder
+from json_stream import JsonStreamParser
+from cassette import wrap as cassette_wrap
+from model_router import MODEL_STATS_FILE, ModelRouter
+from response_cache import ResponseCache
+import metrics
+
+KNOWN_TOOLS_FILE = "known_tools.json"
+
+MODEL_CATALOG_FILE = os.path.join("cache", "model_catalog.json")
+MODEL_CATALOG_TTL = 24 * 60 * 60  # モデル一覧は1日1回取り直せば十分
+
+# google.generativeai は gRPC / protobuf ごと読み込むと0.5秒以上かかるため、最初に使うときに読み込む
+genai = None
+
+def _load_genai():
+    global genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    return genai
+
+# openai SDK も httpx ごと読み込むと重いため、PerplexityClient を使うときに読み込む
+openai = None
+
+def _load_openai():
+    global openai
+    if openai is None:
+        import openai as openai_sdk
+        openai = openai_sdk
+    return openai
 
 def _format_api_error(e):
     error_str = str(e)
@@ -15,110 +49,685 @@ def _format_api_error(e):
         error_str = error_str[:300] + '...'
     return f"APIエラー: {error_str}"
 
+TREND_FIELDS = ("name", "description", "url", "buzz_factor")
+
+def _validate_trend_item(item):
+    if not isinstance(item, dict) or any(not isinstance(item.get(k), str) for k in TREND_FIELDS):
+        raise ValueError(f"Invalid trend item: {str(item)[:100]}")
+
+def _validate_trends(result):
+    """生成結果が想定したスキーマか検証し、そのまま返す（不正なら ValueError）"""
+    if not isinstance(result, dict) or not isinstance(result.get("trends"), list):
+        raise ValueError("Response JSON has no 'trends' list.")
+    for item in result["trends"]:
+        _validate_trend_item(item)
+    return result
+
+def _validate_batch_entry(entry):
+    if not isinstance(entry, dict) or not isinstance(entry.get("id"), str):
+        raise ValueError(f"Invalid batch entry: {str(entry)[:100]}")
+    _validate_trends(entry)
+
+def _batch_validator(ids):
+    """まとめて生成した結果の検証（要求したどの id も含まれていなければ不正とみなす）"""
+    def validate(result):
+        if not isinstance(result, dict) or not isinstance(result.get("results"), list):
+            raise ValueError("Response JSON has no 'results' list.")
+        for entry in result["results"]:
+            _validate_batch_entry(entry)
+        if not any(entry["id"] in ids for entry in result["results"]):
+            raise ValueError("Response JSON has none of the requested ids.")
+        return result
+    return validate
+
+def _record_usage(response, text):
+    """応答のバイト数と（SDKが返していれば）トークン数を計測に加える"""
+    metrics.add("gemini.response_bytes", len(text.encode("utf-8")))
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        metrics.add("gemini.prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+        metrics.add("gemini.output_tokens", getattr(usage, "candidates_token_count", 0) or 0)
+
+def _score_model(name):
+    """最新モデルを優先する順位付け（3.x > 2.5 > 2.0 > 1.5）"""
+    if '3.1' in name and 'pro' in name: return 10
+    if '3' in name and 'flash' in name: return 9
+    if '2.5-pro' in name: return 8
+    if '2.5-flash' in name: return 7
+    if '2.0-flash' in name: return 5
+    if '1.5-flash' in name: return 2
+    if '1.5-pro' in name: return 1
+    return 0
+
+def _replay_path(path):
+    """再生中に使う別のファイル（cache/model_catalog.json → cache/model_catalog.replay.json）"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.replay{ext}"
+
 class GeminiTrendClient:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, catalog_path=MODEL_CATALOG_FILE, catalog_ttl=MODEL_CATALOG_TTL,
+                 hedge_delay=None, hedge_max=2, response_cache=None, prompt_budget=2000, stream=False,
+                 candidates_per_pillar=1, router_options=None, cassette=None):
+        """
+        Args:
+            api_key: Gemini APIキー（省略時は環境変数 GEMINI_API_KEY）
+            catalog_path: モデル一覧キャッシュの保存先
+            catalog_ttl: モデル一覧キャッシュの有効期間（秒）
+            hedge_delay: 次のモデルを並行起動するまでの待ち時間（秒）。None なら順番に試す、0 なら hedge_max 個を同時起動
+            hedge_max: 同時に走らせるモデルの最大数
+            response_cache: 生成結果のキャッシュ（response_cache.ResponseCache）。None ならキャッシュしない
+            prompt_budget: プロンプトの推定トークン数の上限（既知ツールはこの範囲に収まる分だけ送る）
+            stream: True ならストリーミングで生成し、不正な応答を途中で打ち切る
+            candidates_per_pillar: 柱ごとに出してもらう候補数（選抜は呼び出し側で行う）
+            router_options: model_router.ModelRouter の引数（{"enabled": false} なら固定の順位のまま試す）
+            cassette: 呼び出しの記録・再生（{"mode": "record" | "replay", "path", "speed"}）。再生時はSDKを読み込まず、APIキーも不要。
+                      応答キャッシュは使わず、モデル一覧と統計は *.replay.json に分ける
+        """
+        self.genai, replaying = cassette_wrap(_load_genai, cassette)
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        if not self.api_key and not replaying:
             raise ValueError("Gemini API Key is missing. Please set it in .env.")
+        if replaying:
+            # 再生した応答・モデル一覧を本番の cache/ に残すと、あとの本番の実行がそれを使ってしまう
+            response_cache = None
+            catalog_path = _replay_path(catalog_path)
         
-        genai.configure(api_key=self.api_key)
+        self.genai.configure(api_key=self.api_key)
+
+        # モデル一覧のキャッシュ（複数スレッドから共有される）
+        self.catalog_path = catalog_path
+        self.catalog_ttl = catalog_ttl
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        self._catalog_refreshing = False
+
+        self.hedge_delay = hedge_delay
+        self.hedge_max = max(1, hedge_max)
+        self.response_cache = response_cache
+        self.prompt_builder = PromptBuilder(budget_tokens=prompt_budget, per_pillar=candidates_per_pillar)
+        self.stream = stream
+
+        router_options = dict(router_options or {})
+        if replaying:
+            # 再生した（倍速の）所要時間で本番の統計を崩さないよう、別のファイルに記録する
+            router_options.setdefault("path", _replay_path(MODEL_STATS_FILE))
+        self.router = ModelRouter(**router_options) if router_options.pop("enabled", True) else None
         
-        try:
-            with open("known_tools.json", "r", encoding="utf-8") as f:
-                self.known_tools = json.load(f).get("known_tools", [])
-        except FileNotFoundError:
-            self.known_tools = []
+        self.reload_known_tools()
+
+    def reload_known_tools(self):
+        """known_tools.json を読み直す（常駐モードでファイルが変わったときに呼ばれる）"""
+        self.known_tools = load_json(KNOWN_TOOLS_FILE, {}).get("known_tools", [])
             
-    def get_available_models(self):
-        """APIから利用可能なモデル一覧を取得し、最適な順にソートして返す"""
+    def get_available_models(self, force_refresh=False):
+        """
+        利用可能なモデル一覧を最適な順にソートして返す
+
+        キャッシュ（catalog_path）が catalog_ttl 以内ならAPIを呼ばずにそのまま返す。
+        期限切れの場合は古い一覧を即座に返しつつ、バックグラウンドで取り直す（stale-while-revalidate）。
+
+        Args:
+            force_refresh: True ならキャッシュを無視して同期的に取り直す
+        """
+        with self._catalog_lock:
+            if not force_refresh:
+                catalog = self._catalog or self._read_catalog()
+                if catalog:
+                    self._catalog = catalog
+                    age = time.time() - catalog.get("fetched_at", 0)
+                    if age > self.catalog_ttl:
+                        self._refresh_catalog_in_background()
+                    metrics.add("gemini.catalog_cache_hits")
+                    return [m["name"] for m in catalog["models"]]
+
+        with metrics.span("gemini.list_models"):
+            catalog = self._refresh_catalog()
+        if catalog:
+            return [m["name"] for m in catalog["models"]]
+        # フォールバック（2025年以降の現行モデル）
+        return ['gemini-2.5-flash', 'gemini-2.5-pro']
+
+    def _fetch_models(self):
+        """APIからモデル一覧を取得し、スコア付きで降順に並べる"""
+        models = []
+        for m in self.genai.list_models():
+            if 'generateContent' in m.supported_generation_methods:
+                # 'models/' プレフィックスを削除して扱う
+                name = m.name.replace('models/', '')
+                # 非推奨モデルの除外
+                if "gemini-1.0" in name or name == "gemini-pro":
+                    continue
+                models.append({"name": name, "score": _score_model(name)})
+        models.sort(key=lambda m: m["score"], reverse=True)
+        return models
+
+    def _refresh_catalog(self):
+        """モデル一覧を取り直してキャッシュを更新する。失敗時は手元のキャッシュを返す"""
         try:
-            models = []
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    # 'models/' プレフィックスを削除して扱う
-                    name = m.name.replace('models/', '')
-                    models.append(name)
-            
-            # 最新モデルを優先する順位付け（3.x > 2.5 > 2.0 > 1.5）
-            def score(name):
-                if '3.1' in name and 'pro' in name: return 10
-                if '3' in name and 'flash' in name: return 9
-                if '2.5-pro' in name: return 8
-                if '2.5-flash' in name: return 7
-                if '2.0-flash' in name: return 5
-                if '1.5-flash' in name: return 2
-                if '1.5-pro' in name: return 1
-                return 0
-                
-            # 非推奨モデルの除外
-            models = [m for m in models if "gemini-1.0" not in m and m != "gemini-pro"]
-            models.sort(key=score, reverse=True)
-            return models
+            catalog = {"fetched_at": time.time(), "models": self._fetch_models()}
         except Exception as e:
             print(f"Warning: Failed to list models: {e}")
-            # フォールバック（2025年以降の現行モデル）
-            return ['gemini-2.5-flash', 'gemini-2.5-pro']
+            with self._catalog_lock:
+                return self._catalog or self._read_catalog()
+
+        with self._catalog_lock:
+            self._catalog = catalog
+            self._write_catalog(catalog)
+        return catalog
+
+    def _refresh_catalog_in_background(self):
+        if self._catalog_refreshing:
+            return
+        self._catalog_refreshing = True
+
+        def worker():
+            try:
+                self._refresh_catalog()
+            finally:
+                self._catalog_refreshing = False
+
+        threading.Thread(target=worker, name="model-catalog-refresh", daemon=True).start()
+
+    def _read_catalog(self):
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+            return catalog if catalog.get("models") else None
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_catalog(self, catalog):
+        try:
+            os.makedirs(os.path.dirname(self.catalog_path) or ".", exist_ok=True)
+            tmp_path = f"{self.catalog_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(catalog, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.catalog_path)
+        except IOError as e:
+            print(f"Warning: Failed to save model catalog: {e}")
+
+    def get_daily_trends(self, category="Dev Tools", target_languages=None, use_cache=True, on_trend=None):
+        """
+        トレンドを生成する
+
+        Args:
+            category: 検索する分野
+            target_languages: ターゲットの言語・技術（カンマ区切り）
+            use_cache: False なら応答キャッシュを読まずに必ずAPIを呼ぶ（結果は保存する）
+            on_trend: ストリーミング時、on_trend(model_name, item) で届いたアイテムを逐次受け取る。
+                      途中で打ち切られたモデルのアイテムも届くため、確定結果は戻り値で判断すること
+        """
+        prompt, prompt_stats = self.prompt_builder.build(self.known_tools, category, target_languages)
+        result = self._cached_or_generate(prompt, use_cache, on_trend)
+        if "error" in result:
+            return result
+        return self._finalize(result, prompt_stats)
+
+    def get_daily_trends_batch(self, requests, use_cache=True, batch_size=4):
+        """
+        複数の分野をまとめて生成する（batch_size 件ずつ1回の呼び出しにまとめる）
+
+        応答が壊れている・途中で切れているなどで失敗したバッチは半分に分けて生成し直し、
+        1件になったら get_daily_trends と同じ単独の生成で行う。応答から抜けていた分野だけも同様に生成し直す。
+
+        Args:
+            requests: (category, target_languages) のリスト
+            use_cache: False なら応答キャッシュを読まずに必ずAPIを呼ぶ
+            batch_size: 1回の呼び出しにまとめる最大件数
+
+        Returns:
+            requests と同じ順序の結果のリスト（各要素は get_daily_trends の戻り値と同じ形）
+        """
+        results = [None] * len(requests)
+        batch_size = max(1, batch_size)
+        for start in range(0, len(requests), batch_size):
+            indices = list(range(start, min(start + batch_size, len(requests))))
+            self._run_batch(requests, indices, results, use_cache)
+        return results
+
+    def _run_batch(self, requests, indices, results, use_cache):
+        if len(indices) == 1:
+            category, targets = requests[indices[0]]
+            results[indices[0]] = self.get_daily_trends(category, targets, use_cache=use_cache)
+            return
+
+        batch = [(f"r{n + 1}", *requests[i]) for n, i in enumerate(indices)]
+        ids = [req_id for req_id, _, _ in batch]
+        prompt, prompt_stats = self.prompt_builder.build_batch(self.known_tools, batch)
+        # 途中で切れた・壊れた応答は、バッチが大きすぎただけのことが多い。ルーターへの失敗の記録は、
+        # 分割した生成も失敗したときまで保留する（健全なモデルのブレーカーを開かないため）
+        deferred = []
+        with metrics.span("gemini.batch", size=len(indices)) as span:
+            # 途中で切れた・壊れた応答は別のモデルでも起きやすいため、他のモデルを試さずに分割へ進む
+            result = self._cached_or_generate(prompt, use_cache, validate=_batch_validator(ids), give_up_on=(ValueError,),
+                                              deferred=deferred)
+            span["ok"] = "error" not in result
+
+        if "error" in result:
+            mid = len(indices) // 2
+            print(f"Batch of {len(indices)} failed ({result['error']}). Splitting into {mid} + {len(indices) - mid}.")
+            metrics.add("gemini.batch_splits")
+            self._run_batch(requests, indices[:mid], results, use_cache)
+            self._run_batch(requests, indices[mid:], results, use_cache)
+            if any("error" in results[i] for i in indices):
+                self._record_deferred(deferred)
+            return
+        # 並行して試した別のモデルが同じバッチに答えられたなら、失敗したモデルの失敗は本物
+        self._record_deferred(deferred)
+
+        by_id = {entry["id"]: entry for entry in result["results"]}
+        missing = []
+        for req_id, i in zip(ids, indices):
+            entry = by_id.get(req_id)
+            if entry is None:
+                missing.append(i)
+                continue
+            results[i] = self._finalize({
+                "trends": entry["trends"],
+                "one_line_summary": entry.get("one_line_summary", ""),
+                "meta": dict(result["meta"], mode=f"batch-{result['meta']['mode']}"),
+            }, prompt_stats)
+        if missing:
+            print(f"Batch response is missing {len(missing)} of {len(indices)} request(s). Generating them again.")
+            self._run_batch(requests, missing, results, use_cache)
+
+    def _record_deferred(self, deferred):
+        if self.router:
+            for model_name, elapsed, error in deferred:
+                self.router.record(model_name, elapsed, error)
+
+    def _cached_or_generate(self, prompt, use_cache, on_trend=None, validate=_validate_trends, give_up_on=(),
+                            deferred=None):
+        """
+        キャッシュがあればそれを、無ければ生成した結果を返す（生成結果はキャッシュに保存）
+
+        Args:
+            give_up_on: この例外で失敗したら、残りのモデルを試さずにエラーを返す
+            deferred: リストを渡すと、give_up_on の例外による失敗はルーターに記録せず (モデル, 秒数, 例外) を追加する
+        """
+        models_to_try = self.get_available_models()
+        if self.router:
+            # 実績から「有効な応答が早く返りそうな順」に並べ替え、ブレーカーが開いているモデルを外す
+            models_to_try = self.router.order(models_to_try)
+
+        # 同じ日・同じプロンプトの生成済み結果があればAPIを呼ばずに返す
+        if self.response_cache and use_cache:
+            started = time.perf_counter()
+            found = self.response_cache.lookup(prompt, models_to_try)
+            if found:
+                model_name, cached, key = found
+                print(f"Using cached response from model: {model_name}")
+                cached["meta"] = {
+                    "mode": "cache",
+                    "model": model_name,
+                    "elapsed_sec": round(time.perf_counter() - started, 3),
+                    "attempts": [],
+                    "cache_key": key,
+                }
+                return cached
+
+        if self.hedge_delay is None:
+            result = self._generate_sequential(models_to_try, prompt, on_trend, validate, give_up_on, deferred)
+        else:
+            result = self._generate_hedged(models_to_try, prompt, on_trend, validate, give_up_on, deferred)
+
+        if "error" in result:
+            return result
+        if self.response_cache:
+            key = self.response_cache.put(prompt, result["meta"]["model"], {k: v for k, v in result.items() if k != "meta"})
+            if key:
+                result["meta"]["cache_key"] = key
+        return result
+
+    def discard_cached(self, result):
+        """
+        使い終えた応答をキャッシュから消す（同じ日の再実行で、通知済みのトレンドを返さないため）
+
+        まとめて生成した応答は、使ったプロファイルの1つ目で消える（残りのプロファイルは手元の結果を使う）
+        """
+        key = (result or {}).get("meta", {}).get("cache_key")
+        if self.response_cache and key:
+            self.response_cache.discard(key)
 
-    def get_daily_trends(self, category="Dev Tools", target_languages=None):
-        known_tools_str = ", ".join(self.known_tools)
-        targets_str = f"ターゲット: {target_languages}" if target_languages else "ターゲット: TypeScript, PHP, AWS, 新興AIツール"
+    def _finalize(self, result, prompt_stats):
+        """プロンプト統計をmetaに付ける（既知ツールの除外は filter_engine で行う）"""
+        result["meta"]["prompt"] = prompt_stats
+        return result
+
+    def _generate(self, model_name, prompt, on_trend=None, validate=_validate_trends, give_up_on=(), deferred=None):
+        """
+        1つのモデルで生成し、パース・検証済みの結果を返す（失敗時は例外）
+
+        deferred にリストを渡すと、give_up_on の例外による失敗はルーターに記録せず、(モデル, 秒数, 例外) を追加する
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            with metrics.span("gemini.generate", model=model_name, stream=self.stream) as span:
+                span["ok"] = False
+                if self.stream:
+                    result = self._generate_stream(model_name, prompt, on_trend, validate)
+                else:
+                    result = self._generate_once(model_name, prompt, validate)
+                span["ok"] = True
+                return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if deferred is not None and isinstance(error, give_up_on or ()):
+                deferred.append((model_name, elapsed, error))
+            elif self.router:
+                self.router.record(model_name, elapsed, error)
+
+    def _generate_once(self, model_name, prompt, validate=_validate_trends):
+        # ツールにGoogle検索をセット。モデルによってはサポートされない可能性があるため、エラー時は次のモデルへ
+        model = self.genai.GenerativeModel(
+            model_name=model_name
+        )
         
-        system_prompt = f"""
-        あなたは「テックトレンドスカウト」です。
-        ユーザーのために、以下の3つの異なる視点で、合計で**ちょうど3つ**の有益な情報を提案してください。
-
-        # ユーザーの「既知のツール」リスト:
-        [{known_tools_str}]
-        ※注意: これらのツールを「新しい発見（Alpha Trend/Hidden Gem）」として提案しないでください。
-        ※例外: 「Power Tip」枠では、これらのツールのプラグインや拡張機能を提案してください。
-
-        # 提案の3本柱（必ず各1つずつ含めること）:
-        1. **Alpha Trend (最新トレンド)**: 過去24〜48時間以内にGitHub Trending等で話題になった新ツール。{targets_str}
-        2. **Power Tip (活用術・拡張)**: 既知のツールを強化するプラグイン・設定。
-        3. **Hidden Gem (隠れた名作)**: プロが愛用するがあまり知られていないツール。
-
-        以下のJSON形式のみで回答してください:
-        {{
-            "date": "今日の日付",
-            "trends": [
-                {{
-                    "name": "ツール/トピック名",
-                    "description": "概要（日本語）。なぜこれが有益か？",
-                    "url": "URL",
-                    "buzz_factor": "【Alpha Trend】 / 【Power Tip】 / 【Hidden Gem】 のいずれかを記載"
-                }}
-            ],
-            "one_line_summary": "今日の3カテゴリのハイライト要約"
-        }}
-        """
-
-        prompt = f"{system_prompt}\n\n上記の指示に従い、{category}分野におけるトレンドと情報を検索・生成してください。"
+        response = model.generate_content(
+            prompt,
+            generation_config=self.genai.GenerationConfig(
+                response_mime_type="application/json",
+            )
+        )
         
-        models_to_try = self.get_available_models()
+        content = response.text
+        _record_usage(response, content)
+        with metrics.span("gemini.parse", model=model_name):
+            content = content.replace('```json', '').replace('```', '').strip()
+            return validate(json.loads(content))
+
+    def _generate_stream(self, model_name, prompt, on_trend=None, validate=_validate_trends):
+        """
+        ストリーミングで生成し、trends の各アイテムを届いた時点で検証する
+
+        応答が明らかに不正（JSONで始まらない・壊れた要素・スキーマ違反）になった時点で
+        StreamInvalid を投げて打ち切るため、生成完了を待たずに次のモデルへ移れる。
+
+        Args:
+            on_trend: on_trend(model_name, item) 検証済みのアイテムが届くたびに呼ばれる
+        """
+        def validate_element(key, item):
+            if key == "trends":
+                _validate_trend_item(item)
+            elif key == "results":
+                # まとめて生成したときは分野ごとの結果が1要素
+                _validate_batch_entry(item)
+
+        model = self.genai.GenerativeModel(
+            model_name=model_name
+        )
+        response = model.generate_content(
+            prompt,
+            generation_config=self.genai.GenerationConfig(
+                response_mime_type="application/json",
+            ),
+            stream=True,
+        )
+
+        parser = JsonStreamParser(validator=validate_element)
+        chunk = None
+        for chunk in response:
+            for kind, key, value in parser.feed(chunk.text):
+                if kind == "item" and key == "trends" and on_trend:
+                    on_trend(model_name, value)
+        _record_usage(chunk, parser.text)
+        return validate(parser.close())
+
+    def _generate_sequential(self, models_to_try, prompt, on_trend=None, validate=_validate_trends, give_up_on=(),
+                             deferred=None):
+        """モデルを1つずつ順番に試す（従来の挙動）"""
+        started = time.perf_counter()
+        attempts = []
         last_error = None
         
         for model_name in models_to_try:
             print(f"Trying model: {model_name}")
+            attempt_started = time.perf_counter()
             try:
-                # ツールにGoogle検索をセット。モデルによってはサポートされない可能性があるため、エラー時は次のモデルへ
-                model = genai.GenerativeModel(
-                    model_name=model_name
-                )
-                
-                response = model.generate_content(
-                    prompt,
-                    generation_config=genai.GenerationConfig(
-                        response_mime_type="application/json",
-                    )
-                )
-                
-                content = response.text
-                content = content.replace('```json', '').replace('```', '').strip()
-                return json.loads(content)
+                result = self._generate(model_name, prompt, on_trend, validate, give_up_on, deferred)
+                attempts.append({"model": model_name, "ok": True, "elapsed_sec": round(time.perf_counter() - attempt_started, 3)})
+                result["meta"] = {
+                    "mode": "sequential",
+                    "model": model_name,
+                    "elapsed_sec": round(time.perf_counter() - started, 3),
+                    "attempts": attempts,
+                }
+                return result
 
             except Exception as e:
                 print(f"Failed with model {model_name}: {e}")
+                attempts.append({"model": model_name, "ok": False, "elapsed_sec": round(time.perf_counter() - attempt_started, 3), "error": str(e)[:200]})
                 last_error = e
+                if isinstance(e, give_up_on):
+                    break
                 # エラーが起きてもループを継続し、次のモデルでリトライする
                 
         return {"error": _format_api_error(last_error) if last_error else "All models failed."}
+
+    def _generate_hedged(self, models_to_try, prompt, on_trend=None, validate=_validate_trends, give_up_on=(),
+                         deferred=None):
+        """
+        ヘッジ付き並列生成
+
+        最上位のモデルから開始し、hedge_delay 秒以内に有効な応答が無ければ次のモデルも並行して起動する
+        （hedge_delay=0 なら hedge_max 個を同時に起動）。失敗したモデルは待たずに即座に次へ差し替える。
+        最初にパース・検証を通った応答を採用し、残りの応答は無視する。
+        """
+        started = time.perf_counter()
+        results = queue.Queue()
+        remaining = list(models_to_try)
+        in_flight = []
+        attempts = []
+        last_error = None
+
+        def worker(model_name):
+            attempt_started = time.perf_counter()
+            try:
+                outcome = self._generate(model_name, prompt, on_trend, validate, give_up_on, deferred)
+            except Exception as e:
+                outcome = e
+            results.put((model_name, outcome, time.perf_counter() - attempt_started))
+
+        def launch():
+            model_name = remaining.pop(0)
+            print(f"Trying model: {model_name}")
+            in_flight.append(model_name)
+            # デーモンスレッドにすることで、負けたリクエストの完了をプロセス終了時に待たない
+            threading.Thread(target=metrics.profiled(worker), args=(model_name,), name=f"hedge-{model_name}",
+                             daemon=True).start()
+
+        while remaining and len(in_flight) < (self.hedge_max if self.hedge_delay == 0 else 1):
+            launch()
+
+        while in_flight:
+            can_hedge = remaining and len(in_flight) < self.hedge_max
+            try:
+                model_name, outcome, elapsed = results.get(timeout=self.hedge_delay if can_hedge else None)
+            except queue.Empty:
+                print(f"No valid response within {self.hedge_delay}s. Hedging with next model.")
+                launch()
+                continue
+
+            in_flight.remove(model_name)
+            if isinstance(outcome, Exception):
+                print(f"Failed with model {model_name}: {outcome}")
+                attempts.append({"model": model_name, "ok": False, "elapsed_sec": round(elapsed, 3), "error": str(outcome)[:200]})
+                last_error = outcome
+                if isinstance(outcome, give_up_on):
+                    remaining.clear()  # 走っているものの結果だけ待つ
+                if remaining and len(in_flight) < self.hedge_max:
+                    launch()
+                continue
+
+            attempts.append({"model": model_name, "ok": True, "elapsed_sec": round(elapsed, 3)})
+            outcome["meta"] = {
+                "mode": "hedged",
+                "model": model_name,
+                "elapsed_sec": round(time.perf_counter() - started, 3),
+                "attempts": attempts,
+                "abandoned": sorted(in_flight),
+            }
+            return outcome
+
+        return {"error": _format_api_error(last_error) if last_error else "All models failed."}
+
+
+PERPLEXITY_API_BASE = "https://api.perplexity.ai"
+PERPLEXITY_MODEL = "sonar-pro"
+PROPOSAL_CACHE_DIR = os.path.join("cache", "proposals")
+PROPOSAL_CACHE_TTL = 10 * 60  # 同じ相談の再実行・Streamlit の再描画で使い回す程度
+
+PROPOSAL_SYSTEM_PROMPT = """You are a strategic productivity consultant with live web search.
+For the user's goal, research current tools and services and answer ONLY with a JSON object, no markdown:
+{
+  "summary_advice": "2-4 sentences of strategic advice for the goal",
+  "search_queries": [{"query": "an effective web search query", "reason": "what it will surface"}],
+  "recommendations": [{"name": "tool or service", "type": "Tool | Service | SaaS | Library", "description": "what it does", "reason": "why it fits the goal"}]
+}
+Write summary_advice first. Give 3-5 search_queries and 3-6 recommendations. Answer in the user's language."""
+
+PROPOSAL_LISTS = {"search_queries": "query", "recommendations": "name"}
+
+def _validate_proposal_item(key, item):
+    required = PROPOSAL_LISTS.get(key)
+    if required and (not isinstance(item, dict) or not isinstance(item.get(required), str)):
+        raise ValueError(f"Invalid {key} item: {str(item)[:100]}")
+
+def _validate_proposals(result):
+    if not isinstance(result, dict) or not isinstance(result.get("summary_advice", ""), str):
+        raise ValueError("Response JSON has no 'summary_advice'.")
+    for key in PROPOSAL_LISTS:
+        if not isinstance(result.setdefault(key, []), list):
+            raise ValueError(f"Response JSON has no '{key}' list.")
+        for item in result[key]:
+            _validate_proposal_item(key, item)
+    return result
+
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+
+def _shared_openai_client(api_key, base_url, timeout):
+    """
+    (APIキー, ベースURL) ごとに1つの OpenAI クライアントを共有する
+
+    クライアントは内部の HTTP 接続プールを持つため、Streamlit の再実行のたびに作り直さず、
+    同じプロセスの中では接続（TLS ハンドシェイク）を使い回す。
+    """
+    key = (api_key, base_url, timeout)
+    with _openai_clients_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = _openai_clients[key] = _load_openai().OpenAI(
+                api_key=api_key, base_url=base_url, timeout=timeout, max_retries=1)
+        return client
+
+def _format_perplexity_error(e, base_url):
+    """Perplexity の失敗をユーザー向けのメッセージにする（キーの名前と呼び先を示す）"""
+    status = getattr(e, "status_code", None)
+    error_str = str(e)
+    if status in (401, 403):
+        return f"認証エラー: PERPLEXITY_API_KEY が無効または権限がありません。（{base_url}）"
+    if status == 429:
+        return f"レート制限 (429): Perplexity API へのリクエストが多すぎます。（{base_url}）"
+    if status is not None and status >= 500:
+        return f"サーバーエラー: Perplexity API が一時的に利用できません。（{base_url}）"
+    if isinstance(e, ValueError):
+        return f"Perplexity の応答を読み取れませんでした: {error_str[:300]}"
+    if status is None and type(e).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return f"接続エラー: Perplexity API（{base_url}）に接続できません。"
+
+    if len(error_str) > 300:
+        error_str = error_str[:300] + '...'
+    return f"Perplexity APIエラー: {error_str}"
+
+class PerplexityClient:
+    def __init__(self, api_key=None, base_url=None, model=PERPLEXITY_MODEL, timeout=60.0, cache_ttl=PROPOSAL_CACHE_TTL):
+        """
+        Args:
+            api_key: Perplexity APIキー（省略時は環境変数 PERPLEXITY_API_KEY）
+            base_url: OpenAI互換APIのベースURL（省略時は環境変数 PERPLEXITY_API_BASE、無ければ本番）
+            model: 使用するモデル
+            timeout: 1回の呼び出しのタイムアウト（秒）
+            cache_ttl: 同じ相談内容の結果を使い回す秒数（0 ならキャッシュしない）
+        """
+        self.api_key = api_key or os.getenv("PERPLEXITY_API_KEY")
+        if not self.api_key:
+            raise ValueError("Perplexity API Key is missing. Please set it in .env.")
+        self.base_url = base_url or os.getenv("PERPLEXITY_API_BASE") or PERPLEXITY_API_BASE
+        self.model = model
+        self.client = _shared_openai_client(self.api_key, self.base_url, timeout)
+
+        self.cache = ResponseCache(directory=PROPOSAL_CACHE_DIR, ttl=cache_ttl, max_entries=50, enabled=cache_ttl > 0)
+
+    def get_proposals(self, user_goal, on_event=None, use_cache=True):
+        """
+        目標に対する助言・検索クエリ・おすすめツールをストリーミングで生成する
+
+        Args:
+            user_goal: ユーザーの目標
+            on_event: on_event(key, value) で、完成した値から順に受け取る。
+                      key は "summary_advice"（値は文字列）か "search_queries" / "recommendations"（値は1件分）。
+                      キャッシュから返すときも同じ順に呼ばれる
+            use_cache: False ならキャッシュを読まずに必ずAPIを呼ぶ
+
+        Returns:
+            {"summary_advice", "search_queries", "recommendations", "meta"} または {"error": ...}
+        """
+        goal = user_goal.strip()
+        started = time.perf_counter()
+        cached = self.cache.get(goal, self.model) if use_cache else None
+        if cached is not None:
+            if on_event:
+                self._replay(cached, on_event)
+            cached["meta"] = {"mode": "cache", "model": self.model, "elapsed_sec": round(time.perf_counter() - started, 3)}
+            return cached
+
+        first_content_sec = None
+        try:
+            with metrics.span("perplexity.generate", model=self.model) as span:
+                span["ok"] = False
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": PROPOSAL_SYSTEM_PROMPT},
+                        {"role": "user", "content": goal},
+                    ],
+                    stream=True,
+                )
+                parser = JsonStreamParser(validator=_validate_proposal_item)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    for kind, key, value in parser.feed(chunk.choices[0].delta.content or ""):
+                        if key != "summary_advice" and key not in PROPOSAL_LISTS:
+                            continue
+                        if first_content_sec is None:
+                            first_content_sec = span["first_content_sec"] = round(time.perf_counter() - started, 3)
+                        if on_event:
+                            on_event(key, value)
+                result = _validate_proposals(parser.close())
+                span["ok"] = True
+        except Exception as e:
+            print(f"Perplexity request failed: {e}")
+            return {"error": _format_perplexity_error(e, self.base_url)}
+
+        self.cache.put(goal, self.model, result)
+        result["meta"] = {
+            "mode": "stream",
+            "model": self.model,
+            "elapsed_sec": round(time.perf_counter() - started, 3),
+            "first_content_sec": first_content_sec,
+        }
+        return result
+
+    @staticmethod
+    def _replay(result, on_event):
+        if result.get("summary_advice"):
+            on_event("summary_advice", result["summary_advice"])
+        for key in PROPOSAL_LISTS:
+            for item in result.get(key, []):
+                on_event(key, item)
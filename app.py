@@ -1,5 +1,6 @@
 import streamlit as st
 import os
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 from api_client import PerplexityClient
 
@@ -48,42 +49,53 @@ if submit_btn:
     elif not api_key_input:
         st.error("Please provide a Perplexity API Key in the sidebar or .env file.")
     else:
-        with st.spinner("Analyzing your request with Perplexity Sonar Pro..."):
-            try:
-                client = PerplexityClient(api_key=api_key_input)
-                result = client.get_proposals(user_goal)
-                
-                if "error" in result:
-                    st.error(f"API Error: {result['error']}")
-                else:
-                    # Summary Section
-                    st.success("Analysis Complete!")
-                    st.markdown(f"### 💡 Strategic Advice\n{result.get('summary_advice', 'No summary provided.')}")
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.markdown("### 🔍 Recommended Search Queries")
-                        for item in result.get("search_queries", []):
-                            with st.expander(f"**{item['query']}**", expanded=True):
-                                st.write(item.get("reason", ""))
-                                st.markdown(f"[Search on Google](https://www.google.com/search?q={item['query'].replace(' ', '+')})")
-                    
-                    with col2:
-                        st.markdown("### 🛠 Recommended Tools & Services")
-                        for item in result.get("recommendations", []):
-                            container = st.container()
-                            container.markdown(
-                                f"""
-                                <div class="recommendation-card">
-                                    <h4>{item['name']} <span style="font-size:0.8em; color:#888;">({item['type']})</span></h4>
-                                    <p>{item['description']}</p>
-                                    <p style="color:#238636; font-size:0.9em;"><em>Why: {item['reason']}</em></p>
-                                </div>
-                                """,
-                                unsafe_allow_html=True
-                            )
-                            
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+        # 完成した値から順に描画する（助言 → 検索クエリ / おすすめツール）
+        status = st.empty()
+        status.info("Analyzing your request with Perplexity Sonar Pro...")
+        advice_area = st.container()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("### 🔍 Recommended Search Queries")
+            queries_area = st.container()
+        with col2:
+            st.markdown("### 🛠 Recommended Tools & Services")
+            tools_area = st.container()
 
+        def render_query(item):
+            with queries_area.expander(f"**{item['query']}**", expanded=True):
+                st.write(item.get("reason", ""))
+                st.markdown(f"[Search on Google](https://www.google.com/search?q={quote_plus(item['query'])})")
+
+        def render_tool(item):
+            tools_area.markdown(
+                f"""
+                <div class="recommendation-card">
+                    <h4>{item['name']} <span style="font-size:0.8em; color:#888;">({item.get('type', '')})</span></h4>
+                    <p>{item.get('description', '')}</p>
+                    <p style="color:#238636; font-size:0.9em;"><em>Why: {item.get('reason', '')}</em></p>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+
+        def on_event(key, value):
+            if key == "summary_advice":
+                advice_area.markdown(f"### 💡 Strategic Advice\n{value}")
+            elif key == "search_queries":
+                render_query(value)
+            elif key == "recommendations":
+                render_tool(value)
+
+        try:
+            client = PerplexityClient(api_key=api_key_input)
+            result = client.get_proposals(user_goal, on_event=on_event)
+
+            if "error" in result:
+                status.error(f"API Error: {result['error']}")
+            else:
+                status.success("Analysis Complete!")
+                if not result.get("summary_advice"):
+                    advice_area.markdown("### 💡 Strategic Advice\nNo summary provided.")
+
+        except Exception as e:
+            status.error(f"An error occurred: {str(e)}")
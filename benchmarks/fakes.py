@@ -0,0 +1,386 @@
+"""
+ベンチマーク用のローカルスタンドイン（Gemini SDK / Discord API）
+
+処理の肝:
+- FakeGenAI は google.generativeai と同じ形（configure / list_models / GenerativeModel / GenerationConfig）を持ち、
+  api_client.genai と差し替えることで、モデル選択・フォールバック・ヘッジ・ストリーミングの実コードをそのまま通す
+- 応答の遅延・失敗率・壊れたJSONの率を設定でき、乱数シード固定で再現できる
+- まとめて生成するプロンプト（id 付きのリクエスト一覧）には results 形式で答え、
+  max_batch を超えるバッチは途中で切れた応答を返す（分割のフォールバックを通すため）
+- FakeDiscordServer はローカルの HTTP サーバーで /channels/{id}/messages を受け、任意の割合で 429 / 503 を返す。
+  enforce_nonce 付きの同じ nonce の再送はメッセージを増やさない
+- FakeWebServer はトレンドのURL確認（url_enricher）の相手。パスの接頭辞で 200 / リダイレクト / 404 / 遅延を返す
+- FakePerplexityServer は OpenAI 互換の POST /chat/completions を受け、相談の回答を SSE で少しずつ返す
+  （PERPLEXITY_API_BASE に api_base を指定して app.py / PerplexityClient を動かす）
+
+採用理由: 本物のAPIを呼ばずに、パイプライン全体の性能を繰り返し測れる
+"""
+
+import itertools
+import json
+import random
+import re
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Model:
+    def __init__(self, name, supported_generation_methods):
+        self.name = name
+        self.supported_generation_methods = supported_generation_methods
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenAI:
+    """google.generativeai の代わりに使う決定的なスタンドイン"""
+
+    def __init__(self, models=("gemini-3-flash", "gemini-2.5-pro", "gemini-2.5-flash"),
+                 latency=0.05, jitter=0.02, failure_rate=0.0, malformed_rate=0.0,
+                 list_latency=0.2, url_base=None, dead_link_rate=0.0, max_batch=None, seed=0):
+        """
+        Args:
+            models: list_models が返すモデル名
+            latency: 1回の生成にかかる平均秒数
+            jitter: latency に加える一様乱数の幅（秒）
+            failure_rate: 生成が例外（503）になる確率
+            malformed_rate: 壊れたJSONを返す確率
+            list_latency: list_models にかかる秒数
+            url_base: 指定するとアイテムのURLをこのベースURL配下（FakeWebServer）にする
+            dead_link_rate: url_base 指定時、リンク切れ（/dead-...）のURLにする確率
+            max_batch: まとめて生成するときに最後まで答えられるリクエスト数（超えると応答が途中で切れる）
+            seed: 乱数シード
+        """
+        self.models = list(models)
+        self.url_base = url_base
+        self.dead_link_rate = dead_link_rate
+        self.max_batch = max_batch
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.list_latency = list_latency
+        self.calls = {"list_models": 0, "generate_content": 0}
+        self._random = random.Random(seed)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name):
+                self.model_name = model_name
+
+            def generate_content(self, prompt, generation_config=None, stream=False):
+                return fake._generate(self.model_name, stream, prompt)
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerationConfig(self, **kwargs):
+        return kwargs
+
+    def list_models(self):
+        with self._lock:
+            self.calls["list_models"] += 1
+        time.sleep(self.list_latency)
+        return [_Model(f"models/{name}", ["generateContent"]) for name in self.models]
+
+    def _draw(self):
+        with self._lock:
+            self.calls["generate_content"] += 1
+            return (
+                self._random.random(),
+                self._random.random(),
+                self.latency + self._random.uniform(0, self.jitter),
+                next(self._counter),
+            )
+
+    def _generate(self, model_name, stream, prompt=""):
+        fail, malformed, delay, n = self._draw()
+        if fail < self.failure_rate:
+            time.sleep(delay)
+            raise RuntimeError("503 Service Unavailable (fake)")
+
+        ids = re.findall(r'- id: "([^"]+)"', prompt or "")
+        if ids:
+            results = [{"id": req_id, **json.loads(self.render(n * 1000 + i, model_name, self.url_base,
+                                                                self.dead_link_rate))}
+                       for i, req_id in enumerate(ids)]
+            text = json.dumps({"date": "2026-01-01", "results": results}, ensure_ascii=False)
+            if self.max_batch is not None and len(ids) > self.max_batch:
+                text = text[: len(text) // 2]  # 出力トークンの上限で切れた応答
+        else:
+            text = self.render(n, model_name, self.url_base, self.dead_link_rate)
+        if malformed < self.malformed_rate:
+            text = "申し訳ありません。" + text[: len(text) // 2]
+
+        if not stream:
+            time.sleep(delay)
+            return _Response(text)
+
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)]
+        def iterate():
+            for chunk in chunks:
+                time.sleep(delay / len(chunks))
+                yield _Chunk(chunk)
+        return iterate()
+
+    @staticmethod
+    def render(n, model_name="fake", url_base=None, dead_link_rate=0.0):
+        """n番目の応答（近似重複判定にも引っかからないよう、毎回ランダムなツール名）"""
+        pillars = ["【Alpha Trend】", "【Power Tip】", "【Hidden Gem】"]
+        rnd = random.Random(n)
+        names = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(6, 12))) for _ in pillars]
+
+        def url(name):
+            if not url_base:
+                return f"https://{name}.dev/"
+            return f"{url_base}/{'dead-' if rnd.random() < dead_link_rate else ''}{name}"
+
+        return json.dumps({
+            "date": "2026-01-01",
+            "trends": [
+                {
+                    "name": name.capitalize(),
+                    "description": f"{model_name} が生成したベンチマーク用のダミー説明文です。" * 3,
+                    "url": url(name),
+                    "buzz_factor": pillar,
+                }
+                for name, pillar in zip(names, pillars)
+            ],
+            "one_line_summary": "ベンチマーク用の要約",
+        }, ensure_ascii=False)
+
+
+class _LocalServer:
+    """127.0.0.1 の空きポートで動く HTTP サーバー（with で起動・停止）"""
+
+    def _serve(self, handler):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = None
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeDiscordServer(_LocalServer):
+    """Discord の POST /channels/{id}/messages を受けるローカル HTTP サーバー"""
+
+    def __init__(self, rate_limit_rate=0.0, retry_after=0.05, latency=0.0, error_rate=0.0, seed=0):
+        """
+        Args:
+            rate_limit_rate: 429 を返す確率
+            error_rate: 503（一時的な障害）を返す確率
+            retry_after: 429 のときに返す retry_after（秒）
+            latency: 応答までの遅延（秒）
+            seed: 乱数シード
+        """
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.latency = latency
+        self.error_rate = error_rate
+        self.messages = []
+        self.rate_limited = 0
+        self.errors = 0
+        self.duplicate_nonces = 0
+        self._nonces = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(server.latency)
+                message = json.loads(body or b"{}")
+                with server._lock:
+                    failed = server._random.random() < server.error_rate
+                    limited = not failed and server._random.random() < server.rate_limit_rate
+                    if failed:
+                        server.errors += 1
+                    elif limited:
+                        server.rate_limited += 1
+                    elif message.get("enforce_nonce") and message.get("nonce") in server._nonces:
+                        # 本物と同じく、同じ nonce の再送は新しいメッセージを作らない
+                        server.duplicate_nonces += 1
+                    else:
+                        server._nonces.add(message.get("nonce"))
+                        server.messages.append((self.path, message))
+                if failed:
+                    payload = b'{"message": "Service Unavailable", "code": 0}'
+                    self.send_response(503)
+                elif limited:
+                    payload = json.dumps({"retry_after": server.retry_after, "global": False}).encode()
+                    self.send_response(429)
+                else:
+                    payload = b'{"id": "1"}'
+                    self.send_response(200)
+                    self.send_header("X-RateLimit-Remaining", "4")
+                    self.send_header("X-RateLimit-Reset-After", "0.01")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._serve(Handler)
+
+
+class FakeWebServer(_LocalServer):
+    """
+    トレンドのURLの代わりに応答するローカル HTTP サーバー
+
+    /dead-... は 404、/moved-... は /... へ 301、/slow-... は slow_latency 秒待ってから 200、
+    それ以外は <title> と og:description、canonical を含む HTML を 200 で返す
+    """
+
+    def __init__(self, latency=0.0, slow_latency=2.0):
+        """
+        Args:
+            latency: 全リクエストに加える遅延（秒）
+            slow_latency: /slow-... の遅延（秒）
+        """
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                name = self.path.strip("/")
+                if name.startswith("dead-"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if name.startswith("moved-"):
+                    self.send_response(301)
+                    self.send_header("Location", f"/{name[len('moved-'):]}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if name.startswith("slow-"):
+                    time.sleep(server.slow_latency)
+                payload = (
+                    f"<!doctype html><html><head><meta charset='utf-8'><title>{name.capitalize()} - ツール</title>"
+                    f"<meta property='og:description' content='{name} のダミー説明'>"
+                    f"<link rel='canonical' href='/{name}'></head><body>{'x' * 4096}</body></html>"
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._serve(Handler)
+
+
+class FakePerplexityServer(_LocalServer):
+    """OpenAI 互換の POST /chat/completions（stream=True は SSE）を返すローカル HTTP サーバー"""
+
+    def __init__(self, chunk_size=40, chunk_delay=0.02, first_token_delay=0.3):
+        """
+        Args:
+            chunk_size: 1チャンクあたりの文字数
+            chunk_delay: チャンク間の遅延（秒）
+            first_token_delay: 最初のチャンクまでの遅延（秒）
+        """
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.first_token_delay = first_token_delay
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                goal = body.get("messages", [{}])[-1].get("content", "")
+                model = body.get("model", "fake")
+                text = FakePerplexityServer.render(goal)
+                time.sleep(server.first_token_delay)
+
+                if not body.get("stream"):
+                    payload = json.dumps({
+                        "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    }).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i in range(0, len(text), server.chunk_size):
+                    chunk = {
+                        "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": text[i:i + server.chunk_size]}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self._serve(Handler)
+
+    @staticmethod
+    def render(goal):
+        """相談内容に応じた決まった形の回答（JSON文字列）"""
+        topic = " ".join(goal.split()[:6]) or "your goal"
+        return json.dumps({
+            "summary_advice": f"{topic} は小さく自動化して効果を測りながら広げるのが近道です。",
+            "search_queries": [
+                {"query": f"{topic} automation tools 2026", "reason": "最新のツールを比較するため"},
+                {"query": f"{topic} best practices", "reason": "よくある落とし穴を避けるため"},
+                {"query": f"{topic} open source", "reason": "無料で試せる選択肢を探すため"},
+            ],
+            "recommendations": [
+                {"name": f"Fake Tool {n}", "type": "Tool", "description": f"{topic} を助けるダミーのツール {n}",
+                 "reason": "ベンチマーク用"}
+                for n in range(1, 5)
+            ],
+        }, ensure_ascii=False, indent=2)
@@ -0,0 +1,423 @@
+"""
+オフラインベンチマーク
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.run                     # 全ベンチマークを実行し、baseline.json があれば比較
+    python -m benchmarks.run --only pipeline     # パイプラインだけ
+    python -m benchmarks.run --only startup      # 起動時間（-X importtime）と「実行済み」での即終了だけ
+    python -m benchmarks.run --sizes 1000,100000 # 履歴のサイズを指定
+    python -m benchmarks.run --save-baseline     # 今回の結果を基準値として保存（実行環境も一緒に記録）
+
+計測対象:
+- pipeline: bot.main を FakeGenAI / FakeDiscordServer / FakeWebServer 相手にエンドツーエンドで実行
+  （遅延・失敗率・壊れたJSON率・リンク切れ率を設定可能）。
+  --cassette を指定すると FakeGenAI の代わりに `python bot.py --record` で記録した応答を --replay-speed 倍速で再生する
+- history: TrendHistory の load / is_duplicate / add_many / cleanup / find_similar（1k / 100k / 1M 件）
+- embed: bot.build_embed
+- enrich: url_enricher の初回確認とキャッシュ済みの2回目（FakeWebServer 相手）
+- startup: python 単体の起動、last_run.txt が今日付けのときの `python bot.py`（即終了パス）、
+  -X importtime で測った `import bot` / `import api_client` の累積インポート時間。
+  即終了パスがインタプリタ起動分を除いて --fast-exit-budget 秒を超えたら失敗として報告する
+
+各項目の p50 / p95 / p99 とスループットを表示し、基準値の p50 から tolerance 以上遅くなった項目を回帰として報告する
+（回帰があれば終了コード1）。
+基準値（benchmarks/baseline.json）には記録した環境（Python・OS・CPU数）と主な引数を "_environment" に残す。
+今回の環境と違えば比較の前に警告する（別のマシンの基準値は目安にしかならないので、自分の環境で --save-baseline し直す）
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fakes import FakeDiscordServer, FakeGenAI, FakeWebServer  # noqa: E402
+from cassette import ReplayGenAI  # noqa: E402
+
+
+def summarize(samples, ops_per_sample=1):
+    """秒単位のサンプルから p50/p95/p99 とスループットを求める"""
+    ordered = sorted(samples)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "mean": statistics.fmean(ordered),
+        "throughput": (len(ordered) * ops_per_sample / total) if total else float("inf"),
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextlib.contextmanager
+def workdir():
+    """設定ファイルをコピーした一時ディレクトリで実行する"""
+    previous = os.getcwd()
+    path = tempfile.mkdtemp(prefix="trendbot-bench-")
+    for name in ("known_tools.json", "bot_config.json"):
+        src = os.path.join(REPO_ROOT, name)
+        if os.path.exists(src):
+            shutil.copy(src, path)
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_pipeline(args):
+    """bot.main をスタンドイン相手に繰り返し実行する"""
+    import api_client
+    import bot
+
+    results = {}
+    scenarios = {
+        "pipeline.sequential": {"hedge_delay_sec": None, "stream_generation": False},
+        "pipeline.hedged": {"hedge_delay_sec": args.latency * 1.5, "stream_generation": False},
+        "pipeline.stream": {"hedge_delay_sec": None, "stream_generation": True},
+    }
+    original_genai = api_client.genai
+    for name, overrides in scenarios.items():
+        statuses = {}
+        try:
+            with workdir() as path, FakeDiscordServer(rate_limit_rate=args.rate_limit_rate, seed=args.seed) as discord, \
+                    FakeWebServer() as web:
+                if args.cassette:
+                    # 本番で記録した応答を再生する（URLは記録のまま。確認は実際のサイトに行く）
+                    fake = ReplayGenAI(os.path.join(REPO_ROOT, args.cassette), speed=args.replay_speed)
+                else:
+                    fake = FakeGenAI(latency=args.latency, failure_rate=args.failure_rate,
+                                     malformed_rate=args.malformed_rate, url_base=web.api_base,
+                                     dead_link_rate=args.dead_link_rate, seed=args.seed)
+                api_client.genai = fake
+                with open("bot_config.json", "r", encoding="utf-8") as f:
+                    config = json.load(f)
+                config.pop("profiles", None)
+                config.update(overrides)
+                # URL確認の相手は FakeWebServer。シナリオごとに別のキャッシュ（共有の UrlEnricher も別になる）
+                config["url_check"] = {**config.get("url_check", {}), "enabled": True,
+                                       "cache_path": os.path.join(path, "cache", "url_metadata.json")}
+                with open("bot_config.json", "w", encoding="utf-8") as f:
+                    json.dump(config, f, ensure_ascii=False)
+
+                os.environ.update({
+                    "GEMINI_API_KEY": "fake",
+                    "DISCORD_BOT_TOKEN": "fake",
+                    "DISCORD_CHANNEL_ID": "1",
+                    "DISCORD_API_BASE": discord.api_base,
+                    "TREND_BOT_NO_CACHE": "1",
+                })
+
+                samples = []
+                for _ in range(args.iterations):
+                    for leftover in os.listdir("."):
+                        if leftover.startswith("last_run"):
+                            os.remove(leftover)
+                    started = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        run = bot.main()
+                    samples.append(time.perf_counter() - started)
+                    for status in run.values():
+                        statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            api_client.genai = original_genai
+
+        results[name] = summarize(samples)
+        results[name]["statuses"] = statuses
+        results[name]["generate_calls"] = fake.calls["generate_content"]
+        results[name]["discord_messages"] = len(discord.messages)
+    return results
+
+
+def bench_enrich(args):
+    """url_enricher の初回（全URLを確認）とキャッシュ済みの2回目"""
+    from url_enricher import UrlEnricher
+
+    results = {}
+    rnd = random.Random(args.seed)
+    with workdir() as path, FakeWebServer(latency=0.01) as web:
+        def trends(n):
+            items = []
+            for i in range(args.enrich_urls):
+                kind = rnd.choice(["", "", "moved-", "dead-"])
+                items.append({"name": f"tool {n}-{i}", "url": f"{web.api_base}/{kind}tool{n}x{i}"})
+            return items
+
+        samples_cold, samples_warm = [], []
+        for n in range(args.enrich_rounds):
+            enricher = UrlEnricher(cache_path=os.path.join(path, f"urls-{n}.json"), budget_sec=args.enrich_budget)
+            batch = trends(n)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                enricher.enrich(batch)
+            samples_cold.append(time.perf_counter() - started)
+            requests_before = web.requests
+            started = time.perf_counter()
+            enricher.enrich(batch)
+            samples_warm.append(time.perf_counter() - started)
+            assert web.requests == requests_before, "cached URLs must not be fetched again"
+
+        results["enrich.cold"] = summarize(samples_cold, ops_per_sample=args.enrich_urls)
+        results["enrich.warm"] = summarize(samples_warm, ops_per_sample=args.enrich_urls)
+    return results
+
+
+def _write_journal(path, size, seed):
+    rnd = random.Random(seed)
+    now = datetime.now()
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(size):
+            name = "".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 12)))
+            entry = {
+                "name": f"{name} {i}",
+                "url": f"https://github.com/{name}/{i}",
+                "notified_at": (now - timedelta(minutes=i % 10000)).isoformat(),
+            }
+            f.write(json.dumps(entry) + "\n")
+
+
+def bench_history(args):
+    """TrendHistory の各操作を履歴サイズ別に計測する"""
+    from trend_history import TrendHistory
+
+    results = {}
+    for size in args.sizes:
+        with workdir():
+            path = "bench_history.jsonl"
+            _write_journal(path, size, args.seed)
+
+            def load():
+                return TrendHistory(path=path, retention_days=30, legacy_path=None)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[f"history.load.{size}"] = summarize(timed(load, 3))
+                history = load()
+
+                names = [f"missing tool {i}" for i in range(1000)]
+                results[f"history.is_duplicate.{size}"] = summarize(
+                    timed(lambda: [history.is_duplicate(n, "https://example.com/x") for n in names], 5),
+                    ops_per_sample=len(names),
+                )
+
+                counter = iter(range(10 ** 9))
+                def add():
+                    n = next(counter)
+                    history.add_many([(f"added {n}-{i}", f"https://example.com/{n}/{i}") for i in range(3)])
+                results[f"history.add_many.{size}"] = summarize(timed(add, 20))
+                results[f"history.cleanup.{size}"] = summarize(timed(history.cleanup, 3))
+
+                if size <= args.similarity_max_size:
+                    items = [{"name": "Ghostty terminal 1.1", "url": "https://ghostty.org"},
+                             {"name": "Zed editor", "url": ""},
+                             {"name": "uv python", "url": ""}]
+                    history._similarity = None
+                    results[f"history.find_similar.cold.{size}"] = summarize(timed(lambda: history.find_similar(items), 1))
+                    results[f"history.find_similar.warm.{size}"] = summarize(timed(lambda: history.find_similar(items), 20))
+    return results
+
+
+def bench_embed(args):
+    """Embed の組み立て"""
+    import bot
+
+    trends = json.loads(FakeGenAI.render(1))["trends"]
+    meta = {"model": "gemini-3-flash"}
+    batch = 1000
+    samples = timed(lambda: [bot.build_embed(trends, "summary", meta) for _ in range(batch)], 10)
+    return {"embed.build": summarize(samples, ops_per_sample=batch)}
+
+
+def _run_python(args, cwd, env=None):
+    """サブプロセスで python を起動し、(秒, stderr) を返す"""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True, check=True)
+    return time.perf_counter() - started, proc.stderr
+
+
+def _import_seconds(module, cwd):
+    """-X importtime の出力から module の累積インポート時間（秒）を取り出す"""
+    _, stderr = _run_python(["-X", "importtime", "-c", f"import {module}"], cwd)
+    for line in stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"importtime output for {module} not found")
+
+
+def bench_startup(args):
+    """コールドスタートの時間（毎回新しいインタプリタを起動する）"""
+    results = {}
+    with workdir() as path:
+        # 即終了パス: 今日はもう実行済み
+        with open("last_run.txt", "w", encoding="utf-8") as f:
+            f.write(datetime.now().strftime("%Y-%m-%d"))
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+        script = os.path.join(REPO_ROOT, "bot.py")
+
+        results["startup.interpreter"] = summarize([_run_python(["-c", "pass"], path, env)[0]
+                                                    for _ in range(args.startup_runs)])
+        results["startup.fast_exit"] = summarize([_run_python([script], path, env)[0]
+                                                  for _ in range(args.startup_runs)])
+        for module in ("bot", "api_client"):
+            results[f"startup.import.{module}"] = summarize([_import_seconds(module, REPO_ROOT)
+                                                             for _ in range(args.startup_runs)])
+    return results
+
+
+def check_fast_exit(results, budget):
+    """即終了パスのインタプリタ起動を除いた時間が予算を超えていれば (超過分の秒数) を返す"""
+    if "startup.fast_exit" not in results:
+        return None
+    overhead = results["startup.fast_exit"]["p50"] - results["startup.interpreter"]["p50"]
+    print(f"Fast-exit overhead over bare interpreter: {overhead * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+    return overhead if overhead > budget else None
+
+
+def environment(args):
+    """基準値と一緒に残す実行環境と、結果に効く引数"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "args": {k: getattr(args, k) for k in ("iterations", "latency", "failure_rate", "malformed_rate",
+                                               "rate_limit_rate", "dead_link_rate", "seed")},
+    }
+
+
+def environment_mismatch(recorded, current):
+    """基準値と今回で違う環境の項目（記録が無ければ空）"""
+    keys = ("python", "implementation", "platform", "machine", "cpu_count", "args")
+    return [k for k in keys if recorded and recorded.get(k) != current.get(k)]
+
+
+def compare(results, baseline, tolerance):
+    """基準値の p50 より tolerance 以上遅くなった項目を返す"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base and base.get("p50") and current["p50"] > base["p50"] * (1 + tolerance):
+            regressions.append((name, base["p50"], current["p50"]))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':<38} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>12}")
+    for name, r in results.items():
+        print(f"{name:<38} {r['n']:>5} {r['p50'] * 1000:>10.3f} {r['p95'] * 1000:>10.3f} "
+              f"{r['p99'] * 1000:>10.3f} {r['throughput']:>12.1f}")
+        extra = {k: v for k, v in r.items() if k in ("statuses", "generate_calls", "discord_messages")}
+        if extra:
+            print(f"{'':<38} {extra}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the trend bot pipeline.")
+    parser.add_argument("--only", choices=["pipeline", "history", "embed", "startup", "enrich"], action="append",
+                        help="実行するベンチマーク（複数指定可、省略時は全部）")
+    parser.add_argument("--iterations", type=int, default=20, help="パイプラインの実行回数")
+    parser.add_argument("--latency", type=float, default=0.05, help="フェイクGeminiの平均生成時間（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.1, help="フェイクDiscordが429を返す確率")
+    parser.add_argument("--cassette", help="pipeline で再生するカセット（cassette.py の記録。例: cassettes/gemini.jsonl）")
+    parser.add_argument("--replay-speed", type=float, default=10.0, help="カセットの待ち時間を何倍速で再生するか")
+    parser.add_argument("--dead-link-rate", type=float, default=0.1, help="フェイクGeminiがリンク切れのURLを返す確率")
+    parser.add_argument("--enrich-urls", type=int, default=30, help="URL確認の1回あたりのURL数")
+    parser.add_argument("--enrich-rounds", type=int, default=5)
+    parser.add_argument("--enrich-budget", type=float, default=8.0, help="URL確認の時間予算（秒）")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="履歴のサイズ（カンマ区切り）")
+    parser.add_argument("--similarity-max-size", type=int, default=100000,
+                        help="find_similar を計測する最大の履歴サイズ")
+    parser.add_argument("--startup-runs", type=int, default=10, help="起動時間を測るインタプリタの起動回数")
+    parser.add_argument("--fast-exit-budget", type=float, default=0.1,
+                        help="即終了パスに許す時間（秒、インタプリタ起動分を除く）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="p50 がこの割合以上遅くなったら回帰とみなす")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args(argv)
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    selected = args.only or ["pipeline", "history", "embed", "startup", "enrich"]
+    benches = {"pipeline": bench_pipeline, "history": bench_history, "embed": bench_embed,
+               "startup": bench_startup, "enrich": bench_enrich}
+    results = {}
+    for name in selected:
+        results.update(benches[name](args))
+
+    print_table(results)
+    over_budget = check_fast_exit(results, args.fast_exit_budget)
+    if over_budget is not None:
+        print(f"FAST-EXIT OVER BUDGET: {over_budget * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        if environment_mismatch(baseline.get("_environment"), environment(args)):
+            baseline = {}  # 別の環境の値と混ぜない
+        baseline.update(results)
+        baseline["_environment"] = environment(args)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        recorded = baseline.get("_environment")
+        mismatch = environment_mismatch(recorded, environment(args))
+        if not recorded or mismatch:
+            print(f"Warning: The baseline was recorded in a different environment "
+                  f"({', '.join(mismatch) or 'unknown'}: {recorded or 'not recorded'}). "
+                  f"Timings are only indicative. Re-run with --save-baseline on this machine.")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, current in regressions:
+            print(f"REGRESSION {name}: p50 {base * 1000:.3f} ms -> {current * 1000:.3f} ms")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 1 if over_budget is not None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,57 @@
 import os
 import sys
-from dotenv import load_dotenv
-from api_client import GeminiTrendClient
-from notifier import DiscordNotifier
-from trend_history import TrendHistory
+from contextlib import contextmanager
+from config_store import load_json, save_json
+import metrics
 import datetime
-import json
 
-# Load environment variables (.envファイルの値をシステム環境変数より優先)
-load_dotenv(override=True)
+# api_client（google.generativeai）・notifier（requests）・dotenv などの重い依存は、実際に実行するときに関数内で読み込む。
+# 「今日は実行済み」で終わる起動は、インタプリタの起動と設定ファイルの読み込みだけで抜けられる
+
+def load_env():
+    """Load environment variables (.envファイルの値をシステム環境変数より優先)"""
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
 
 CONFIG_FILE = "bot_config.json"
 
 def load_config():
-    try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            "search_category": "Dev Tools, PKM, Privacy Browsers, & Student Deals",
-            "target_languages": "TypeScript, PHP, AWS, Rust, Go, New AI Tools",
-            "excluded_keywords": ""
-        }
+    return load_json(CONFIG_FILE, {
+        "search_category": "Dev Tools, PKM, Privacy Browsers, & Student Deals",
+        "target_languages": "TypeScript, PHP, AWS, Rust, Go, New AI Tools",
+        "excluded_keywords": ""
+    })
+
+def load_profiles(config):
+    """
+    設定から実行するプロファイルの一覧を作る
+
+    profiles が無い場合はトップレベルの設定を "default" プロファイルとして扱う。
+    各プロファイルはトップレベルの値を既定値として継承し、name / channel_id / history_path などを上書きできる。
+    """
+    defaults = {k: v for k, v in config.items() if k != "profiles"}
+    profiles = []
+    for p in config.get("profiles") or [{"name": "default"}]:
+        profile = {**defaults, **p}
+        name = profile.setdefault("name", "default")
+        if name == "default":
+            profile.setdefault("history_path", "trend_history.jsonl")
+        else:
+            profile.setdefault("history_path", f"trend_history_{name}.jsonl")
+        profiles.append(profile)
+    return profiles
 
 LAST_RUN_FILE = "last_run.txt"
 
-def has_run_today():
+def _last_run_file(profile=None):
+    name = (profile or {}).get("name", "default")
+    return LAST_RUN_FILE if name == "default" else f"last_run_{name}.txt"
+
+def has_run_today(profile=None):
+    last_run_file = _last_run_file(profile)
     try:
-        if os.path.exists(LAST_RUN_FILE):
-            with open(LAST_RUN_FILE, "r", encoding="utf-8") as f:
+        if os.path.exists(last_run_file):
+            with open(last_run_file, "r", encoding="utf-8") as f:
                 last_run_date = f.read().strip()
             current_date = datetime.datetime.now().strftime('%Y-%m-%d')
             return last_run_date == current_date
@@ -36,76 +59,21 @@ def has_run_today():
         print(f"Warning: Could not check last run file: {e}")
     return False
 
-def mark_as_run_today():
+def mark_as_run_today(profile=None):
+    if cassette_options(profile or {}).get("mode") == "replay":
+        return  # 記録の再生は実行済みにしない（何度でも再生できるように）
     try:
         current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        with open(LAST_RUN_FILE, "w", encoding="utf-8") as f:
+        with open(_last_run_file(profile), "w", encoding="utf-8") as f:
             f.write(current_date)
     except Exception as e:
         print(f"Warning: Could not update last run file: {e}")
 
-def main():
-    print(f"--- Bot Started at {datetime.datetime.now()} ---")
-
-    if has_run_today():
-        print("Already run today. Exiting.")
-        return
-    
-    # Check keys
-    gemini_key = os.getenv("GEMINI_API_KEY")
-    discord_token = os.getenv("DISCORD_BOT_TOKEN")
-    discord_channel = os.getenv("DISCORD_CHANNEL_ID")
-    
-    if not gemini_key:
-        print("Error: GEMINI_API_KEY is missing.")
-        return
-
-    # Initialize agents
-    client = GeminiTrendClient(api_key=gemini_key)
-    notifier = DiscordNotifier(token=discord_token, channel_id=discord_channel)
-    history = TrendHistory()  # 履歴管理（7日間保持）
-
-    # 1. Search for Trends
-    print("Searching for Alpha trends...")
-    
-    # Load config
-    config = load_config()
-    category = config.get("search_category", "Dev Tools")
-    targets = config.get("target_languages", "")
-    
-    print(f"Category: {category}")
-    print(f"Targets: {targets}")
-    
-    result = client.get_daily_trends(category=category, target_languages=targets)
-    
-    if "error" in result:
-        error_detail = result['error']
-        print(f"API Error: {error_detail}")
-        # Discord通知用にメッセージを500文字に制限
-        short_msg = error_detail[:500] if len(error_detail) > 500 else error_detail
-        notifier.send(content=f"⚠️ Trend Bot Error: {short_msg}")
-        return
-
-    # 2. Filter Duplicates
-    print("Checking for duplicates...")
-    trends = result.get("trends", [])
-    if not trends:
-        print("No trends found.")
-        return
-
-    # 重複排除: 過去7日間に通知済みのツールを除外
-    new_trends = [t for t in trends if not history.is_duplicate(t['name'])]
-    
-    if not new_trends:
-        print("All trends are duplicates. Skipping notification.")
-        return
-    
-    print(f"Found {len(new_trends)} new trend(s) out of {len(trends)}.")
-
-    # 3. Format Message (Discord Embed)
+def build_embed(trends, summary, meta=None):
+    """Discord に送る Embed を組み立てる"""
+    meta = meta or {}
     date_str = datetime.datetime.now().strftime('%Y-%m-%d')
-    summary = result.get('one_line_summary', 'No summary provided.')
-    
+
     # Create Embed Structure
     embed = {
         "title": f"🚀 今日のテックトレンド ({date_str})",
@@ -113,42 +81,532 @@ def main():
         "color": 3066993, # Python Blue (or keep Teal)
         "fields": [],
         "footer": {
-            "text": "Powered by Gemini 1.5 Flash (Search Grounding)"
+            "text": f"Powered by {meta.get('model', 'Gemini')}"
         }
     }
 
-    for i, item in enumerate(new_trends, 1):
-        field_value = f"{item['description']}\n**話題性:** {item['buzz_factor']}\n[リンク]({item['url']})"
+    for i, item in enumerate(trends, 1):
+        # URL確認で取れたページのタイトルがあればリンクの文言にする
+        label = item.get("page_title", "").replace("[", "(").replace("]", ")")[:60] or "リンク"
+        field_value = f"{item['description']}\n**話題性:** {item['buzz_factor']}\n[{label}]({item['url']})"
         embed["fields"].append({
             "name": f"{i}. {item['name']}",
             "value": field_value,
             "inline": False
         })
-    
-    # 4. Notify
-    print("Sending notification...")
-    if discord_token and discord_channel:
-        success = notifier.send(embeds=[embed])
-        if success:
-            print("Notification sent successfully!")
-            # 5. 通知成功後、履歴に追加
-            for t in new_trends:
-                history.add(t['name'], t.get('url', ''))
-            print(f"Added {len(new_trends)} trend(s) to history.")
-            mark_as_run_today()
-        else:
-            print("Failed to send notification.")
+    return embed
+
+def open_history(profile):
+    """プロファイルの履歴を開く（プロファイルごとに別ファイル、7日間保持）"""
+    from trend_history import TrendHistory
+    return TrendHistory(
+        path=profile["history_path"],
+        legacy_path="trend_history.json" if profile["name"] == "default" else None,
+    )
+
+def open_reserve(profile):
+    """プロファイルの余り候補のストック（検索カテゴリ・ターゲットが変わったら捨てる）"""
+    from candidate_pool import ReserveQueue
+    context = [profile.get("search_category", "Dev Tools"), profile.get("target_languages", "")]
+    return ReserveQueue(profile["name"], context=context, ttl_days=profile.get("reserve_ttl_days", 3))
+
+def open_outbox(profile):
+    """通知の送信待ちキュー（全プロファイルで1つのディレクトリを共有し、エントリにプロファイル名を持つ）"""
+    from outbox import Outbox
+    return Outbox(**{k: v for k, v in profile.get("outbox", {}).items() if k != "retry_window_sec"})
+
+def _today():
+    return datetime.datetime.now().strftime('%Y-%m-%d')
+
+def _deliver(outbox, entry, profile, history, transport, log):
+    """送信待ちのエントリを送り、送れたら履歴に追加する（その日の分なら実行済みにする）"""
+    def on_delivered(entry):
+        history.add_many(entry["trends"])
+        metrics.profile(profile["name"], delivered=[t['name'] for t in entry["trends"]])
+        log(f"Added {len(entry['trends'])} trend(s) to history.")
+        if entry["date"] == _today():
+            mark_as_run_today(profile)
+
+    with metrics.span("profile.notify", profile=profile["name"]):
+        delivered = outbox.deliver(entry, transport, on_delivered)
+    if delivered:
+        log("Notification sent successfully!")
     else:
-        print("No Discord credentials set. Printing to console:")
-        print(f"Title: {embed['title']}")
-        print(f"Summary: {embed['description']}")
-        for f in embed['fields']:
-            print(f"- {f['name']}: {f['value']}")
-        # コンソール出力時も履歴に追加
-        for t in new_trends:
-            history.add(t['name'], t.get('url', ''))
-        print(f"Added {len(new_trends)} trend(s) to history.")
-        mark_as_run_today()
+        log("Failed to send notification. Kept in the outbox for retry.")
+    return delivered
+
+def run_profile(profile, client, discord_token, transport=None, history=None, prefetched=None):
+    """
+    1プロファイル分のパイプライン（検索 → 重複排除 → 通知 → 履歴追加）を実行する
+
+    Args:
+        history: 使い回す TrendHistory（省略時はファイルから読み込む）
+        prefetched: まとめて生成済みの結果（get_daily_trends の戻り値の形）。失敗していれば単独で生成し直す
+
+    Returns:
+        結果を表す文字列（"sent" / "printed" / "duplicates" / "dead_links" / "no_trends" / "api_error" / "queued"）。
+        "queued" は通知が送れず送信待ちに残ったことを表す（次回は生成せずに再送する）
+    """
+    name = profile["name"]
+    with metrics.span("profile.total", profile=name):
+        status = _run_profile(profile, client, discord_token, transport, history, prefetched)
+    metrics.profile(name, status=status)
+    return status
+
+def _screen(candidates, profile, history, log):
+    """
+    候補をフィルタ・重複排除・URL確認に通す
+
+    Args:
+        candidates: candidate_pool の候補（{"item", ...}）のリスト
+
+    Returns:
+        (残った候補, 各段階で落ちた件数)
+    """
+    from filter_engine import get_filter
+
+    name = profile["name"]
+    counts = {"filtered": 0, "exact_duplicates": 0, "near_duplicates": 0, "dead_links": 0}
+
+    # 既知ツール・除外キーワードをローカルで除外
+    with metrics.span("profile.filter", profile=name):
+        trend_filter = get_filter(profile.get("excluded_keywords", ""))
+        kept = []
+        for c in candidates:
+            reason = trend_filter.check(c["item"])
+            if reason:
+                log(f"Filtered: '{c['item']['name']}' ({reason})")
+                counts["filtered"] += 1
+            else:
+                kept.append(c)
+
+    with metrics.span("profile.dedup", profile=name):
+        # 重複排除: 過去7日間に通知済みのツールを除外
+        new = [c for c in kept if not history.is_duplicate(c["item"]["name"], c["item"].get("url", ""))]
+        counts["exact_duplicates"] = len(kept) - len(new)
+
+        # 近似重複: 表記ゆれ（"Ghostty" / "Ghostty terminal 1.1" など）もまとめて除外。類似度はスコアにも使う
+        threshold = profile.get("similarity_threshold", 0.8)
+        if new and threshold:
+            matches = history.find_similar([c["item"] for c in new], threshold=threshold)
+            kept = []
+            for c, (entry, similarity) in zip(new, matches):
+                if entry:
+                    log(f"Near-duplicate: '{c['item']['name']}' ~ '{entry['name']}' (score={similarity:.2f})")
+                else:
+                    c["novelty"] = 1.0 - similarity
+                    kept.append(c)
+            counts["near_duplicates"] = len(new) - len(kept)
+            new = kept
+
+    # リンク切れを除外し、リダイレクト先の正規URLとページのタイトルで補う（url_check.enabled: true のときだけ）
+    url_check = profile.get("url_check", {})
+    if new and url_check.get("enabled", False):
+        from url_enricher import get_enricher
+        items, dead = get_enricher(url_check).enrich([c["item"] for c in new])
+        for item, reason in dead:
+            log(f"Dropped: '{item['name']}' ({reason})")
+        counts["dead_links"] = len(dead)
+        alive = {i["name"]: i for i in items}
+        new = [{**c, "item": alive[c["item"]["name"]]} for c in new if c["item"]["name"] in alive]
+    return new, counts
+
+def _run_profile(profile, client, discord_token, transport, history, prefetched):
+    from notifier import DiscordNotifier
+    from candidate_pool import covers_all_pillars, pillar_of, select
+
+    name = profile["name"]
+
+    def log(msg):
+        print(f"[{name}] {msg}")
+
+    discord_channel = profile.get("channel_id") or os.getenv("DISCORD_CHANNEL_ID")
+    notifier = DiscordNotifier(token=discord_token, channel_id=discord_channel, transport=transport)
+    if history is None:
+        history = open_history(profile)
+    metrics.profile(name, history_size=len(history.history))
+
+    # 0. 送れていない通知があれば、生成より先に再送する（今日の分があれば生成しない）
+    outbox = open_outbox(profile)
+    queued = outbox.pending(profile=name)
+    if queued and discord_token:
+        log(f"Retrying {len(queued)} queued notification(s)...")
+        delivered = [_deliver(outbox, entry, profile, history, notifier.transport, log) for entry in queued]
+        if any(entry["date"] == _today() for entry in queued):
+            return "sent" if all(delivered) else "queued"
+
+    category = profile.get("search_category", "Dev Tools")
+    targets = profile.get("target_languages", "")
+
+    # 1. 前回までの余り候補（ストック）を先に確認し、全部の柱が埋まるならAPIを呼ばない
+    reserve = open_reserve(profile)
+    reserved, _ = _screen(reserve.load(), profile, history, log)
+    if reserved:
+        log(f"Reserve: {len(reserved)} usable candidate(s).")
+
+    result, meta = {}, {"model": "Gemini (reserve)", "mode": "reserve"}
+    if covers_all_pillars(reserved):
+        log("Every pillar is covered by the reserve. Skipping the API call.")
+        candidates = reserved
+        counts = {}
+    else:
+        # 2. Search for Trends
+        log("Searching for Alpha trends...")
+        log(f"Category: {category}")
+        log(f"Targets: {targets}")
+
+        def on_trend(model_name, item):
+            # ストリーミング中に届いたアイテムを、生成完了を待たずに既存履歴と突き合わせておく
+            seen = " (already notified)" if history.is_duplicate(item['name'], item.get('url', '')) else ""
+            log(f"Streamed from {model_name}: {item['name']}{seen}")
+
+        if prefetched and "error" not in prefetched:
+            result = prefetched
+        else:
+            with metrics.span("profile.generate", profile=name):
+                result = client.get_daily_trends(category=category, target_languages=targets, on_trend=on_trend)
+
+        if "error" in result:
+            error_detail = result['error']
+            log(f"API Error: {error_detail}")
+            # Discord通知用にメッセージを500文字に制限
+            short_msg = error_detail[:500] if len(error_detail) > 500 else error_detail
+            notifier.send(content=f"⚠️ Trend Bot Error ({name}): {short_msg}")
+            return "api_error"
+
+        meta = result.get("meta", {})
+        if meta:
+            log(f"Model: {meta['model']} ({meta['mode']}, {meta['elapsed_sec']}s, {len(meta['attempts'])} attempt(s))")
+            prompt = meta["prompt"]
+            log(f"Prompt: ~{prompt['tokens']} tokens, {prompt['known_tools_sent']}/{prompt['known_tools_total']} known tools sent")
+            metrics.profile(name, model=meta["model"], mode=meta["mode"], generate_sec=meta["elapsed_sec"],
+                            attempts=meta["attempts"], prompt=prompt)
+
+        trends = result.get("trends", [])
+        if not trends and not reserved:
+            log("No trends found.")
+            client.discard_cached(result)
+            return "no_trends"
+
+        # 3. Filter / Dedup / Check URLs（柱の中での提示順をスコアに使う）
+        log("Checking for duplicates...")
+        fresh, ranks = [], {}
+        reserved_names = {c["item"]["name"].lower() for c in reserved}
+        for item in trends:
+            if item["name"].lower() in reserved_names:
+                continue
+            pillar = pillar_of(item)
+            fresh.append({"item": item, "rank": ranks.get(pillar, 0)})
+            ranks[pillar] = ranks.get(pillar, 0) + 1
+        fresh, counts = _screen(fresh, profile, history, log)
+        candidates = reserved + fresh
+        metrics.profile(name, trends=len(trends), new_trends=len(fresh), **counts)
+
+    if not candidates:
+        reserve.save([])  # 使えなくなったストックも片付ける
+        # 使い終えた応答はキャッシュから消す（残すと同じ日の再実行も同じ重複だけを受け取る）
+        client.discard_cached(result)
+        if counts.get("dead_links"):
+            log("All new trends have dead links. Skipping notification.")
+            return "dead_links"
+        log("All trends are duplicates. Skipping notification.")
+        return "duplicates"
+
+    # 4. 柱ごとに最良の候補を選び、残りはストックへ
+    with metrics.span("profile.select", profile=name):
+        chosen, leftovers = select(candidates)
+    new_trends = [c["item"] for c in chosen]
+    from_reserve = sum(1 for c in chosen if "added_at" in c)
+    log(f"Selected {len(new_trends)} trend(s) from {len(candidates)} candidate(s) "
+        f"({from_reserve} from reserve, {len(leftovers)} left in reserve).")
+    metrics.profile(name, candidates=len(candidates), from_reserve=from_reserve, reserve_left=len(leftovers))
+
+    # モデルの要約は選んだ候補と食い違うことがあるため、選んだものがそのまま応答と同じときだけ使う
+    # （柱ごとに多めに出してもらうときは、プロンプトで要約を求めていない）
+    summary = result.get("one_line_summary")
+    if not summary or [t["name"] for t in new_trends] != [t["name"] for t in result.get("trends", [])]:
+        summary = " / ".join(f"{pillar_of(t)}: {t['name']}" for t in new_trends)
+
+    # 5. Format Message (Discord Embed)
+    with metrics.span("profile.embed", profile=name):
+        embed = build_embed(new_trends, summary, meta)
+
+    # 6. Notify（送る前に送信待ちに書き出し、送れたときだけ履歴に追加する）
+    log("Sending notification...")
+    if discord_token and discord_channel:
+        entry = outbox.enqueue(name, discord_channel, {"embeds": [embed]}, new_trends)
+        # 選んだ候補は送信待ちが、余りはストックが持つため、応答のキャッシュはもう要らない
+        reserve.save(leftovers)
+        client.discard_cached(result)
+        if not _deliver(outbox, entry, profile, history, notifier.transport, log):
+            return "queued"
+        return "sent"
+
+    log("No Discord credentials set. Printing to console:")
+    lines = [f"Title: {embed['title']}", f"Summary: {embed['description']}"]
+    lines += [f"- {f['name']}: {f['value']}" for f in embed['fields']]
+    print("\n".join(f"[{name}] {line}" for line in lines))
+
+    # 7. コンソール出力時も履歴にまとめて追加（追記1回）し、余りをストックする
+    history.add_many(new_trends)
+    reserve.save(leftovers)
+    client.discard_cached(result)
+    metrics.profile(name, delivered=[t['name'] for t in new_trends])
+    log(f"Added {len(new_trends)} trend(s) to history.")
+    mark_as_run_today(profile)
+    return "printed"
+
+def retry_outbox(profiles, transport, histories=None, wait_sec=0):
+    """
+    再送の時刻が来た送信待ちを送る（wait_sec 秒の間は、次の再送時刻まで待って繰り返す）
+
+    Args:
+        profiles: 実行中の設定のプロファイル（送信待ちのプロファイル名から引く）
+        histories: プロファイル名 -> 使い回す TrendHistory
+        wait_sec: 再送を待つ最大秒数（0 なら時刻の来たものを1回送るだけ）
+
+    Returns:
+        プロファイル名 -> "sent" / "queued"
+    """
+    import time
+
+    if not profiles:
+        return {}
+    histories = histories or {}
+    by_name = {p["name"]: p for p in profiles}
+    outbox = open_outbox(profiles[0])
+    deadline = time.time() + wait_sec
+    results = {}
+    while True:
+        for entry in outbox.pending(due_only=True):
+            profile = by_name.get(entry["profile"])
+            if profile is None:
+                continue  # 設定から消えたプロファイルの分は残しておく
+            history = histories.get(profile["name"]) or open_history(profile)
+            log = lambda msg, n=profile["name"]: print(f"[{n}] {msg}")
+            delivered = _deliver(outbox, entry, profile, history, transport, log)
+            results[profile["name"]] = "sent" if delivered else "queued"
+            metrics.profile(profile["name"], status=results[profile["name"]])
+
+        next_due = outbox.next_due()
+        if next_due is None or next_due > deadline:
+            return results
+        time.sleep(max(0.0, next_due - time.time()))
+
+def create_response_cache(config):
+    """生成結果キャッシュ（--no-cache または環境変数 TREND_BOT_NO_CACHE=1 でバイパス）"""
+    from response_cache import ResponseCache
+    cache_config = config.get("response_cache", {})
+    return ResponseCache(
+        ttl=cache_config.get("ttl_sec", 12 * 60 * 60),
+        max_entries=cache_config.get("max_entries", 200),
+        enabled=not ("--no-cache" in sys.argv or os.getenv("TREND_BOT_NO_CACHE") == "1"),
+    )
+
+def client_options(config):
+    """
+    設定から GeminiTrendClient の引数を作る（常駐モードでは変化の検知にも使う）
+
+    hedge_delay_sec は既定で無効（null / 0 ならモデルを順番に試す）。有効にするには "hedge_delay_sec": 10 のように
+    秒数を指定する。その秒数で応答が無ければ次のモデルも並行で呼ぶため、速くなる代わりに呼び出し回数とクォータを多く使う
+    （同時に走らせる数は hedge_max_parallel）
+    """
+    from api_client import MODEL_CATALOG_TTL
+    return {
+        "catalog_ttl": config.get("model_catalog_ttl_sec", MODEL_CATALOG_TTL),
+        "hedge_delay": config.get("hedge_delay_sec") or None,
+        "hedge_max": config.get("hedge_max_parallel", 2),
+        "prompt_budget": config.get("prompt_token_budget", 2000),
+        "stream": config.get("stream_generation", False),
+        "candidates_per_pillar": config.get("candidates_per_pillar", 1),
+        "router_options": config.get("model_router"),
+        "cassette": cassette_options(config),
+    }
+
+def cassette_options(config):
+    """Gemini 呼び出しの記録・再生の設定（--record / --replay で bot_config.json の cassette.mode を上書き）"""
+    options = dict(config.get("cassette") or {})
+    if "--record" in sys.argv:
+        options["mode"] = "record"
+    elif "--replay" in sys.argv:
+        options["mode"] = "replay"
+    return options
+
+def _without_state_paths(settings):
+    """設定から状態ファイルの置き場所の指定を外す（再生の一時ディレクトリの外を指さないように）"""
+    settings = {k: v for k, v in settings.items() if k not in ("history_path", "metrics_file")}
+    for section, key in (("outbox", "directory"), ("url_check", "cache_path")):
+        if isinstance(settings.get(section), dict):
+            settings[section] = {k: v for k, v in settings[section].items() if k != key}
+    return settings
+
+@contextmanager
+def replay_sandbox(config):
+    """
+    記録の再生（--replay）を一時ディレクトリの中で行う
+
+    履歴・実行済みの日付・送信待ち・ストック・URLキャッシュ・metrics.jsonl はどれもカレントディレクトリからの
+    相対パスなので、設定と既知ツールだけを置いた一時ディレクトリに移って実行すれば本番の状態ファイルに触れない。
+    抜けるときに元のディレクトリに戻り、一時ディレクトリは消す。再生でなければ何もしない
+
+    Yields:
+        再生なら一時ディレクトリ用に書き換えた設定（カセットは元の場所を絶対パスで指す）、そうでなければ None
+    """
+    import shutil
+    import tempfile
+    from cassette import CASSETTE_FILE
+    from filter_engine import KNOWN_TOOLS_FILE
+
+    options = cassette_options(config)
+    if options.get("mode") != "replay":
+        yield None
+        return
+
+    config = _without_state_paths(config)
+    if config.get("profiles"):
+        config["profiles"] = [_without_state_paths(p) for p in config["profiles"]]
+    config["cassette"] = {**options, "path": os.path.abspath(options.get("path") or CASSETTE_FILE)}
+
+    previous = os.getcwd()
+    sandbox = tempfile.mkdtemp(prefix="trend_bot_replay_")
+    if os.path.exists(KNOWN_TOOLS_FILE):
+        shutil.copy(KNOWN_TOOLS_FILE, sandbox)
+    os.chdir(sandbox)
+    try:
+        save_json(CONFIG_FILE, config)
+        print(f"Replay: running in {sandbox} (Discord is not called and state files are left untouched).")
+        yield config
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+def create_client(config, gemini_key, response_cache=None):
+    from api_client import GeminiTrendClient
+    return GeminiTrendClient(api_key=gemini_key, response_cache=response_cache, **client_options(config))
+
+def prefetch_trends(profiles, config, client):
+    """
+    複数プロファイルの生成を1回の呼び出しにまとめて先に済ませる（batch_generation が有効なとき）
+
+    ストックだけで全部の柱が埋まるプロファイルと、今日の通知が送信待ちに残っている（再送だけで済む）プロファイルは対象外。
+
+    Returns:
+        プロファイル名 -> 生成結果
+    """
+    from candidate_pool import covers_all_pillars
+
+    if not config.get("batch_generation") or len(profiles) < 2:
+        return {}
+    today = _today()
+    targets = [p for p in profiles
+               if not covers_all_pillars(open_reserve(p).load())
+               and not any(e["date"] == today for e in open_outbox(p).pending(profile=p["name"]))]
+    if len(targets) < 2:
+        return {}
+
+    print(f"Generating {len(targets)} profile(s) in batches of {config.get('batch_size', 4)}...")
+    requests = [(p.get("search_category", "Dev Tools"), p.get("target_languages", "")) for p in targets]
+    with metrics.span("bot.prefetch", profiles=len(targets)):
+        results = client.get_daily_trends_batch(requests, batch_size=config.get("batch_size", 4))
+    return {p["name"]: result for p, result in zip(targets, results)}
+
+def run_profiles(profiles, config, client, discord_token, transport, histories=None):
+    """
+    プロファイルごとの実行を有限サイズのスレッドプールで並行させる
+
+    Args:
+        histories: プロファイル名 -> 使い回す TrendHistory（省略時は毎回ファイルから読み込む）
+
+    Returns:
+        プロファイル名 -> 結果の文字列
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    histories = histories or {}
+    prefetched = prefetch_trends(profiles, config, client)
+    results = {}
+    max_workers = max(1, min(config.get("max_parallel_profiles", 4), len(profiles)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="profile") as pool:
+        futures = {
+            p["name"]: pool.submit(metrics.profiled(run_profile), p, client, discord_token, transport,
+                                   histories.get(p["name"]), prefetched.get(p["name"]))
+            for p in profiles
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"[{name}] Error: {e}")
+                results[name] = f"failed: {e}"
+                metrics.profile(name, status="failed", error=str(e)[:300])
+    return results
+
+def main():
+    print(f"--- Bot Started at {datetime.datetime.now()} ---")
+
+    # Load config（--replay なら一時ディレクトリの中で、その中の設定で実行する）
+    config = load_config()
+    with replay_sandbox(config) as replay_config:
+        return _main(replay_config or config, replaying=replay_config is not None)
+
+def _main(config, replaying):
+    # 記録の再生は実行済みの日付を見ない（一時ディレクトリには何も残らない）
+    profiles = [p for p in load_profiles(config) if replaying or not has_run_today(p)]
+
+    if not profiles:
+        print("Already run today. Exiting.")
+        return {}
+
+    load_env()
+
+    # Check keys
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    discord_token = os.getenv("DISCORD_BOT_TOKEN")
+
+    # 記録の再生ではAPIを呼ばないためキーは不要。通知は送信待ちまで本番と同じ経路を通し、コンソールに出す
+    if replaying:
+        discord_token = "replay"
+    elif not gemini_key:
+        print("Error: GEMINI_API_KEY is missing.")
+        return {}
+
+    from notifier import ConsoleTransport, DiscordTransport
+
+    # 計測開始（TREND_BOT_PROFILE=1 なら cProfile / tracemalloc も有効）
+    metrics.start_run()
+
+    with metrics.span("bot.init"):
+        # 生成結果キャッシュ（--no-cache または環境変数 TREND_BOT_NO_CACHE=1 でバイパス）
+        response_cache = create_response_cache(config)
+
+        # Initialize agents（Geminiクライアントとモデル一覧は全プロファイルで共有）
+        client = create_client(config, gemini_key, response_cache)
+
+        # Discordへの接続プールとレート制限の状態も全プロファイルで共有
+        transport = ConsoleTransport() if replaying else DiscordTransport(token=discord_token)
+
+    # --refresh-models: モデル一覧のキャッシュを無視して取り直す
+    with metrics.span("bot.models"):
+        client.get_available_models(force_refresh="--refresh-models" in sys.argv)
+
+    results = run_profiles(profiles, config, client, discord_token, transport)
+
+    # 送れなかった通知は、少しの間だけバックオフしながら再送する（残りは次回の実行で送る）
+    if "queued" in results.values():
+        wait_sec = config.get("outbox", {}).get("retry_window_sec", 120)
+        print(f"Retrying queued notifications for up to {wait_sec}s...")
+        results.update(retry_outbox(load_profiles(config), transport, wait_sec=wait_sec))
+
+    print("--- Summary ---")
+    for name, status in results.items():
+        print(f"{name}: {status}")
+    stats = response_cache.stats()
+    print(f"Response cache: {stats['hits']} hit(s), {stats['misses']} miss(es)")
+
+    metrics.set_value("response_cache", stats)
+    record = metrics.finish_run(config.get("metrics_file", metrics.METRICS_FILE))
+    print(f"Run {record['run_id']} took {record['duration_sec']:.2f}s (metrics: {config.get('metrics_file', metrics.METRICS_FILE)})")
+    return results
 
 if __name__ == "__main__":
     main()
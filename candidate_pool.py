@@ -0,0 +1,128 @@
+"""
+候補の多めの生成・ローカルでの選抜・ストック（予備キュー）
+
+処理の肝:
+- Gemini には柱（Alpha Trend / Power Tip / Hidden Gem）ごとに candidates_per_pillar 件の候補を出してもらい、
+  フィルタ・重複排除・URL確認を通った候補をローカルでスコアリングして、柱ごとに最良の1件を選ぶ
+- 選ばれなかった候補はプロファイルごとのストック（cache/reserve_<name>.json）に積み、
+  次回の実行ではまずストックから選ぶ。全部の柱がストックで埋まればAPIを呼ばない
+- ストックは検索カテゴリ・ターゲットが変わったら捨て、ttl_days を過ぎた候補も捨てる
+
+採用理由: 「全部通知済みだった」で1回のAPI呼び出しが丸ごと無駄になるのを防ぎ、1回の呼び出しあたりの配信数を増やす
+注意点: スコアは軽いヒューリスティック（モデルの提示順・履歴との近さ・リンクの確認結果・説明文の長さ・ストックの古さ）
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from config_store import load_json, save_json
+
+PILLARS = ("Alpha Trend", "Power Tip", "Hidden Gem")
+OTHER = "Other"
+RESERVE_DIR = "cache"
+
+
+def pillar_of(item):
+    """buzz_factor から柱を判定する（どれにも当たらなければ "Other"）"""
+    buzz = item.get("buzz_factor", "")
+    return next((p for p in PILLARS if p in buzz), OTHER)
+
+
+def score(candidate):
+    """
+    候補のスコア（大きいほど良い）
+
+    Args:
+        candidate: {"item", "rank"（柱の中でのモデルの提示順）, "novelty"（1 - 履歴との類似度）, "age_days"}
+    """
+    item = candidate["item"]
+    value = 1.0 / (1 + candidate.get("rank", 0))
+    value += candidate.get("novelty", 1.0)
+    if item.get("page_title"):
+        value += 0.5  # URL確認でページの中身まで取れた
+    if 40 <= len(item.get("description", "")) <= 400:
+        value += 0.25
+    value -= 0.1 * candidate.get("age_days", 0)
+    return value
+
+
+def select(candidates, per_pillar=1):
+    """
+    柱ごとに上位 per_pillar 件を選ぶ（柱が埋まらなければ "Other" から補う）
+
+    Returns:
+        (選んだ候補, 選ばなかった候補)
+    """
+    ranked = sorted(candidates, key=score, reverse=True)
+    chosen, counts = [], {}
+    for c in ranked:
+        pillar = pillar_of(c["item"])
+        if pillar != OTHER and counts.get(pillar, 0) < per_pillar:
+            chosen.append(c)
+            counts[pillar] = counts.get(pillar, 0) + 1
+
+    missing = len(PILLARS) * per_pillar - len(chosen)
+    for c in ranked:
+        if missing <= 0:
+            break
+        if pillar_of(c["item"]) == OTHER:
+            chosen.append(c)
+            missing -= 1
+
+    chosen_ids = {id(c) for c in chosen}
+    # 通知の並びは柱の順にそろえる
+    order = {p: i for i, p in enumerate(PILLARS)}
+    chosen.sort(key=lambda c: order.get(pillar_of(c["item"]), len(PILLARS)))
+    return chosen, [c for c in ranked if id(c) not in chosen_ids]
+
+
+def covers_all_pillars(candidates):
+    return set(PILLARS) <= {pillar_of(c["item"]) for c in candidates}
+
+
+class ReserveQueue:
+    def __init__(self, profile_name, context, ttl_days=3, max_items=30, directory=RESERVE_DIR):
+        """
+        Args:
+            profile_name: プロファイル名（ファイル名に使う）
+            context: 候補を作った条件（検索カテゴリ・ターゲット）。変わったらストックを捨てる
+            ttl_days: ストックの有効日数
+            max_items: ストックする最大件数（スコアの低い順に捨てる）
+            directory: 保存先
+        """
+        self.path = os.path.join(directory, f"reserve_{profile_name}.json")
+        self.context = context
+        self.ttl_days = ttl_days
+        self.max_items = max_items
+
+    def load(self):
+        """有効なストックを候補の形（{"item", "rank", "age_days"}）で返す"""
+        data = load_json(self.path, {})
+        if data.get("context") != self.context:
+            return []
+        now = datetime.now()
+        candidates = []
+        for entry in data.get("items", []):
+            try:
+                age = now - datetime.fromisoformat(entry["added_at"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if age <= timedelta(days=self.ttl_days):
+                candidates.append({
+                    "item": entry["item"],
+                    "rank": entry.get("rank", 0),
+                    "age_days": age.total_seconds() / 86400,
+                    "added_at": entry["added_at"],
+                })
+        return candidates
+
+    def save(self, candidates):
+        """ストックを候補の一覧で置き換える"""
+        now = datetime.now().isoformat()
+        ranked = sorted(candidates, key=score, reverse=True)[:self.max_items]
+        items = [{"item": c["item"], "rank": c.get("rank", 0), "added_at": c.get("added_at", now)} for c in ranked]
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            save_json(self.path, {"context": self.context, "items": items}, indent=2)
+        except IOError as e:
+            print(f"Warning: Failed to save reserve queue: {e}")
@@ -0,0 +1,312 @@
+"""
+Gemini 呼び出しの記録と再生（カセット）
+
+使い方:
+    python bot.py --record            # 本物のAPIを呼び、cassettes/gemini.jsonl に記録する
+    python bot.py --replay            # 記録した応答を返す（SDKは読み込まない・APIキー不要・応答キャッシュは使わない）
+                                      # 一時ディレクトリの中で実行し、通知はコンソールに出す（本番の履歴・状態ファイルと Discord に触れない）
+    bot_config.json の cassette: {"mode": "replay", "path": "...", "speed": 10} でも指定できる
+    記録するプロンプトは既定で全文。cassette.prompt_chars を指定するとその文字数で切る（切ったら prompt_truncated: true）
+
+処理の肝:
+- RecordingGenAI は google.generativeai をそのまま包み、list_models の結果と、generate_content ごとの
+  モデル名・プロンプト（SHA-256 と全文）・生の応答テキスト（ストリーミングならチャンクと到着時刻）・
+  トークン数・所要時間・例外を1行1件の JSONL に追記する
+- ReplayGenAI は google.generativeai と同じ形（configure / list_models / GenerativeModel / GenerationConfig）で、
+  (モデル名, プロンプト) が一致する記録 → 同じモデル・同じ種類（単独 / まとめて生成）の記録 → 同じ種類の記録 の順に探して返す。
+  記録された待ち時間を speed 倍速で再現し、記録された例外は同じメッセージで投げ直す
+- 一致しない記録は順番に使い回すため、記録より多く呼んでも止まらない
+
+採用理由: 本番と同じ形の応答で、クォータを使わず・ネットワークを待たずに bot.main やダッシュボードを繰り返し動かせる
+注意点: カセットには生成結果とプロンプトがそのまま入る（cassettes/ は .gitignore 済み）。APIキーは記録しない。
+        プロンプトを切って記録しても、再生の照合は切る前の全文の SHA-256 で行う
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+
+CASSETTE_FILE = os.path.join("cassettes", "gemini.jsonl")
+
+
+def _prompt_sha(prompt):
+    return hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()
+
+
+def _prompt_kind(prompt):
+    # まとめて生成するプロンプトはリクエストごとに id を持つ（prompt_builder.build_batch）
+    return "batch" if '- id: "' in str(prompt) else "single"
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    return {
+        "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+        "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0,
+    }
+
+
+class _Model:
+    def __init__(self, name, supported_generation_methods):
+        self.name = name
+        self.supported_generation_methods = supported_generation_methods
+
+
+class _Usage:
+    def __init__(self, usage):
+        self.prompt_token_count = usage.get("prompt_token_count", 0)
+        self.candidates_token_count = usage.get("candidates_token_count", 0)
+
+
+class _Chunk:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = _Usage(usage) if usage else None
+
+
+class ReplayError(RuntimeError):
+    """記録された例外の再生"""
+
+
+class RecordingGenAI:
+    """google.generativeai を包み、呼び出しをカセットに記録する"""
+
+    def __init__(self, genai, path=CASSETTE_FILE, prompt_chars=None):
+        """
+        Args:
+            genai: 本物の google.generativeai
+            path: 追記するカセットファイル
+            prompt_chars: 記録するプロンプトの最大文字数（None なら全文）
+        """
+        self._genai = genai
+        self.path = path
+        self.prompt_chars = prompt_chars
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        recorder = self
+
+        class GenerativeModel:
+            def __init__(self, model_name):
+                self.model_name = model_name
+                self._model = genai.GenerativeModel(model_name=model_name)
+
+            def generate_content(self, prompt, generation_config=None, stream=False):
+                return recorder._generate(self._model, self.model_name, prompt, generation_config, stream)
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, api_key=None):
+        self._genai.configure(api_key=api_key)
+
+    def GenerationConfig(self, **kwargs):
+        return self._genai.GenerationConfig(**kwargs)
+
+    def list_models(self):
+        started = time.perf_counter()
+        models = list(self._genai.list_models())
+        self._write({
+            "type": "list_models",
+            "elapsed_sec": round(time.perf_counter() - started, 4),
+            "models": [{"name": m.name, "methods": list(m.supported_generation_methods)} for m in models],
+        })
+        return models
+
+    def _write(self, record):
+        record["recorded_at"] = time.time()
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _generate(self, model, model_name, prompt, generation_config, stream):
+        record = {
+            "type": "generate",
+            "model": model_name,
+            "prompt_sha": _prompt_sha(prompt),
+            "prompt_kind": _prompt_kind(prompt),
+            "prompt": str(prompt),
+            "stream": stream,
+        }
+        if self.prompt_chars is not None and len(record["prompt"]) > self.prompt_chars:
+            record["prompt"] = record["prompt"][:self.prompt_chars]
+            record["prompt_truncated"] = True
+        started = time.perf_counter()
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config, stream=stream)
+            if not stream:
+                record["text"] = response.text
+                record["usage"] = _usage(response)
+                record["elapsed_sec"] = round(time.perf_counter() - started, 4)
+                self._write(record)
+                return response
+        except Exception as e:
+            record["error"] = str(e)[:1000]
+            record["elapsed_sec"] = round(time.perf_counter() - started, 4)
+            self._write(record)
+            raise
+        return self._record_stream(response, record, started)
+
+    def _record_stream(self, response, record, started):
+        # チャンクは呼び出し側に流しながら記録し、ストリームが終わった（打ち切られた）時点で1行書く
+        record["chunks"] = []
+        chunk = None
+        try:
+            for chunk in response:
+                record["chunks"].append([round(time.perf_counter() - started, 4), chunk.text])
+                yield chunk
+        except Exception as e:
+            record["error"] = str(e)[:1000]
+            raise
+        finally:
+            record["usage"] = _usage(chunk)
+            record["elapsed_sec"] = round(time.perf_counter() - started, 4)
+            self._write(record)
+
+
+class ReplayGenAI:
+    """カセットの記録を返す google.generativeai の代わり（SDK もネットワークも使わない）"""
+
+    def __init__(self, path=CASSETTE_FILE, speed=1.0):
+        """
+        Args:
+            path: 読み込むカセットファイル
+            speed: 待ち時間を何倍速で再現するか（0 以下なら待たない）
+        """
+        self.path = path
+        self.speed = speed
+        self.calls = {"list_models": 0, "generate_content": 0}
+        self._lock = threading.Lock()
+
+        self._models = None
+        self._by_prompt = {}  # (model, prompt_sha) -> [record]
+        self._by_model = {}   # (model, kind) -> [record]
+        self._by_kind = {}    # kind -> [record]
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "list_models":
+                    self._models = record
+                elif record.get("type") == "generate":
+                    kind = record.get("prompt_kind", "single")
+                    self._by_prompt.setdefault((record["model"], record["prompt_sha"]), []).append(record)
+                    self._by_model.setdefault((record["model"], kind), []).append(record)
+                    self._by_kind.setdefault(kind, []).append(record)
+        if not self._by_kind:
+            raise ValueError(f"No generate records in cassette: {path}")
+        # 同じキーの記録は順番に使い回す
+        self._cursors = {}
+
+        replay = self
+
+        class GenerativeModel:
+            def __init__(self, model_name):
+                self.model_name = model_name
+
+            def generate_content(self, prompt, generation_config=None, stream=False):
+                return replay._generate(self.model_name, prompt, stream)
+
+        self.GenerativeModel = GenerativeModel
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerationConfig(self, **kwargs):
+        return kwargs
+
+    def _sleep(self, seconds):
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def list_models(self):
+        with self._lock:
+            self.calls["list_models"] += 1
+        if self._models is None:
+            # 記録に一覧が無ければ、応答の記録があるモデルを返す
+            names = dict.fromkeys(model for model, _ in self._by_model)
+            return [_Model(f"models/{name}", ["generateContent"]) for name in names]
+        self._sleep(self._models.get("elapsed_sec", 0))
+        return [_Model(m["name"], m["methods"]) for m in self._models["models"]]
+
+    def _next(self, key, records):
+        with self._lock:
+            cursor = self._cursors.get(key)
+            if cursor is None:
+                cursor = self._cursors[key] = itertools.cycle(records)
+            return next(cursor)
+
+    def _find(self, model_name, prompt):
+        kind = _prompt_kind(prompt)
+        for key, table in (((model_name, _prompt_sha(prompt)), self._by_prompt),
+                           ((model_name, kind), self._by_model),
+                           (kind, self._by_kind)):
+            records = table.get(key)
+            if records:
+                return self._next(key, records)
+        return self._next("any", [r for records in self._by_kind.values() for r in records])
+
+    def _generate(self, model_name, prompt, stream):
+        with self._lock:
+            self.calls["generate_content"] += 1
+        record = self._find(model_name, prompt)
+        usage = record.get("usage")
+
+        if "chunks" in record:
+            timed_chunks = record["chunks"]
+        elif "text" in record:
+            text = record["text"]
+            # 単独の応答をストリーミングで求められたら、同じ時間で少しずつ返す
+            step = max(1, len(text) // 8)
+            elapsed = record.get("elapsed_sec", 0)
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            timed_chunks = [[elapsed * (n + 1) / len(pieces), piece] for n, piece in enumerate(pieces)]
+        else:
+            timed_chunks = []
+
+        if not stream:
+            self._sleep(record.get("elapsed_sec", 0))
+            # ストリームが途中で失敗した記録も、途中までの文字列ではなく例外として返す
+            if "error" in record:
+                raise ReplayError(record["error"])
+            return _Chunk("".join(text for _, text in timed_chunks), usage)
+
+        def iterate():
+            previous = 0.0
+            for n, (at, text) in enumerate(timed_chunks):
+                self._sleep(at - previous)
+                previous = at
+                yield _Chunk(text, usage if n == len(timed_chunks) - 1 else None)
+            if "error" in record:
+                self._sleep(record.get("elapsed_sec", 0) - previous)
+                raise ReplayError(record["error"])
+        return iterate()
+
+
+def wrap(genai_loader, options):
+    """
+    cassette の設定に応じた genai を返す
+
+    Args:
+        genai_loader: 本物の google.generativeai を読み込んで返す関数（再生時は呼ばない）
+        options: {"mode": "record" | "replay" | None, "path", "speed", "prompt_chars"}
+
+    Returns:
+        (genai, 再生中なら True)
+    """
+    options = options or {}
+    mode = options.get("mode")
+    path = options.get("path") or CASSETTE_FILE
+    if mode == "replay":
+        print(f"Replaying Gemini responses from {path} (speed x{options.get('speed', 1.0)}).")
+        return ReplayGenAI(path, speed=options.get("speed", 1.0)), True
+    if mode == "record":
+        print(f"Recording Gemini calls to {path}.")
+        return RecordingGenAI(genai_loader(), path, prompt_chars=options.get("prompt_chars")), False
+    return genai_loader(), False
@@ -0,0 +1,89 @@
+"""
+JSON設定ファイル（bot_config.json / known_tools.json）の共有キャッシュ
+
+処理の肝:
+- ファイルの (mtime, size) をキーに、変更が無い限りパース済みのオブジェクトを返す
+- 書き込みは一時ファイル経由の置き換えで行い、書いた内容でそのままキャッシュを更新する
+- edit_json でまとめた変更は、ブロックを抜けるときに1回だけ書き込む
+
+採用理由: Streamlitは操作のたびにスクリプト全体を再実行するため、毎回のファイル読み込み・パースを避けたい。
+          ボットとダッシュボードで同じ読み込み経路を使う
+注意点: 呼び出し側が結果を書き換えてもキャッシュが壊れないよう、返すのはコピー
+"""
+
+import copy
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+_cache = {}  # path -> ((mtime_ns, size), data)
+_lock = threading.Lock()
+
+
+def signature(path):
+    """ファイルの変更検知用の値 (mtime_ns, size)。ファイルが無ければ None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_json(path, default=None):
+    """
+    JSONファイルを読み込む（変更が無ければキャッシュを返す）
+
+    Args:
+        path: ファイルパス
+        default: ファイルが無い・壊れている場合に返す値
+
+    Returns:
+        パース済みオブジェクトのコピー
+    """
+    sig = signature(path)
+    if sig is None:
+        return copy.deepcopy(default)
+
+    with _lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == sig:
+            return copy.deepcopy(cached[1])
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Warning: Failed to load {path}: {e}")
+        return copy.deepcopy(default)
+
+    with _lock:
+        _cache[path] = (sig, data)
+    return copy.deepcopy(data)
+
+
+def save_json(path, data, indent=4):
+    """JSONファイルを置き換えで書き込み、キャッシュも更新する"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    with _lock:
+        _cache[path] = (signature(path), copy.deepcopy(data))
+
+
+@contextmanager
+def edit_json(path, default=None, indent=4):
+    """
+    ブロック内の変更をまとめて1回で書き込む
+
+    例:
+        with edit_json("known_tools.json", {"known_tools": []}) as data:
+            data["known_tools"].remove("Arc")
+            data["known_tools"].append("Zed")
+    """
+    data = load_json(path, default)
+    before = copy.deepcopy(data)
+    yield data
+    if data != before:
+        save_json(path, data, indent=indent)
@@ -1,8 +1,12 @@
 import streamlit as st
-import json
-import os
-import subprocess
-import sys
+import pandas as pd
+import csv
+import io
+import math
+from datetime import datetime
+from config_store import load_json, save_json, edit_json
+from job_runner import BotJobRunner
+from analytics import RunLogAnalytics
 
 # Page Config
 st.set_page_config(
@@ -40,81 +44,265 @@ st.markdown("""
 
 # Helper Functions
 def load_tools():
-    try:
-        with open(KNOWN_TOOLS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("known_tools", [])
-    except FileNotFoundError:
+    return load_json(KNOWN_TOOLS_FILE, {}).get("known_tools", [])
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+def normalize_tool(name):
+    """前後の空白・引用符を落とし、連続する空白を1つにまとめる"""
+    return " ".join(str(name or "").strip().strip('"\'').split())
+
+def dedupe_tools(tools):
+    """正規化し、大文字小文字を区別せずに重複を除く（最初に現れたものを残す）"""
+    seen, result = set(), []
+    for tool in tools:
+        tool = normalize_tool(tool)
+        if tool and tool.lower() not in seen:
+            seen.add(tool.lower())
+            result.append(tool)
+    return result
+
+def parse_tool_list(text):
+    """
+    貼り付けられたCSV・テキストからツール名を取り出す
+
+    1行目に name / tool の列見出しがあるCSVはその列だけを、
+    それ以外は改行・カンマ・読点で区切られた全ての値をツール名として扱う
+    """
+    rows = [row for row in csv.reader(io.StringIO(text.replace("、", ","))) if any(c.strip() for c in row)]
+    if not rows:
         return []
+    header = [c.strip().lower() for c in rows[0]]
+    column = next((header.index(h) for h in ("name", "tool", "tool name", "known_tools") if h in header), None)
+    if column is not None:
+        return dedupe_tools(row[column] for row in rows[1:] if len(row) > column)
+    return dedupe_tools(cell for row in rows for cell in row)
+
+def update_tools(remove=(), rename=None, add=()):
+    """
+    既知ツールの変更をまとめて1回で保存する
 
-def save_tools(tools):
-    with open(KNOWN_TOOLS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"known_tools": tools}, f, indent=4, ensure_ascii=False)
+    変更は名前で指定するため、別のセッションが同時に追加したツールを上書きで消すことはない。
+
+    Returns:
+        (追加した件数, 削除した件数)
+    """
+    remove = {t.lower() for t in remove}
+    rename = rename or {}
+    with edit_json(KNOWN_TOOLS_FILE, {}) as data:
+        before = data.get("known_tools", [])
+        kept = [rename.get(t, t) for t in before if t.lower() not in remove]
+        data["known_tools"] = dedupe_tools(kept + list(add))
+    after = {t.lower() for t in data["known_tools"]}
+    existing = {t.lower() for t in before}
+    return len(after - existing), len(existing - after)
 
 def load_config():
-    try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            "search_category": "Dev Tools, PKM, Privacy Browsers, & Student Deals",
-            "target_languages": "TypeScript, PHP, AWS, Rust, Go",
-            "excluded_keywords": ""
-        }
+    return load_json(CONFIG_FILE, {
+        "search_category": "Dev Tools, PKM, Privacy Browsers, & Student Deals",
+        "target_languages": "TypeScript, PHP, AWS, Rust, Go",
+        "excluded_keywords": ""
+    })
 
 def save_config(config):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+    save_json(CONFIG_FILE, config)
+
+@st.cache_resource
+def get_job_runner():
+    # 全セッションで1つのランナーを共有し、同時実行を防ぐ
+    return BotJobRunner()
+
+@st.cache_resource
+def get_analytics():
+    # 読み終えた位置と日ごとの集計をプロセス内で共有し、再実行のたびには追記分だけを読む
+    return RunLogAnalytics()
+
+@st.fragment(run_every=1)
+def show_job_status():
+    runner = get_job_runner()
+    job = runner.snapshot()
+    if job["state"] == "idle":
+        return
+
+    # 新しいジョブが始まったら表示中のログを捨てる
+    if st.session_state.get("job_started_at") != job["started_at"]:
+        st.session_state["job_started_at"] = job["started_at"]
+        st.session_state["job_log"] = []
+        st.session_state["job_log_offset"] = 0
+
+    # 前回表示した行以降だけを取り出して追記する
+    new_lines, offset = runner.lines_since(st.session_state["job_log_offset"])
+    st.session_state["job_log"].extend(new_lines)
+    st.session_state["job_log_offset"] = offset
+    log_text = "\n".join(st.session_state["job_log"])
+
+    if job["state"] == "running":
+        elapsed = (datetime.now() - job["started_at"]).seconds
+        st.info(f"Scouting tech trends... ({elapsed}s)")
+    elif job["state"] == "failed":
+        st.error("Error occurred:")
+        st.code(job["error"])
+    else:
+        st.success("Analysis Complete!")
+    st.text_area("Bot Logs", log_text, height=300)
+
+def pending_tool_changes(page_tools, changes):
+    """data_editor の差分（edited_rows / added_rows / deleted_rows）を (削除, 名前の変更, 追加) にする"""
+    remove, rename = set(), {}
+    for index, row in changes.get("edited_rows", {}).items():
+        original = page_tools[int(index)]
+        if row.get("Delete"):
+            remove.add(original)
+        elif normalize_tool(row.get("Tool")) and row.get("Tool") != original:
+            rename[original] = normalize_tool(row["Tool"])
+    remove.update(page_tools[int(i)] for i in changes.get("deleted_rows", []))
+    add = [row.get("Tool") for row in changes.get("added_rows", []) if normalize_tool(row.get("Tool"))]
+    return remove, rename, add
+
+# 以下のボタンは on_click で呼ばれるため、保存後の再描画で新しい一覧が表示される（st.rerun は不要）
+def _reset_tools_editor(notice):
+    st.session_state["tools_editor_version"] += 1  # 編集中の差分・貼り付け欄を捨てる
+    st.session_state["tools_notice"] = notice
+
+def _import_tools(import_key):
+    added, _ = update_tools(add=parse_tool_list(st.session_state.get(import_key, "")))
+    _reset_tools_editor(f"Imported {added} new tool(s).")
+
+def _save_tool_edits(page_tools, editor_key):
+    remove, rename, add = pending_tool_changes(page_tools, st.session_state.get(editor_key, {}))
+    update_tools(remove=remove, rename=rename, add=add)
+    _reset_tools_editor(f"Saved {len(remove) + len(rename) + len(add)} change(s).")
+
+def _delete_tools(tools):
+    _, removed = update_tools(remove=tools)
+    _reset_tools_editor(f"Removed {removed} tool(s).")
+
+@st.fragment
+def known_tools_editor():
+    # 操作のたびに再実行されるのはこの部分だけ。描画するのは表示中のページの行だけにする
+    tools = load_tools()
+    version = st.session_state.setdefault("tools_editor_version", 0)
+
+    with st.expander("➕ Add / Import tools"):
+        import_key = f"tools_import_{version}"
+        pasted = st.text_area(
+            "Paste tool names (one per line, comma separated, or CSV with a 'name' column)",
+            key=import_key, height=120,
+        )
+        st.button("Import", disabled=not pasted.strip(), on_click=_import_tools, args=(import_key,))
 
-def run_bot():
-    try:
-        # Run bot.py in a subprocess
-        result = subprocess.run([sys.executable, "bot.py"], capture_output=True, text=True, encoding="utf-8")
-        return result.stdout, result.stderr
-    except Exception as e:
-        return None, str(e)
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        query = st.text_input("Search tools", key="tools_search", placeholder="Filter by name...").strip().lower()
+    with c2:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key="tools_page_size")
+
+    matches = [t for t in tools if query in t.lower()] if query else tools
+    pages = max(1, math.ceil(len(matches) / page_size))
+    # 検索や削除でページ数が減ったら、ページ番号を範囲内に戻す（ウィジェットを作る前なら書き換えられる）
+    page = st.session_state["tools_page"] = min(st.session_state.get("tools_page", 1), pages)
+    start = (page - 1) * page_size
+    page_tools = matches[start:start + page_size]
+
+    st.write(f"**Current List ({len(tools)} items" + (f", {len(matches)} matching" if query else "") + ")**")
+    if notice := st.session_state.pop("tools_notice", None):
+        st.success(notice)
+
+    # 編集内容は st.session_state[editor_key] に差分として溜まり、保存ボタンで1回にまとめて書き込む
+    editor_key = f"tools_editor_{version}_{query}_{page}_{page_size}"
+    st.data_editor(
+        # 空のページでも列の型が変わらないように型を固定する
+        pd.DataFrame({"Tool": page_tools, "Delete": [False] * len(page_tools)}).astype({"Tool": "str", "Delete": "bool"}),
+        key=editor_key,
+        num_rows="dynamic",
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "Tool": st.column_config.TextColumn("Tool", required=True),
+            "Delete": st.column_config.CheckboxColumn("Delete", default=False, width="small"),
+        },
+    )
+    st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="tools_page")
+
+    remove, rename, add = pending_tool_changes(page_tools, st.session_state.get(editor_key, {}))
+    pending = len(remove) + len(rename) + len(add)
+    b1, b2 = st.columns(2)
+    with b1:
+        st.button(f"💾 Save changes ({pending})", disabled=not pending,
+                  on_click=_save_tool_edits, args=(page_tools, editor_key))
+    with b2:
+        if query and matches:
+            st.button(f"🗑️ Delete all {len(matches)} matching", type="secondary",
+                      on_click=_delete_tools, args=(matches,))
+
+ANALYTICS_RANGES = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last 365 days": 365, "All time": None}
+
+@st.fragment
+def show_analytics():
+    analytics = get_analytics()
+    analytics.refresh()
+
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        range_label = st.selectbox("Range", list(ANALYTICS_RANGES), index=1, key="analytics_range")
+    with c2:
+        st.button("🔄 Refresh", key="analytics_refresh")
+    last_days = ANALYTICS_RANGES[range_label]
+
+    daily = analytics.daily_rows(last_days)
+    if not daily:
+        st.info(f"No runs recorded yet. Run logs are read from `{analytics.metrics_path}`.")
+        return
+    daily_df = pd.DataFrame(daily).set_index("date")
+
+    runs = int(daily_df["runs"].sum())
+    statuses = analytics.status_totals(last_days)
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Runs", runs)
+    k2.metric("Delivered trends", int(daily_df["delivered"].sum()))
+    k3.metric("Avg run duration", f"{(daily_df['avg_duration_sec'] * daily_df['runs']).sum() / runs:.1f}s")
+    k4.metric("Failed profile runs", statuses.get("api_error", 0) + statuses.get("failed", 0))
+
+    st.markdown("### 📈 Delivered Trends per Day")
+    st.bar_chart(daily_df[["delivered"]])
+
+    st.markdown("### ⏱️ Run Duration (sec)")
+    st.line_chart(daily_df[["avg_duration_sec", "max_duration_sec"]])
+
+    st.markdown("### 🧹 Dedup / Filter Rates")
+    st.caption("Share of generated trends dropped as duplicates of history, by keyword filters, or for dead links.")
+    st.line_chart(daily_df[["duplicate_rate", "filtered_rate", "dead_link_rate"]])
+
+    st.markdown("### 🤖 Models")
+    models = analytics.model_rows(last_days)
+    if models:
+        st.dataframe(pd.DataFrame(models), hide_index=True, width="stretch")
+    else:
+        st.caption("No model calls recorded in this range.")
+
+    st.markdown("### 📬 Recently Delivered")
+    st.dataframe(pd.DataFrame(analytics.delivered_items(last_days), columns=["date", "profile", "trend"]),
+                 hide_index=True, width="stretch")
+    if statuses:
+        st.caption("Profile run statuses: " + ", ".join(f"{k}: {v}" for k, v in sorted(statuses.items())))
 
 # --- UI Layout ---
 
 st.title("🧠 Tech Trend Bot Dashboard")
 
-col1, col2 = st.columns([2, 1])
+control_tab, analytics_tab = st.tabs(["🎛️ Control", "📊 Analytics"])
+
+with analytics_tab:
+    show_analytics()
+
+col1, col2 = control_tab.columns([2, 1])
 
 # Left Column: Manage Tools
 with col1:
     st.subheader("🛠️ My Stack (Known Tools)")
     st.caption("Here are the tools you already know. The bot will NOT recommend these as new trends, but may suggest plugins for them.")
     
-    tools = load_tools()
-    
-    # Add New Tool
-    with st.form("add_tool_form", clear_on_submit=True):
-        new_tool = st.text_input("Add a tool you use (e.g. 'VS Code')")
-        submitted = st.form_submit_button("Add to List")
-        if submitted and new_tool:
-            if new_tool not in tools:
-                tools.append(new_tool)
-                save_tools(tools)
-                st.success(f"Added '{new_tool}'")
-                st.rerun()
-            else:
-                st.warning("Tool already exists.")
-
-    # List Tools
-    if tools:
-        st.write(f"**Current List ({len(tools)} items)**")
-        # Display as pills/tags with delete option
-        for i, tool in enumerate(tools):
-            c1, c2 = st.columns([4, 1])
-            with c1:
-                st.code(tool)
-            with c2:
-                if st.button("🗑️", key=f"del_{i}"):
-                    tools.pop(i)
-                    save_tools(tools)
-                    st.rerun()
-    else:
-        st.info("No tools registered yet.")
+    known_tools_editor()
 
 # Right Column: Bot Controls
 with col2:
@@ -123,16 +311,13 @@ with col2:
     st.markdown("### Manual Run")
     st.caption("Trigger the bot immediately to check for trends and send a notification.")
     
-    if st.button("🚀 Run Bot Now"):
-        with st.spinner("Scouting tech trends..."):
-            stdout, stderr = run_bot()
-            if stderr:
-                st.error("Error occurred:")
-                st.code(stderr)
-            else:
-                st.success("Analysis Complete!")
-                # Show part of the log
-                st.text_area("Bot Logs", stdout, height=300)
+    runner = get_job_runner()
+    if st.button("🚀 Run Bot Now", disabled=runner.is_running):
+        # ボットは同じプロセスのワーカースレッドで動かし、ログは下で逐次表示する
+        if not runner.start():
+            st.warning("A run is already in progress.")
+
+    show_job_status()
 
     st.divider()
     
@@ -0,0 +1,209 @@
+"""
+既知ツール・除外キーワードのローカルフィルタ
+
+処理の肝:
+- 既知ツール（known_tools.json の known_tools と aliases）と除外キーワード（excluded_keywords）を
+  1つの Aho-Corasick オートマトンにまとめてコンパイルし、各アイテムの名前・URLのホスト・説明文を1回の走査で照合する。
+  GitHub などのコードホスト（trend_history.CODE_HOSTS）はどのツールの URL にもなるため、ホストを照合しない
+  （既知ツールの "GitHub" で github.com/astral-sh/ruff を落とさないように）
+- 既知ツールは名前かURLに現れたら除外（既知ツールの拡張を提案する Power Tip 枠は対象外）、
+  除外キーワードは名前・URL・説明文のどこに現れても除外する
+- コンパイル結果は (known_tools.json の (mtime, size), excluded_keywords) ごとにキャッシュし、
+  ファイルか設定が変わったときだけ作り直す
+
+採用理由: プロンプトで「既知ツールを提案しないで」と頼むだけでは守られないことがある。
+          リストが数千件に増えても、照合はテキスト長に比例する時間で終わる
+注意点: 英数字で始まる・終わるパターンは単語境界でのみ一致させる（"Arc" が "search" に一致しないように）。
+        日本語など英数字以外の端は境界を見ない
+
+aliases の書き方（known_tools.json）:
+    "aliases": {"Visual Studio Code": ["VS Code", "vscode"]}
+"""
+
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+from config_store import load_json, signature
+from trend_history import CODE_HOSTS
+
+KNOWN_TOOLS_FILE = "known_tools.json"
+
+_FIELDS = ("name", "url", "description")
+
+
+class AhoCorasick:
+    """複数パターンの同時検索"""
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns: 検索する文字列のリスト（空文字列は無視される）
+        """
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node].append(index)
+
+        # 失敗リンクを幅優先で張り、出力を失敗先から引き継ぐ
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text):
+        """一致ごとに (開始位置, 終了位置, パターン番号) を返す"""
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                yield pos + 1 - len(patterns[index]), pos + 1, index
+
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+def _parse_keywords(text):
+    if isinstance(text, (list, tuple)):
+        parts = text
+    else:
+        parts = (text or "").replace("、", ",").split(",")
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _host(url):
+    """照合に使うURLのホスト（コードホストは空文字列）"""
+    host = urlsplit((url or "").strip()).netloc.lower()
+    host = host[4:] if host.startswith("www.") else host
+    return "" if host in CODE_HOSTS else host
+
+
+class TrendFilter:
+    def __init__(self, known_tools=(), aliases=None, excluded_keywords=""):
+        """
+        Args:
+            known_tools: 既知ツール名のリスト
+            aliases: 既知ツール名 -> 別名のリスト
+            excluded_keywords: 除外キーワード（カンマ区切りの文字列、またはリスト）
+        """
+        rules = {}  # 小文字化したパターン -> [(種類, 表示名)]
+        for tool in known_tools:
+            rules.setdefault(tool.strip().lower(), []).append(("known tool", tool))
+        for tool, names in (aliases or {}).items():
+            for alias in names:
+                rules.setdefault(alias.strip().lower(), []).append(("known tool", tool))
+        for keyword in _parse_keywords(excluded_keywords):
+            rules.setdefault(keyword.lower(), []).append(("excluded keyword", keyword))
+        rules.pop("", None)
+
+        self._patterns = list(rules)
+        self._rules = [rules[p] for p in self._patterns]
+        self._matcher = AhoCorasick(self._patterns)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def check(self, item):
+        """
+        除外すべきなら理由を返す（残すなら None）
+
+        例: "known tool 'Obsidian' in name" / "excluded keyword 'crypto' in description"
+        """
+        values = {
+            "name": item.get("name", ""),
+            "url": _host(item.get("url", "")),
+            "description": item.get("description", ""),
+        }
+        # 3つのフィールドを改行でつないで1回で走査する（改行は単語境界として働く）
+        text = "\n".join(values[f] for f in _FIELDS).lower()
+        bounds, offset = [], 0
+        for field in _FIELDS:
+            offset += len(values[field])
+            bounds.append((offset, field))
+            offset += 1
+        is_power_tip = "Power Tip" in item.get("buzz_factor", "")
+
+        for start, end, index in self._matcher.finditer(text):
+            pattern = self._patterns[index]
+            if _is_word_char(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if _is_word_char(pattern[-1]) and end < len(text) and _is_word_char(text[end]):
+                continue
+            field = next(f for limit, f in bounds if start < limit)
+            for kind, label in self._rules[index]:
+                if kind == "known tool" and (is_power_tip or field == "description"):
+                    continue
+                return f"{kind} '{label}' in {field}"
+        return None
+
+    def apply(self, trends):
+        """
+        Returns:
+            (残したアイテム, [(除外したアイテム, 理由)])
+        """
+        kept, dropped = [], []
+        for item in trends:
+            reason = self.check(item)
+            if reason:
+                dropped.append((item, reason))
+            else:
+                kept.append(item)
+        return kept, dropped
+
+
+_compiled = {}  # excluded_keywords -> (known_tools.json の signature, TrendFilter)
+_lock = threading.Lock()
+
+
+def get_filter(excluded_keywords="", known_tools_path=KNOWN_TOOLS_FILE):
+    """
+    コンパイル済みのフィルタを返す（known_tools.json か除外キーワードが変わったときだけ作り直す）
+
+    Args:
+        excluded_keywords: プロファイルの excluded_keywords
+        known_tools_path: 既知ツールのファイル
+    """
+    key = (known_tools_path, str(excluded_keywords or ""))
+    sig = signature(known_tools_path)
+    with _lock:
+        cached = _compiled.get(key)
+        if cached and cached[0] == sig:
+            return cached[1]
+
+    data = load_json(known_tools_path, {})
+    trend_filter = TrendFilter(
+        known_tools=data.get("known_tools", []),
+        aliases=data.get("aliases", {}),
+        excluded_keywords=excluded_keywords,
+    )
+    with _lock:
+        # 古い signature のものは捨てる
+        for k in [k for k, (s, _) in _compiled.items() if k[0] == known_tools_path and s != sig]:
+            del _compiled[k]
+        _compiled[key] = (sig, trend_filter)
+    return trend_filter
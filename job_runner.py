@@ -0,0 +1,147 @@
+"""
+ダッシュボード用のバックグラウンドジョブランナー
+
+処理の肝:
+- bot.main をサブプロセスではなく同一プロセスのワーカースレッドで実行（インポート済みSDKを使い回す）
+- 実行中は sys.stdout を差し替え、print 出力を行単位でバッファに溜めつつ元の出力にも流す
+- 状態（idle / running / succeeded / failed）とログを外から参照でき、ログは差分取得できる
+- 実行中に start を呼んでも二重起動しない
+
+採用理由: ボタン押下のたびにPython起動と google.generativeai のインポートを払わずに済み、
+          Streamlitのスクリプトもブロックしない
+注意点: stdout の差し替えはプロセス全体に効くため、実行中は他スレッドの print もログに混ざる
+"""
+
+import sys
+import threading
+import traceback
+from datetime import datetime
+
+
+class _LogStream:
+    """書き込まれた文字列を元のストリームに流しつつ、行単位でランナーに渡す"""
+
+    def __init__(self, runner, original):
+        self.runner = runner
+        self.original = original
+        self._partial = ""
+
+    def write(self, text):
+        if self.original:
+            self.original.write(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        if lines:
+            self.runner._append(lines)
+        return len(text)
+
+    def flush(self):
+        if self.original:
+            self.original.flush()
+
+    def close_partial(self):
+        if self._partial:
+            self.runner._append([self._partial])
+            self._partial = ""
+
+
+class BotJobRunner:
+    def __init__(self, max_lines=5000):
+        """
+        Args:
+            max_lines: 保持するログの最大行数（古い行から捨てる）
+        """
+        self.max_lines = max_lines
+        self.state = "idle"
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._lines = []
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self.state == "running"
+
+    def start(self, target=None):
+        """
+        ジョブを開始する
+
+        Args:
+            target: 実行する関数（省略時は bot.main）
+
+        Returns:
+            True: 開始した / False: 既に実行中
+        """
+        with self._lock:
+            if self.state == "running":
+                return False
+            self.state = "running"
+            self.started_at = datetime.now()
+            self.finished_at = None
+            self.result = None
+            self.error = None
+            self._lines = []
+            self._dropped = 0
+
+        self._thread = threading.Thread(target=self._run, args=(target,), name="bot-job", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, target):
+        original = sys.stdout
+        stream = _LogStream(self, original)
+        sys.stdout = stream
+        try:
+            if target is None:
+                # 初回だけ bot を読み込み（Gemini SDK は最初の実行時に読み込まれる）、以降はインポート済みのものを使う
+                import bot
+                target = bot.main
+            result = target()
+            state, error = "succeeded", None
+        except Exception:
+            result, state, error = None, "failed", traceback.format_exc()
+        finally:
+            stream.close_partial()
+            sys.stdout = original
+
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.finished_at = datetime.now()
+            self.state = state
+
+    def _append(self, lines):
+        with self._lock:
+            self._lines.extend(lines)
+            overflow = len(self._lines) - self.max_lines
+            if overflow > 0:
+                del self._lines[:overflow]
+                self._dropped += overflow
+
+    def lines_since(self, offset=0):
+        """
+        offset 行目以降のログと、次回に渡すべき offset を返す
+
+        Returns:
+            (新しい行のリスト, 次の offset)
+        """
+        with self._lock:
+            start = max(offset - self._dropped, 0)
+            new_lines = self._lines[start:]
+            return new_lines, self._dropped + len(self._lines)
+
+    def snapshot(self):
+        """UI表示用に現在の状態をまとめて返す"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+                "error": self.error,
+                "lines": list(self._lines),
+            }
@@ -0,0 +1,174 @@
+"""
+ストリーミング応答用のインクリメンタルJSONパーサー
+
+処理の肝:
+- 生成途中のテキストを chunk ごとに feed し、トップレベルオブジェクトの
+  「配列要素（trends の各アイテムなど）」と「スカラー値（one_line_summary など）」を、完成した時点で1つずつ返す
+- 各配列要素は完成時に validator で検証し、スキーマ違反やJSONとして壊れた要素があればその場で StreamInvalid を投げる
+- 先頭の ```json フェンスは許容し、それ以外の文字で始まる応答は最初のチャンクで不正と判定する
+
+採用理由: 不正な応答を生成完了まで待たずに打ち切れる。届いたアイテムから後段の処理を始められる
+注意点: 値の取り出しは完成した要素の部分文字列を json.loads するだけなので、
+        最終的な全体の整合性は close() で改めて確認する
+"""
+
+import json
+
+_FENCE = "```json"
+
+
+class StreamInvalid(ValueError):
+    """ストリームが明らかに不正（これ以上待っても有効なJSONにならない）"""
+
+
+class JsonStreamParser:
+    def __init__(self, validator=None):
+        """
+        Args:
+            validator: validator(key, item) で配列要素を検証する関数。不正なら ValueError を投げる
+        """
+        self.validator = validator
+        self.text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._started = False
+        self._done = False
+        self._obj_start = None
+        self._obj_end = None
+        # トップレベル（depth 1）の状態
+        self._key = None
+        self._last_string = None
+        self._expect_value = False
+        self._value_start = None
+        # 配列（depth 2）の要素の状態
+        self._elem_expect = False
+        self._elem_start = None
+
+    def feed(self, chunk):
+        """
+        テキストを追加し、新たに完成した値を返す
+
+        Returns:
+            [("item", key, value) | ("field", key, value), ...]
+        """
+        self.text += chunk
+        events = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self._done:
+            c = text[i]
+            if not self._started:
+                if c == "{":
+                    self._check_prefix(text[:i])
+                    self._started = True
+                    self._obj_start = i
+                    self._stack.append("{")
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string_end(i, events)
+                i += 1
+                continue
+
+            depth = len(self._stack)
+            if depth == 1 and self._expect_value and not c.isspace():
+                self._value_start = i
+                self._expect_value = False
+            elif depth == 2 and self._stack[1] == "[" and self._elem_expect and not c.isspace() and c != "]":
+                self._elem_start = i
+                self._elem_expect = False
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                self._stack.append(c)
+                if depth == 1 and c == "[":
+                    self._elem_expect = True
+            elif c in "}]":
+                if c == "]" and depth == 2 and self._stack[1] == "[" and self._elem_start is not None:
+                    # 数値などのスカラー要素で終わる配列
+                    self._emit_item(i, events)
+                self._stack.pop()
+                new_depth = len(self._stack)
+                if new_depth == 2 and self._stack[1] == "[" and self._elem_start is not None:
+                    self._emit_item(i + 1, events)
+                elif new_depth == 1 and self._value_start is not None:
+                    if c == "]":
+                        # 配列の値そのものは要素ごとに返しているので、ここでは何もしない
+                        self._elem_expect = False
+                    else:
+                        self._emit_field(i + 1, events)
+                    self._value_start = None
+                elif new_depth == 0:
+                    if self._value_start is not None:
+                        self._emit_field(i, events)
+                    self._obj_end = i
+                    self._done = True
+            elif c == ",":
+                if depth == 1 and self._value_start is not None:
+                    self._emit_field(i, events)
+                    self._value_start = None
+                elif depth == 2 and self._stack[1] == "[":
+                    if self._elem_start is not None:
+                        self._emit_item(i, events)
+                    self._elem_expect = True
+            elif c == ":" and depth == 1:
+                self._key = self._last_string
+                self._expect_value = True
+            i += 1
+
+        self._pos = i
+        if not self._started:
+            self._check_prefix(text)
+        return events
+
+    def _check_prefix(self, prefix):
+        head = prefix.strip()
+        if head and not (_FENCE.startswith(head) or head == _FENCE):
+            raise StreamInvalid(f"Response does not start with a JSON object: {head[:50]!r}")
+
+    def _on_string_end(self, i, events):
+        if len(self._stack) == 1:
+            if self._value_start == self._string_start:
+                self._emit_field(i + 1, events)
+                self._value_start = None
+            else:
+                self._last_string = json.loads(self.text[self._string_start:i + 1])
+        elif len(self._stack) == 2 and self._stack[1] == "[" and self._elem_start == self._string_start:
+            self._emit_item(i + 1, events)
+
+    def _loads(self, start, end):
+        try:
+            return json.loads(self.text[start:end])
+        except json.JSONDecodeError as e:
+            raise StreamInvalid(f"Malformed JSON value in stream: {e}")
+
+    def _emit_item(self, end, events):
+        item = self._loads(self._elem_start, end)
+        self._elem_start = None
+        if self.validator:
+            try:
+                self.validator(self._key, item)
+            except ValueError as e:
+                raise StreamInvalid(str(e))
+        events.append(("item", self._key, item))
+
+    def _emit_field(self, end, events):
+        events.append(("field", self._key, self._loads(self._value_start, end)))
+
+    def close(self):
+        """ストリーム終了時に全体をパースして返す（途中で切れていれば StreamInvalid）"""
+        if not self._done:
+            raise StreamInvalid("Stream ended before the JSON object was complete.")
+        return self._loads(self._obj_start, self._obj_end + 1)
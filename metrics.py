@@ -0,0 +1,243 @@
+"""
+パイプラインの計測（ステージごとの所要時間・リソース）
+
+処理の肝:
+- start_run() で1実行分の RunMetrics を作り、各モジュールは metrics.span("gemini.generate") のように
+  モジュール関数を呼ぶだけで計測できる（実行中でなければ何もしない）
+- span は名前ごとに回数・合計・最大を集計し、個々の記録も残す（スレッドをまたいでも安全）
+- finish() で所要時間・カウンター・プロファイルごとの結果・ピークメモリを1レコードとして metrics.jsonl に追記
+- TREND_BOT_PROFILE=1 のときだけ cProfile と tracemalloc を有効にし、profiles/ に結果を書き出す。
+  cProfile は有効にしたスレッドしか計測しないため、ワーカースレッドで動かす関数は metrics.profiled(fn) で包む。
+  スレッドごとの cProfile を pstats.Stats.add で本体の結果にまとめて1つの .prof にする
+
+採用理由: 遅い実行がモデル一覧取得・生成・パース・重複排除・Discord送信のどこで時間を使ったかを後から追える
+注意点: ピークメモリ（ru_maxrss）は resource モジュールがある環境（Linux/macOS）のみ。
+        Windows では TREND_BOT_PROFILE=1 時の tracemalloc のピーク値だけが記録される。
+        Python 3.12 以降の cProfile は全スレッドを1つで計測し、2つ目は有効にできない（そのときは本体の結果だけになる）
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_FILE = "metrics.jsonl"
+PROFILE_DIR = "profiles"
+
+
+class RunMetrics:
+    def __init__(self, run_id=None, profile=False):
+        """
+        Args:
+            run_id: 実行ID（省略時は日時 + ランダム）
+            profile: True なら cProfile / tracemalloc を有効にする
+        """
+        self.run_id = run_id or f"{datetime.now():%Y%m%d-%H%M%S}-{os.urandom(3).hex()}"
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.values = {}
+        self.profiles = {}
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._profiler_thread = None
+        self._thread_profilers = []
+        if profile:
+            self._start_profiling()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            elapsed = time.perf_counter() - started
+            record = {"name": name, "sec": round(elapsed, 6), **attrs}
+            with self._lock:
+                self.spans.append(record)
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self.values[key] = value
+
+    def profile(self, name, **fields):
+        """プロファイル（チャンネル）ごとの結果をまとめる"""
+        with self._lock:
+            self.profiles.setdefault(name, {}).update(fields)
+
+    def _start_profiling(self):
+        import cProfile
+        import tracemalloc
+        tracemalloc.start()
+        self._profiler = cProfile.Profile()
+        self._profiler_thread = threading.get_ident()
+        self._profiler.enable()
+
+    @contextmanager
+    def thread_profile(self):
+        """ワーカースレッドでの区間を、そのスレッド用の cProfile で計測して本体の結果に加える"""
+        if self._profiler is None or threading.get_ident() == self._profiler_thread:
+            yield
+            return
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Python 3.12 以降: 本体の cProfile が全スレッドを計測している
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._thread_profilers.append(profiler)
+
+    def _stop_profiling(self):
+        import pstats
+        import tracemalloc
+        self._profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"run-{self.run_id}")
+        stats = pstats.Stats(self._profiler)
+        with self._lock:
+            workers, self._thread_profilers = self._thread_profilers, []
+        for profiler in workers:
+            stats.add(profiler)
+        stats.dump_stats(f"{base}.prof")
+
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(f"{base}.mem.txt", "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+        print(f"Profile written to {base}.prof ({len(workers)} worker thread(s) merged) / {base}.mem.txt")
+        return peak
+
+    def _totals(self):
+        totals = {}
+        for span in self.spans:
+            t = totals.setdefault(span["name"], {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            t["count"] += 1
+            t["total_sec"] = round(t["total_sec"] + span["sec"], 6)
+            t["max_sec"] = max(t["max_sec"], span["sec"])
+        return totals
+
+    def record(self):
+        """1実行分のレコードを作る"""
+        with self._lock:
+            record = {
+                "run_id": self.run_id,
+                "started_at": self.started_at.isoformat(),
+                "duration_sec": round(time.perf_counter() - self._t0, 6),
+                "stages": self._totals(),
+                "spans": list(self.spans),
+                "counters": dict(self.counters),
+                "profiles": {k: dict(v) for k, v in self.profiles.items()},
+                **self.values,
+            }
+        record["peak_rss_mb"] = _peak_rss_mb()
+        return record
+
+    def finish(self, path=METRICS_FILE):
+        """計測を終了し、レコードをJSONLに追記して返す"""
+        peak_traced = self._stop_profiling() if self._profiler else None
+        record = self.record()
+        if peak_traced is not None:
+            record["peak_traced_mb"] = round(peak_traced / 1024 / 1024, 2)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except IOError as e:
+            print(f"Warning: Failed to write metrics: {e}")
+        return record
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+_current = None
+
+
+def start_run(profile=None):
+    """新しい実行の計測を開始する（profile 省略時は環境変数 TREND_BOT_PROFILE=1 で有効）"""
+    global _current
+    if profile is None:
+        profile = os.getenv("TREND_BOT_PROFILE") == "1"
+    _current = RunMetrics(profile=profile)
+    return _current
+
+
+def finish_run(path=METRICS_FILE):
+    """実行中の計測を終了して書き出す"""
+    global _current
+    run, _current = _current, None
+    return run.finish(path) if run else None
+
+
+def current():
+    return _current
+
+
+@contextmanager
+def span(name, **attrs):
+    """実行中なら区間の所要時間を記録する（実行中でなければ何もしない）"""
+    run = _current
+    if run is None:
+        yield attrs
+        return
+    with run.span(name, **attrs) as a:
+        yield a
+
+
+def add(key, amount=1):
+    if _current is not None:
+        _current.add(key, amount)
+
+
+def set_value(key, value):
+    if _current is not None:
+        _current.set(key, value)
+
+
+def profile(name, **fields):
+    if _current is not None:
+        _current.profile(name, **fields)
+
+
+def profiled(fn):
+    """
+    ワーカースレッドで呼ぶ関数を包む（cProfile での計測中なら、そのスレッドの呼び出しも .prof に入る）
+
+    例: pool.submit(metrics.profiled(run_profile), profile, ...)
+    """
+    run = _current
+    if run is None or run._profiler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with run.thread_profile():
+            return fn(*args, **kwargs)
+    return wrapper
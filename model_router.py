@@ -0,0 +1,160 @@
+"""
+モデルの実績にもとづく試行順の決定とサーキットブレーカー
+
+処理の肝:
+- 生成の試行ごとに、モデル別の所要時間・有効なJSONが返った割合を EWMA（指数移動平均）で更新し、
+  エラーの種類（認証・レート制限・サーバーエラー・不正な応答・タイムアウト）を数える。
+  所要時間は成功した試行だけで更新する（すぐ返る 429 や認証エラーで見積もりが速くならないように）
+- 試行順は「有効な応答が得られるまでの期待時間」= 平均所要時間 / 成功率 の小さい順。
+  実績の無いモデルは事前値で見積もり、同じ見積もり同士はモデル一覧の順（_score_model の順位）を保つ
+- failure_threshold 回続けて失敗したモデルは cooldown_sec の間ブレーカーを開いて候補から外す。
+  期間が過ぎたら1回だけ試し（半開）、また失敗したら cooldown を倍にして開き直す（max_cooldown_sec まで）。
+  認証エラーは1回で開く
+- 統計は cache/model_stats.json に保存し、実行をまたいで使い回す
+
+採用理由: 名前だけの固定順位では、上位のモデルがタイムアウトや不正なJSONを返し続けても毎回最初に試してしまう
+注意点: 全モデルのブレーカーが開いているときは、開き終わりの早い順に全部返す（何も試さずに諦めることはしない）
+"""
+
+import os
+import threading
+import time
+
+import metrics
+from config_store import load_json, save_json
+
+MODEL_STATS_FILE = os.path.join("cache", "model_stats.json")
+
+def classify_error(error):
+    """例外をエラーの種類に分ける（_format_api_error と同じ判定）"""
+    if isinstance(error, ValueError):
+        # json.JSONDecodeError / StreamInvalid / スキーマ違反
+        return "invalid"
+    text = str(error)
+    if '401' in text or '403' in text or 'API_KEY_INVALID' in text:
+        return "auth"
+    if '429' in text or 'RESOURCE_EXHAUSTED' in text:
+        return "rate_limit"
+    if '500' in text or '503' in text or 'UNAVAILABLE' in text:
+        return "server"
+    if isinstance(error, TimeoutError) or 'DEADLINE_EXCEEDED' in text or 'timed out' in text.lower():
+        return "timeout"
+    return "other"
+
+
+class ModelRouter:
+    def __init__(self, path=MODEL_STATS_FILE, alpha=0.3, failure_threshold=3, cooldown_sec=600,
+                 max_cooldown_sec=6 * 60 * 60, prior_latency_sec=10.0, prior_success=0.8):
+        """
+        Args:
+            path: 統計の保存先
+            alpha: EWMA の重み（大きいほど直近の試行を重く見る）
+            failure_threshold: ブレーカーを開くまでの連続失敗回数
+            cooldown_sec: ブレーカーを開いておく秒数（開き直すたびに倍）
+            max_cooldown_sec: cooldown の上限
+            prior_latency_sec: 実績の無いモデルの所要時間の見積もり
+            prior_success: 実績の無いモデルの成功率の見積もり
+        """
+        self.path = path
+        self.alpha = alpha
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_sec = cooldown_sec
+        self.max_cooldown_sec = max_cooldown_sec
+        self.prior_latency_sec = prior_latency_sec
+        self.prior_success = prior_success
+        self._lock = threading.Lock()
+        self._stats = load_json(path, {}).get("models", {})
+
+    def _entry(self, model):
+        entry = self._stats.get(model)
+        if entry is None:
+            entry = self._stats[model] = {
+                "latency_sec": self.prior_latency_sec,
+                "success": self.prior_success,
+                "attempts": 0,
+                "successes": 0,
+                "consecutive_failures": 0,
+                "errors": {},
+                "open_until": 0,
+                "cooldown_sec": 0,
+            }
+        return entry
+
+    def expected_sec(self, model):
+        """有効な応答が得られるまでの期待秒数（所要時間 / 成功率）"""
+        entry = self._stats.get(model)
+        if entry is None:
+            return self.prior_latency_sec / self.prior_success
+        return entry["latency_sec"] / max(entry["success"], 0.05)
+
+    def is_open(self, model, now=None):
+        entry = self._stats.get(model)
+        return bool(entry) and entry.get("open_until", 0) > (now or time.time())
+
+    def order(self, models):
+        """
+        試行する順に並べ替える（ブレーカーが開いているモデルは外す）
+
+        Args:
+            models: モデル一覧の順（固定の順位）に並んだモデル名
+        """
+        now = time.time()
+        with self._lock:
+            ranked = sorted(models, key=self.expected_sec)  # 安定ソートなので同点は一覧の順
+            available = [m for m in ranked if not self.is_open(m, now)]
+            if available:
+                skipped = len(ranked) - len(available)
+                if skipped:
+                    metrics.add("router.skipped_open", skipped)
+                return available
+            print("All model circuits are open. Trying them in order of recovery.")
+            return sorted(ranked, key=lambda m: self._stats[m]["open_until"])
+
+    def record(self, model, elapsed_sec, error=None):
+        """
+        1回の試行の結果を統計に反映して保存する
+
+        Args:
+            model: モデル名
+            elapsed_sec: 試行にかかった秒数
+            error: 失敗したときの例外（成功なら None）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entry(model)
+            a = self.alpha
+            # 所要時間は成功した試行で更新し、最初の成功で事前値を置き換える（成功率は事前値から少しずつ動かす）
+            entry["success"] = round((1 - a) * entry["success"] + a * (0.0 if error else 1.0), 4)
+            entry["attempts"] += 1
+            entry["last_used"] = now
+
+            if error is None:
+                # successes が無い古い統計は、それまでの試行で所要時間を測ってある
+                successes = entry.get("successes", entry["attempts"] - 1)
+                latency = entry["latency_sec"] if successes else elapsed_sec
+                entry["latency_sec"] = round((1 - a) * latency + a * elapsed_sec, 4)
+                entry["successes"] = successes + 1
+                entry["consecutive_failures"] = 0
+                entry["cooldown_sec"] = 0
+                entry["open_until"] = 0
+            else:
+                kind = classify_error(error)
+                entry["errors"][kind] = entry["errors"].get(kind, 0) + 1
+                entry["last_error"] = kind
+                entry["consecutive_failures"] += 1
+                half_open = entry["cooldown_sec"] > 0  # 開いたあとの試しの1回で失敗した
+                if kind == "auth" or half_open or entry["consecutive_failures"] >= self.failure_threshold:
+                    cooldown = min(entry["cooldown_sec"] * 2 or self.cooldown_sec, self.max_cooldown_sec)
+                    entry["cooldown_sec"] = cooldown
+                    entry["open_until"] = now + cooldown
+                    print(f"Circuit opened for model {model} ({kind}, {entry['consecutive_failures']} failure(s) in a row). "
+                          f"Skipping it for {cooldown:.0f}s.")
+                    metrics.add("router.circuit_opened")
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            save_json(self.path, {"updated_at": time.time(), "models": self._stats}, indent=2)
+        except IOError as e:
+            print(f"Warning: Failed to save model stats: {e}")
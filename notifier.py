@@ -1,28 +1,173 @@
 import requests
 import os
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import metrics
+
+DISCORD_API_BASE = "https://discord.com/api/v10"
+
+
+class DiscordTransport:
+    """
+    Discord REST API 用の共有トランスポート
+
+    - requests.Session を使い回してコネクションをプール（keep-alive）
+    - ルート（チャンネルごと）の X-RateLimit-* ヘッダーからトークンバケットを更新し、
+      残り0なら Reset-After まで待ってから送る
+    - 429 は retry_after（グローバル制限含む）だけ待って再送し、失敗扱いにしない
+    """
+
+    def __init__(self, token=None, api_base=None, timeout=(5, 15), max_retries=3, pool_size=10):
+        """
+        Args:
+            token: Botトークン（省略時は環境変数 DISCORD_BOT_TOKEN）
+            api_base: APIのベースURL（省略時は環境変数 DISCORD_API_BASE または公式API）
+            timeout: (接続, 読み取り) タイムアウト秒
+            max_retries: 429 を受けたときの再送回数
+            pool_size: コネクションプールの大きさ
+        """
+        self.token = token or os.getenv("DISCORD_BOT_TOKEN")
+        self.api_base = (api_base or os.getenv("DISCORD_API_BASE") or DISCORD_API_BASE).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bot {self.token}",
+            "Content-Type": "application/json",
+        })
+
+        self._lock = threading.Lock()
+        self._buckets = {}  # route -> {"remaining": int | None, "reset_at": monotonic秒}
+        self._global_reset_at = 0.0
+
+    def _acquire(self, route):
+        """ルートのトークンを1つ確保する（足りなければリセットまで待つ）"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(route, {"remaining": None, "reset_at": 0.0})
+                if bucket["reset_at"] <= now:
+                    bucket["remaining"] = None
+                wait = self._global_reset_at - now
+                if bucket["remaining"] is not None and bucket["remaining"] <= 0:
+                    wait = max(wait, bucket["reset_at"] - now)
+                if wait <= 0:
+                    if bucket["remaining"] is not None:
+                        bucket["remaining"] -= 1
+                    return
+            time.sleep(wait)
+
+    def _update(self, route, response):
+        """レスポンスヘッダーからバケットの状態を更新する"""
+        headers = response.headers
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is None or reset_after is None:
+            return
+        with self._lock:
+            bucket = self._buckets.setdefault(route, {"remaining": None, "reset_at": 0.0})
+            bucket["remaining"] = int(remaining)
+            bucket["reset_at"] = time.monotonic() + float(reset_after)
+
+    def _retry_after(self, response):
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        retry_after = body.get("retry_after") or response.headers.get("Retry-After") or 1
+        is_global = body.get("global") or response.headers.get("X-RateLimit-Global") == "true"
+        return float(retry_after), bool(is_global)
+
+    def post(self, path, payload):
+        """
+        レート制限を守りながら POST し、成功したレスポンスを返す
+
+        Raises:
+            requests.RequestException: 429 以外のHTTPエラー、通信エラー、再送回数の超過
+        """
+        route = f"POST {path}"
+        url = f"{self.api_base}{path}"
+        body = json.dumps(payload)
+        for attempt in range(self.max_retries + 1):
+            with metrics.span("discord.wait", route=route):
+                self._acquire(route)
+            with metrics.span("discord.post", route=route) as span:
+                response = self.session.post(url, data=body, timeout=self.timeout)
+                span["status"] = response.status_code
+            metrics.add("discord.request_bytes", len(body.encode("utf-8")))
+            self._update(route, response)
+
+            if response.status_code != 429:
+                response.raise_for_status()
+                return response
+
+            metrics.add("discord.rate_limited")
+            retry_after, is_global = self._retry_after(response)
+            print(f"Discord rate limited on {route} ({'global' if is_global else 'route'}). Retrying in {retry_after:.2f}s.")
+            with self._lock:
+                reset_at = time.monotonic() + retry_after
+                if is_global:
+                    self._global_reset_at = max(self._global_reset_at, reset_at)
+                else:
+                    bucket = self._buckets.setdefault(route, {"remaining": None, "reset_at": 0.0})
+                    bucket["remaining"] = 0
+                    bucket["reset_at"] = max(bucket["reset_at"], reset_at)
+
+        response.raise_for_status()
+
+
+class ConsoleTransport:
+    """
+    Discord に送らずコンソールに出す DiscordTransport の代わり（記録の再生 --replay 用）
+
+    post() は常に成功したことにし、送るはずだった内容を sent に残す
+    """
+
+    api_base = "console"
+
+    def __init__(self):
+        self.sent = []  # (path, payload)
+        self._lock = threading.Lock()
+
+    def post(self, path, payload):
+        with self._lock:
+            self.sent.append((path, payload))
+        if payload.get("content"):
+            print(f"[console] POST {path}: {payload['content']}")
+        for embed in payload.get("embeds") or []:
+            print(f"[console] POST {path}: {embed.get('title')} ({len(embed.get('fields', []))} field(s))")
+        return None
+
 
 class DiscordNotifier:
-    def __init__(self, token=None, channel_id=None):
+    def __init__(self, token=None, channel_id=None, transport=None):
+        """
+        Args:
+            token: Botトークン（省略時は環境変数 DISCORD_BOT_TOKEN）
+            channel_id: 既定の送信先チャンネル（省略時は環境変数 DISCORD_CHANNEL_ID）
+            transport: 共有する DiscordTransport（省略時は新規作成）
+        """
         self.token = token or os.getenv("DISCORD_BOT_TOKEN")
         self.channel_id = channel_id or os.getenv("DISCORD_CHANNEL_ID")
-        self.api_base = "https://discord.com/api/v10"
+        self.transport = transport or DiscordTransport(token=self.token)
+        self.api_base = self.transport.api_base
 
-    def send(self, content=None, embeds=None):
+    def send(self, content=None, embeds=None, channel_id=None):
         """
         Sends a message to a Discord Channel using Bot Token.
         """
-        if not self.token or not self.channel_id:
+        channel_id = channel_id or self.channel_id
+        if not self.token or not channel_id:
             print("Warning: DISCORD_BOT_TOKEN or DISCORD_CHANNEL_ID is not set. Notification skipped.")
             return False
 
-        url = f"{self.api_base}/channels/{self.channel_id}/messages"
-        
-        headers = {
-            "Authorization": f"Bot {self.token}",
-            "Content-Type": "application/json"
-        }
-
         payload = {}
         if content:
             payload["content"] = content
@@ -30,11 +175,33 @@ class DiscordNotifier:
             payload["embeds"] = embeds
 
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
+            self.transport.post(f"/channels/{channel_id}/messages", payload)
             return True
         except Exception as e:
             print(f"Failed to send Discord notification: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Response: {e.response.text}")
             return False
+
+    def send_many(self, messages, max_workers=4):
+        """
+        複数メッセージをまとめて送る（チャンネルごとのレート制限はトランスポートが調整する）
+
+        Args:
+            messages: channel_id / content / embeds キーを持つ辞書のリスト
+            max_workers: 同時に送信するスレッド数
+
+        Returns:
+            各メッセージの送信結果（True/False）のリスト（入力と同じ順序）
+        """
+        def send_one(message):
+            return self.send(
+                content=message.get("content"),
+                embeds=message.get("embeds"),
+                channel_id=message.get("channel_id"),
+            )
+
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(messages)))) as pool:
+            return list(pool.map(send_one, messages))
@@ -0,0 +1,231 @@
+"""
+通知の送信待ちキュー（アウトボックス）
+
+処理の肝:
+- 組み立てた Embed は送る前に cache/outbox/<id>.json に書き出し、送信が確認できたら消す
+- 送信時は id を Discord の nonce（enforce_nonce: true）として付け、再送が二重投稿にならないようにする
+- 送れなかったものは失敗回数に応じた指数バックオフ（base_delay_sec * 2^n、max_delay_sec まで、±20%の揺らぎ）で
+  次の送信時刻を決め、同じ実行の残り時間・次回の実行・常駐スケジューラのティックで再送する
+- 履歴への追加と last_run の更新は、送信が確認できたときに on_delivered で行う
+- 送る前に <id>.lock を O_EXCL で作って送信権を取る（常駐スケジューラとダッシュボードなど、別のプロセス同士でも
+  同じエントリを同時に送らない）。lease_sec を過ぎたロックは落ちたプロセスの残骸とみなして奪う
+- 400 / 401 / 403 / 404 など、送り直しても通らない 4xx はすぐ諦める（再送するのは 408 / 429 / 5xx と接続の失敗だけ）
+
+採用理由: Discord の一時的な障害のたびに生成（LLM の呼び出し）からやり直すと、コストがかかり、違うトレンドが選ばれる。
+          再送なら小さな POST 1回で済む
+注意点: Discord が nonce で重複を弾くのは数分以内の再送だけ。送信できてからファイルを消すまでの間にプロセスが落ちると、
+        時間をおいた再送で二重に投稿されうる。max_attempts 回失敗したもの・送り直しても通らないものは
+        <id>.failed.json に残して諦める
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+OUTBOX_DIR = os.path.join("cache", "outbox")
+
+# 送り直せば通りうる HTTP ステータス（それ以外の 4xx はすぐ諦める）
+RETRYABLE_STATUSES = {408, 429}
+
+
+def _retryable(error):
+    """再送で通りうる失敗か（HTTP の応答が無い接続の失敗などは再送する）"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is None or status >= 500 or status in RETRYABLE_STATUSES or status < 400
+
+
+class Outbox:
+    def __init__(self, directory=OUTBOX_DIR, base_delay_sec=30, max_delay_sec=60 * 60, max_attempts=12, lease_sec=300):
+        """
+        Args:
+            directory: 送信待ちの保存先
+            base_delay_sec: 1回目の失敗後、再送するまでの秒数（失敗するたびに倍）
+            max_delay_sec: 再送間隔の上限（秒）
+            max_attempts: 諦めるまでの送信回数
+            lease_sec: 送信権（<id>.lock）の有効期間。これより古いロックは奪う
+        """
+        self.directory = directory
+        self.base_delay_sec = base_delay_sec
+        self.max_delay_sec = max_delay_sec
+        self.max_attempts = max(1, max_attempts)
+        self.lease_sec = lease_sec
+        self._lock = threading.Lock()
+
+    def _path(self, entry_id, suffix=".json"):
+        return os.path.join(self.directory, f"{entry_id}{suffix}")
+
+    def _write(self, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(entry["id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def enqueue(self, profile, channel_id, payload, trends):
+        """
+        送信するメッセージを書き出す（送る前に呼ぶ）
+
+        Args:
+            profile: プロファイル名
+            channel_id: 送信先チャンネル
+            payload: Discord に送る本文（{"embeds": [...]} など）
+            trends: 送信できたら履歴に追加するアイテム
+
+        Returns:
+            書き出したエントリ
+        """
+        now = time.time()
+        entry = {
+            # Discord の nonce は25文字まで
+            "id": f"{int(now):x}{os.urandom(6).hex()}",
+            "profile": profile,
+            "channel_id": channel_id,
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "payload": payload,
+            "trends": trends,
+            "created_at": now,
+            "attempts": 0,
+            "next_attempt_at": now,
+        }
+        self._write(entry)
+        return entry
+
+    def pending(self, profile=None, due_only=False):
+        """送信待ちのエントリを古い順に返す"""
+        now = time.time()
+        entries = []
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith(".json") and not n.endswith(".failed.json"))
+        except OSError:
+            return []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"Warning: Failed to read outbox entry {name}: {e}")
+                continue
+            if profile is not None and entry.get("profile") != profile:
+                continue
+            if due_only and entry.get("next_attempt_at", 0) > now:
+                continue
+            entries.append(entry)
+        entries.sort(key=lambda e: e.get("created_at", 0))
+        return entries
+
+    def next_due(self):
+        """次に再送するエントリの時刻（UNIX秒）。送信待ちが無ければ None"""
+        entries = self.pending()
+        return min(e.get("next_attempt_at", 0) for e in entries) if entries else None
+
+    def backoff(self, attempts):
+        """attempts 回失敗したあとの待ち時間（秒）"""
+        delay = min(self.base_delay_sec * (2 ** max(0, attempts - 1)), self.max_delay_sec)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _claim(self, entry_id):
+        """送信権を取る（別のスレッド・プロセスが送信中なら False）"""
+        path = self._path(entry_id, ".lock")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(path) > self.lease_sec
+                except FileNotFoundError:
+                    continue  # ちょうど手放された
+                if not stale:
+                    return False
+                print(f"Taking over a stale outbox lock: {path}")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(f"{os.getpid()} {time.time()}")
+            return True
+        return False
+
+    def _release(self, entry_id):
+        try:
+            os.remove(self._path(entry_id, ".lock"))
+        except FileNotFoundError:
+            pass
+
+    def deliver(self, entry, transport, on_delivered=None):
+        """
+        エントリを送信する
+
+        Args:
+            entry: enqueue / pending が返したエントリ
+            transport: notifier.DiscordTransport
+            on_delivered: 送信が確認できたら on_delivered(entry) で呼ばれる（履歴への追加など）
+
+        Returns:
+            送信できたら True（別のスレッド・プロセスが送信済みの場合も）。
+            失敗したら次の送信時刻を書き込んで、別のスレッド・プロセスが送信中なら何もせずに False
+        """
+        if not self._claim(entry["id"]):
+            print(f"Outbox entry {entry['id']} is being delivered by another worker.")
+            return False
+        try:
+            # 送信権を取ったあとで読み直す（待っている間に、別の送り手が送信済み・失敗の記録をしていることがある）
+            try:
+                with open(self._path(entry["id"]), "r", encoding="utf-8") as f:
+                    entry.update(json.load(f))
+            except FileNotFoundError:
+                return not os.path.exists(self._path(entry["id"], ".failed.json"))
+
+            payload = {**entry["payload"], "nonce": entry["id"], "enforce_nonce": True}
+            try:
+                with metrics.span("outbox.deliver", attempt=entry["attempts"] + 1):
+                    transport.post(f"/channels/{entry['channel_id']}/messages", payload)
+            except Exception as e:
+                return self._failed(entry, e)
+
+            if on_delivered:
+                on_delivered(entry)
+            with self._lock:
+                try:
+                    os.remove(self._path(entry["id"]))
+                except FileNotFoundError:
+                    pass
+            metrics.add("outbox.delivered")
+            return True
+        finally:
+            self._release(entry["id"])
+
+    def _failed(self, entry, error):
+        entry["attempts"] += 1
+        entry["last_error"] = str(error)[:300]
+        response = getattr(error, "response", None)
+        if response is not None:
+            print(f"Response: {response.text[:300]}")
+        metrics.add("outbox.failures")
+
+        retryable = _retryable(error)
+        if entry["attempts"] >= self.max_attempts or not retryable:
+            reason = f"after {entry['attempts']} attempt(s)" if retryable else "(not retryable)"
+            print(f"Giving up on outbox entry {entry['id']} {reason}: {error}")
+            with self._lock:
+                self._write(entry)
+                os.replace(self._path(entry["id"]), self._path(entry["id"], ".failed.json"))
+            metrics.add("outbox.dropped")
+            return False
+
+        delay = self.backoff(entry["attempts"])
+        entry["next_attempt_at"] = time.time() + delay
+        print(f"Delivery failed ({error}). Retrying in {delay:.1f}s (attempt {entry['attempts']}/{self.max_attempts}).")
+        with self._lock:
+            self._write(entry)
+        return False
@@ -0,0 +1,234 @@
+"""
+トークン予算付きのプロンプト組み立て
+
+処理の肝:
+- 既知ツールリストをそのまま全部埋め込まず、カテゴリ・ターゲットとの関連度順に並べて
+  予算（推定トークン数）に収まる分だけプロンプトに入れる
+- 入りきらなかったツールも含め、既知ツールの提案は filter_engine のローカルフィルタで除外する
+- 柱ごとの候補数（per_pillar）を指定でき、多めに出してもらった候補から candidate_pool がローカルで選ぶ。
+  このときは使われない one_line_summary を求めない
+- build_batch は複数の分野を1つのプロンプトにまとめ、分野ごとの結果を id 付きで返させる（指示部分の重複を払わない）
+- 組み立てたシステムプロンプト（静的部分）は (分野, ターゲット) ごとに最後の1つだけメモ化し、既知ツール・予算・候補数も
+  同じなら同じプロセス内の2回目以降（常駐モードの毎日の実行・ダッシュボードからの実行）は再計算しない。
+  既知ツールが変わったら置き換えるので、常駐しても分野の数より増えない
+- build() が返すトークン数・送ったツール数は metrics.jsonl の実行レコードに記録され、ツール数とレイテンシの関係を追える
+
+採用理由: ダッシュボードで既知ツールが増えても、入力トークン・レイテンシ・コストが頭打ちになる
+注意点: メモはプロセス内だけ（bat / cron の1回きりの起動では効かない）。組み立ては並べ替えと文字数の概算だけで、
+        ディスクのキャッシュを読むのと変わらない程度に軽いため、ファイルには残さない。
+        トークン数はトークナイザを使わない概算（ASCIIは4文字≒1トークン、それ以外は1文字≒1トークン）。
+        予算からは先に固定部分（指示・ターゲット・末尾の依頼文）を引き、残りだけを既知ツールに使う。
+        固定部分だけで予算を超えるときは既知ツールを送らずに警告する（プロンプト自体は削らない）
+"""
+
+import re
+import threading
+
+SYSTEM_PROMPT_TEMPLATE = """
+        あなたは「テックトレンドスカウト」です。
+        ユーザーのために、以下の3つの異なる視点で、合計で**ちょうど{total}つ**の有益な情報を提案してください。
+
+        # ユーザーの「既知のツール」リスト:
+        [{known_tools_str}]
+        ※注意: これらのツールを「新しい発見（Alpha Trend/Hidden Gem）」として提案しないでください。
+        ※例外: 「Power Tip」枠では、これらのツールのプラグインや拡張機能を提案してください。
+
+        # 提案の3本柱（必ず各{per_pillar}つずつ含めること。同じ柱の中ではおすすめ度の高い順に並べること）:
+        1. **Alpha Trend (最新トレンド)**: 過去24〜48時間以内にGitHub Trending等で話題になった新ツール。{targets_str}
+        2. **Power Tip (活用術・拡張)**: 既知のツールを強化するプラグイン・設定。
+        3. **Hidden Gem (隠れた名作)**: プロが愛用するがあまり知られていないツール。
+
+        以下のJSON形式のみで回答してください:
+        {{
+            "date": "今日の日付",
+            "trends": [
+                {{
+                    "name": "ツール/トピック名",
+                    "description": "概要（日本語）。なぜこれが有益か？",
+                    "url": "URL",
+                    "buzz_factor": "【Alpha Trend】 / 【Power Tip】 / 【Hidden Gem】 のいずれかを記載"
+                }}
+            ]{summary_field}
+        }}
+        """
+
+BATCH_PROMPT_TEMPLATE = """
+        あなたは「テックトレンドスカウト」です。
+        下の「リクエスト」の各分野について、それぞれ独立に、以下の3つの異なる視点で合計**ちょうど{total}つ**ずつ有益な情報を提案してください。
+
+        # ユーザーの「既知のツール」リスト:
+        [{known_tools_str}]
+        ※注意: これらのツールを「新しい発見（Alpha Trend/Hidden Gem）」として提案しないでください。
+        ※例外: 「Power Tip」枠では、これらのツールのプラグインや拡張機能を提案してください。
+
+        # 提案の3本柱（各リクエストで必ず各{per_pillar}つずつ含めること。同じ柱の中ではおすすめ度の高い順に並べること）:
+        1. **Alpha Trend (最新トレンド)**: 過去24〜48時間以内にGitHub Trending等で話題になった新ツール。リクエストごとのターゲットを優先すること。
+        2. **Power Tip (活用術・拡張)**: 既知のツールを強化するプラグイン・設定。
+        3. **Hidden Gem (隠れた名作)**: プロが愛用するがあまり知られていないツール。
+
+        # リクエスト:
+{requests_str}
+
+        以下のJSON形式のみで回答してください（results はリクエストと同じ順序で、同じ id を付けること）:
+        {{
+            "date": "今日の日付",
+            "results": [
+                {{
+                    "id": "リクエストの id",
+                    "trends": [
+                        {{
+                            "name": "ツール/トピック名",
+                            "description": "概要（日本語）。なぜこれが有益か？",
+                            "url": "URL",
+                            "buzz_factor": "【Alpha Trend】 / 【Power Tip】 / 【Hidden Gem】 のいずれかを記載"
+                        }}
+                    ]{batch_summary_field}
+                }}
+            ]
+        }}
+        """
+
+DEFAULT_TARGETS = "TypeScript, PHP, AWS, 新興AIツール"
+
+# 要約は柱ごとに1つだけ出してもらうときに限る（多めに出した候補からローカルで選ぶと、モデルの要約は選んだものと食い違う）
+SUMMARY_FIELD = ',\n            "one_line_summary": "今日の3カテゴリのハイライト要約"'
+BATCH_SUMMARY_FIELD = ',\n                    "one_line_summary": "この分野の3カテゴリのハイライト要約"'
+
+BATCH_REQUEST_LINE = "\n\n上記の指示に従い、各リクエストの分野におけるトレンドと情報を検索・生成してください。"
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _request_line(category):
+    """プロンプト末尾の依頼文"""
+    return f"\n\n上記の指示に従い、{category}分野におけるトレンドと情報を検索・生成してください。"
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（ASCIIは4文字≒1トークン、それ以外は1文字≒1トークン）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def rank_tools(tools, category, target_languages):
+    """カテゴリ・ターゲットと単語が重なるツールほど前に並べる（同点は元の順序）"""
+    context = set(_WORD_RE.findall(f"{category} {target_languages or ''}".lower()))
+    def relevance(tool):
+        return len(context & set(_WORD_RE.findall(tool.lower())))
+    return sorted(tools, key=relevance, reverse=True)
+
+
+class PromptBuilder:
+    def __init__(self, budget_tokens=2000, per_pillar=1):
+        """
+        Args:
+            budget_tokens: プロンプト全体の推定トークン数の上限
+            per_pillar: 柱（Alpha Trend / Power Tip / Hidden Gem）ごとに出してもらう候補数
+        """
+        self.budget_tokens = budget_tokens
+        self.per_pillar = max(1, per_pillar)
+        self._memo = {}  # (分野, ターゲット) -> (既知ツール・予算・候補数のキー, (システムプロンプト, 送ったツール))
+        self._lock = threading.Lock()
+
+    def _counts(self):
+        oversampled = self.per_pillar > 1
+        return {
+            "per_pillar": self.per_pillar,
+            "total": 3 * self.per_pillar,
+            "summary_field": "" if oversampled else SUMMARY_FIELD,
+            "batch_summary_field": "" if oversampled else BATCH_SUMMARY_FIELD,
+        }
+
+    @staticmethod
+    def _fit_tools(known_tools, category, target_languages, remaining):
+        """関連度の高い順に、予算（残りトークン数）に収まるだけツールを選ぶ"""
+        sent = []
+        for tool in rank_tools(known_tools, category, target_languages):
+            cost = estimate_tokens(tool) + 1  # 区切りの ", " の分
+            if cost > remaining:
+                break
+            sent.append(tool)
+            remaining -= cost
+        return sent
+
+    def _remaining(self, fixed_prompt):
+        """固定部分を引いた、既知ツールに使えるトークン数（固定部分だけで予算を超えたら警告して 0）"""
+        fixed = estimate_tokens(fixed_prompt)
+        if fixed > self.budget_tokens:
+            print(f"Warning: The fixed prompt alone is ~{fixed} tokens, over the budget of {self.budget_tokens}. "
+                  f"Sending no known tools. Raise prompt_token_budget.")
+            return 0
+        return self.budget_tokens - fixed
+
+    def _system_prompt(self, known_tools, category, target_languages):
+        slot = (category, target_languages)
+        key = (tuple(known_tools), self.budget_tokens, self.per_pillar)
+        with self._lock:
+            cached = self._memo.get(slot)
+            if cached and cached[0] == key:
+                return cached[1]
+
+        targets_str = f"ターゲット: {target_languages}" if target_languages else f"ターゲット: {DEFAULT_TARGETS}"
+        counts = self._counts()
+        base = SYSTEM_PROMPT_TEMPLATE.format(known_tools_str="", targets_str=targets_str, **counts)
+        remaining = self._remaining(base + _request_line(category))
+        sent = self._fit_tools(known_tools, category, target_languages, remaining)
+
+        system_prompt = SYSTEM_PROMPT_TEMPLATE.format(known_tools_str=", ".join(sent), targets_str=targets_str, **counts)
+        with self._lock:
+            self._memo[slot] = (key, (system_prompt, sent))
+        return system_prompt, sent
+
+    def build(self, known_tools, category, target_languages=None):
+        """
+        プロンプトを組み立てる
+
+        Returns:
+            (prompt, stats) stats はトークン数や送ったツール数
+        """
+        system_prompt, sent = self._system_prompt(known_tools, category, target_languages)
+        prompt = system_prompt + _request_line(category)
+        stats = {
+            "tokens": estimate_tokens(prompt),
+            "budget": self.budget_tokens,
+            "known_tools_total": len(known_tools),
+            "known_tools_sent": len(sent),
+            "per_pillar": self.per_pillar,
+            "over_budget": estimate_tokens(prompt) > self.budget_tokens,
+        }
+        return prompt, stats
+
+    def build_batch(self, known_tools, requests):
+        """
+        複数分野をまとめて1回で生成するプロンプトを組み立てる
+
+        Args:
+            requests: (id, category, target_languages) のリスト
+
+        Returns:
+            (prompt, stats) stats は build と同じキーに batch_size を加えたもの
+        """
+        requests_str = "\n".join(
+            f"        - id: \"{req_id}\" / 分野: {category} / ターゲット: {targets or DEFAULT_TARGETS}"
+            for req_id, category, targets in requests
+        )
+        counts = self._counts()
+        base = BATCH_PROMPT_TEMPLATE.format(known_tools_str="", requests_str=requests_str, **counts)
+        # 既知ツールは全リクエストの分野・ターゲットをまとめた文脈で関連度を測る
+        context_category = " ".join(category for _, category, _ in requests)
+        context_targets = " ".join(targets or "" for _, _, targets in requests)
+        sent = self._fit_tools(known_tools, context_category, context_targets,
+                               self._remaining(base + BATCH_REQUEST_LINE))
+
+        prompt = BATCH_PROMPT_TEMPLATE.format(known_tools_str=", ".join(sent), requests_str=requests_str, **counts)
+        prompt += BATCH_REQUEST_LINE
+        stats = {
+            "tokens": estimate_tokens(prompt),
+            "budget": self.budget_tokens,
+            "known_tools_total": len(known_tools),
+            "known_tools_sent": len(sent),
+            "per_pillar": self.per_pillar,
+            "over_budget": estimate_tokens(prompt) > self.budget_tokens,
+            "batch_size": len(requests),
+        }
+        return prompt, stats
@@ -0,0 +1,150 @@
+"""
+Gemini生成結果のローカルキャッシュ
+
+処理の肝:
+- キーは (プロンプト, モデル名, 日付バケット) のSHA-256。同じ日・同じプロンプトの再実行だけがヒットする
+- 1エントリ1ファイル（<key>.json）で保存。ヒット時にmtimeを更新し、件数上限を超えたらmtimeの古い順に削除（LRU）
+- created_at から ttl 秒を過ぎたエントリは期限切れとして扱う
+- 応答を使い終えた（通知を送信待ちに書き出した・重複として捨てた）実行は discard でエントリを消す
+
+採用理由: 生成のあと、通知を書き出す前に失敗した実行をやり直すとき、同じ日の生成をやり直さずに済む
+注意点: 日付が変わるとキーが変わるため、前日の結果が翌日に流用されることはない。
+        使い終えた応答を残すと、同じ日の再実行が通知済みのトレンドだけを受け取って "duplicates" で終わる
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+RESPONSE_CACHE_DIR = os.path.join("cache", "responses")
+
+
+class ResponseCache:
+    def __init__(self, directory=RESPONSE_CACHE_DIR, ttl=12 * 60 * 60, max_entries=200,
+                 bucket_format="%Y-%m-%d", enabled=True):
+        """
+        Args:
+            directory: キャッシュファイルの保存先
+            ttl: エントリの有効期間（秒）
+            max_entries: 保持する最大件数（超えたら古い順に削除）
+            bucket_format: 日付バケットの書式（strftime）
+            enabled: False ならキャッシュを完全にバイパスする
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket_format = bucket_format
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, prompt, model):
+        bucket = datetime.now().strftime(self.bucket_format)
+        raw = json.dumps([prompt, model, bucket], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        """有効なエントリの結果を返す（ヒット/ミスは数えない）"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            return None
+        # LRU用にアクセス時刻を更新
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["result"]
+
+    def lookup(self, prompt, models):
+        """
+        どれかのモデルの結果があれば返す（何モデル調べても、ヒット/ミスは1回と数える）
+
+        Args:
+            prompt: プロンプト
+            models: 調べる順に並んだモデル名
+
+        Returns:
+            (モデル名, 結果, キー)。無い・期限切れ・無効化時は None
+        """
+        if not self.enabled:
+            return None
+        found = None
+        for model in models:
+            key = self.key(prompt, model)
+            result = self._read(key)
+            if result is not None:
+                found = (model, result, key)
+                break
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def get(self, prompt, model):
+        """キャッシュ済みの結果を返す。無い・期限切れ・無効化時は None"""
+        found = self.lookup(prompt, [model])
+        return found[1] if found else None
+
+    def discard(self, key):
+        """使い終えたエントリを消す"""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def put(self, prompt, model, result):
+        """
+        結果を保存し、件数上限を超えていれば古いものから削除する
+
+        Returns:
+            保存したエントリのキー（無効化時・書き込み失敗時は None）
+        """
+        if not self.enabled:
+            return None
+        entry = {"created_at": time.time(), "model": model, "result": result}
+        key = self.key(prompt, model)
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except IOError as e:
+            print(f"Warning: Failed to write response cache: {e}")
+            return None
+        self._evict()
+        return key
+
+    def _evict(self):
+        try:
+            files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")]
+        except OSError:
+            return
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p))
+        for path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        """ヒット/ミスの回数"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,365 @@
+"""
+常駐スケジューラ（デーモンモード）
+
+使い方:
+    python scheduler.py
+
+処理の肝:
+- プロセスを起動したままにし、Geminiクライアント（モデル一覧のキャッシュ込み）・Discordの接続プール・
+  プロファイルごとの TrendHistory をメモリ上に保持して、実行のたびに使い回す
+- cron 形式（分 時 日 月 曜日）の schedule でプロファイルごとに実行し、
+  実行時刻には予定ごとに決まる 0〜schedule_jitter_sec 秒の遅延を加える
+- bot_config.json / known_tools.json と各プロファイルの履歴ジャーナルの (mtime, size) を毎ティック確認し、
+  変わっていれば読み直す（ダッシュボードや手動の `python bot.py` が通知した分を、同じトレンドとして再通知しない）
+- プロファイルごとに「最後に処理した予定時刻」を cache/scheduler_state.json に保存し、
+  再起動時に取りこぼした予定があれば、何回分あっても1回だけ追いつき実行する
+- 送れなかった通知（outbox）は、再送の時刻が来たらティックの中で生成せずに送り直す
+
+採用理由: 起動のたびのインタプリタ起動・SDKのimport・genai.configure・モデル一覧取得を払わずに済む。
+          last_run.txt の日付判定では扱えない1日複数回の実行や、停止中の取りこぼしを回収できる
+注意点: 時刻はローカル時刻（タイムゾーンなし）で扱う。夏時間の切り替え前後の予定は1回ずれることがある。
+        日と曜日は cron と同じく、どちらも * で始まらない（*/n でもない）ときだけ「どちらかに一致」で判定する。
+        状態ファイルが無いプロファイルは、last_run.txt が今日付けなら直近の予定を処理済みとみなす
+"""
+
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+import bot
+import metrics
+from api_client import KNOWN_TOOLS_FILE
+from config_store import load_json, save_json, signature
+from notifier import ConsoleTransport, DiscordTransport
+
+STATE_FILE = "cache/scheduler_state.json"
+DEFAULT_SCHEDULE = "0 8 * * *"
+
+# (最小値, 最大値) 分 / 時 / 日 / 月 / 曜日（0=日曜、7も日曜として扱う）
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_field(text, low, high):
+    """cron の1フィールド（*, */n, a-b, a-b/n, a,b）を値の集合にする"""
+    values = set()
+    for part in text.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """5フィールドの cron 式（分 時 日 月 曜日）"""
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, low, high) for text, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        self.weekdays = {d % 7 for d in weekdays}
+        # 日と曜日の両方が指定されているときは、cron と同じくどちらかに一致すれば実行。
+        # cron は * で始まるフィールド（*/n も）を「指定なし」とみなすため、"0 8 */2 * 1" は「奇数日かつ月曜」になる
+        self._day_or_weekday = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+    def _day_matches(self, t):
+        if t.month not in self.months:
+            return False
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        return (day or weekday) if self._day_or_weekday else (day and weekday)
+
+    def next_after(self, after):
+        """after より後の最初の予定時刻"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expr!r}")
+
+    def previous(self, at):
+        """at 以前の最後の予定時刻（5年以内に無ければ None）"""
+        t = at.replace(second=0, microsecond=0)
+        limit = t - timedelta(days=366 * 5)
+        while t > limit:
+            if not self._day_matches(t):
+                t = t.replace(hour=23, minute=59) - timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=59) - timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t -= timedelta(minutes=1)
+            else:
+                return t
+        return None
+
+
+def jitter_for(name, slot, jitter_sec):
+    """予定ごとに決まる遅延（再起動しても同じ予定なら同じ値）"""
+    if not jitter_sec:
+        return timedelta(0)
+    rnd = random.Random(f"{name}:{slot.isoformat()}")
+    return timedelta(seconds=rnd.uniform(0, jitter_sec))
+
+
+class TrendScheduler:
+    def __init__(self, state_path=STATE_FILE):
+        """
+        Args:
+            state_path: 予定の処理状況を保存するファイル
+        """
+        self.state_path = state_path
+        self.state = load_json(state_path, {"profiles": {}})
+        self.state.setdefault("profiles", {})
+        self._stop = threading.Event()
+
+        self.gemini_key = os.getenv("GEMINI_API_KEY")
+        self.discord_token = os.getenv("DISCORD_BOT_TOKEN")
+        # 記録の再生（main が bot.replay_sandbox の中で動かす）はキー不要で、通知はコンソールに出す
+        replaying = bot.cassette_options(bot.load_config()).get("mode") == "replay"
+        if replaying:
+            self.discord_token = "replay"
+        elif not self.gemini_key:
+            raise ValueError("GEMINI_API_KEY is missing.")
+
+        self.config = None
+        self.profiles = []
+        self.schedules = {}
+        self.histories = {}
+        self.client = None
+        self._client_options = None
+        self.response_cache = None
+        self.transport = ConsoleTransport() if replaying else DiscordTransport(token=self.discord_token)
+        self._signatures = {}
+
+    def log(self, msg):
+        print(f"[scheduler {datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
+
+    def stop(self):
+        self._stop.set()
+
+    # --- 設定の読み込み・ホットリロード ---
+
+    def reload_if_changed(self):
+        """設定ファイル・既知ツールが変わっていれば読み直す"""
+        config_sig = signature(bot.CONFIG_FILE)
+        if self.config is None or config_sig != self._signatures.get(bot.CONFIG_FILE):
+            if self.config is not None:
+                self.log(f"{bot.CONFIG_FILE} changed. Reloading.")
+            self._signatures[bot.CONFIG_FILE] = config_sig
+            self._apply_config(bot.load_config())
+
+        tools_sig = signature(KNOWN_TOOLS_FILE)
+        if tools_sig != self._signatures.get(KNOWN_TOOLS_FILE):
+            if KNOWN_TOOLS_FILE in self._signatures:
+                self.log(f"{KNOWN_TOOLS_FILE} changed. Reloading.")
+                self.client.reload_known_tools()
+            self._signatures[KNOWN_TOOLS_FILE] = tools_sig
+
+        # 別のプロセスが履歴に追記していれば読み直す
+        for name, history in self.histories.items():
+            if history.changed_on_disk():
+                self.log(f"[{name}] {history.path} changed. Reloading history.")
+                history.load()
+
+    def _apply_config(self, config):
+        profiles = bot.load_profiles(config)
+        schedules = {}
+        for profile in profiles:
+            expr = profile.get("schedule", DEFAULT_SCHEDULE)
+            try:
+                schedules[profile["name"]] = CronSchedule(expr)
+            except ValueError as e:
+                # 不正な式は前回の設定のまま動かし続ける
+                self.log(f"[{profile['name']}] {e}. Keeping the previous schedule.")
+                if profile["name"] in self.schedules:
+                    schedules[profile["name"]] = self.schedules[profile["name"]]
+        self.config, self.profiles, self.schedules = config, profiles, schedules
+
+        # クライアントの設定が変わったときだけ作り直す（モデル一覧はディスクのキャッシュから引き継がれる）
+        options = bot.client_options(config)
+        if self.client is None or options != self._client_options:
+            self.response_cache = bot.create_response_cache(config)
+            self.client = bot.create_client(config, self.gemini_key, self.response_cache)
+            self._client_options = options
+
+        # 履歴はプロファイルの履歴ファイルが同じなら使い回す
+        histories = {}
+        for profile in profiles:
+            history = self.histories.get(profile["name"])
+            if history is None or history.path != profile["history_path"]:
+                history = bot.open_history(profile)
+            histories[profile["name"]] = history
+        self.histories = histories
+
+        for profile in profiles:
+            self._init_state(profile)
+        self.log("Schedule: " + ", ".join(f"{p['name']}={self.schedules[p['name']].expr}"
+                                          for p in profiles if p["name"] in self.schedules))
+
+    def _init_state(self, profile):
+        """状態ファイルに無いプロファイルは last_run.txt から引き継ぐ"""
+        name = profile["name"]
+        if name in self.state["profiles"] or name not in self.schedules:
+            return
+        slot = self.schedules[name].previous(datetime.now())
+        done = slot is not None and bot.has_run_today(profile)
+        self.state["profiles"][name] = {"last_slot": slot.isoformat() if done else None}
+        self._save_state()
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        save_json(self.state_path, self.state)
+
+    # --- 予定の計算 ---
+
+    def _last_slot(self, name):
+        value = self.state["profiles"].get(name, {}).get("last_slot")
+        return datetime.fromisoformat(value) if value else None
+
+    def due_profiles(self, now):
+        """今実行すべき (プロファイル, 予定時刻) の一覧（取りこぼしは直近の1回分にまとめる）"""
+        due = []
+        for profile in self.profiles:
+            name = profile["name"]
+            schedule = self.schedules.get(name)
+            slot = schedule.previous(now) if schedule else None
+            last = self._last_slot(name)
+            if slot is None or (last is not None and slot <= last):
+                continue
+            if slot + jitter_for(name, slot, profile.get("schedule_jitter_sec", 0)) <= now:
+                due.append((profile, slot))
+        return due
+
+    def next_wakeup(self, now):
+        """次に実行がありうる時刻"""
+        candidates = []
+        for profile in self.profiles:
+            name = profile["name"]
+            schedule = self.schedules.get(name)
+            if schedule is None:
+                continue
+            jitter_sec = profile.get("schedule_jitter_sec", 0)
+            slot = schedule.previous(now)
+            last = self._last_slot(name)
+            if slot is not None and (last is None or slot > last):
+                # 遅延待ちの予定
+                candidates.append(slot + jitter_for(name, slot, jitter_sec))
+            else:
+                slot = schedule.next_after(now)
+                candidates.append(slot + jitter_for(name, slot, jitter_sec))
+        if self.profiles:
+            # 送信待ちの再送時刻
+            retry_at = bot.open_outbox(self.profiles[0]).next_due()
+            if retry_at is not None:
+                candidates.append(datetime.fromtimestamp(retry_at))
+        return min(candidates) if candidates else None
+
+    # --- 実行 ---
+
+    def run_due(self, due):
+        """予定の来たプロファイルをまとめて1回の実行として処理し、状態を保存する"""
+        profiles = [profile for profile, _ in due]
+        for profile, slot in due:
+            self.log(f"[{profile['name']}] Running for schedule {slot:%Y-%m-%d %H:%M}.")
+            # 常駐中に保持期間を過ぎたエントリを落とす
+            self.histories[profile["name"]].cleanup()
+
+        metrics.start_run()
+        metrics.set_value("mode", "daemon")
+        with metrics.span("bot.models"):
+            self.client.get_available_models()
+        results = bot.run_profiles(profiles, self.config, self.client, self.discord_token,
+                                   self.transport, histories=self.histories)
+        metrics.set_value("response_cache", self.response_cache.stats())
+        record = metrics.finish_run(self.config.get("metrics_file", metrics.METRICS_FILE))
+
+        # 失敗しても同じ予定を繰り返さない（次の予定で再挑戦する）
+        for profile, slot in due:
+            name = profile["name"]
+            self.state["profiles"][name] = {
+                "last_slot": slot.isoformat(),
+                "last_run_at": datetime.now().isoformat(),
+                "last_status": results.get(name),
+            }
+            self.log(f"[{name}] {results.get(name)}")
+        self._save_state()
+        self.log(f"Run {record['run_id']} took {record['duration_sec']:.2f}s")
+        return results
+
+    def retry_outbox(self):
+        """再送の時刻が来た送信待ちの通知を送る（生成はしない）。送ったときは1回の実行として metrics.jsonl に記録する"""
+        if not self.profiles or not bot.open_outbox(self.profiles[0]).pending(due_only=True):
+            return {}
+        metrics.start_run()
+        metrics.set_value("mode", "daemon-retry")
+        results = bot.retry_outbox(self.profiles, self.transport, histories=self.histories)
+        metrics.finish_run(self.config.get("metrics_file", metrics.METRICS_FILE))
+        for name, status in results.items():
+            self.log(f"[{name}] Queued notification: {status}")
+        return results
+
+    def tick(self, now=None):
+        """1回分の確認（設定の再読み込み → 送信待ちの再送 → 予定の来たものを実行）"""
+        self.reload_if_changed()
+        self.retry_outbox()
+        due = self.due_profiles(now or datetime.now())
+        return self.run_due(due) if due else {}
+
+    def run_forever(self):
+        self.reload_if_changed()
+        # モデル一覧を先に温めておく
+        self.client.get_available_models()
+        self.log("Started. Press Ctrl+C to stop.")
+
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                self.log(f"Error: {e}")
+
+            # 次の予定まで眠る（設定の変更を拾うため、最長でも scheduler_poll_sec 秒）
+            now = datetime.now()
+            poll = self.config.get("scheduler_poll_sec", 30)
+            wakeup = self.next_wakeup(now)
+            wait = poll if wakeup is None else min(poll, max(0.0, (wakeup - now).total_seconds()))
+            self._stop.wait(max(wait, 0.5))
+        self.log("Stopped.")
+
+
+def main():
+    bot.load_env()
+    # --replay なら一時ディレクトリの中で動かし、本番の履歴・状態ファイルに触れない
+    with bot.replay_sandbox(bot.load_config()):
+        try:
+            scheduler = TrendScheduler()
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.log("Interrupted.")
+
+
+if __name__ == "__main__":
+    main()
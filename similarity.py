@@ -0,0 +1,219 @@
+"""
+近似重複検出モジュール（文字n-gram TF-IDF + コサイン類似度）
+
+処理の肝:
+- 名前は、版（"1.1" "v2"）と説明語（"terminal" "cli" など）を除いた中核の名前（core_name）が一致すれば類似度 1.0。
+  一致しなければ名前の文字n-gramのコサイン類似度
+- URLは正規化したキー（呼び出し側の url_key。GitHub などはリポジトリ単位）の完全一致だけを見る
+- 履歴の各テキストを文字n-gramの出現回数ベクトルとしてCSR形式（indices/data/indptr）で保持
+- 追加は行の追記のみ（インクリメンタル）。IDF重み付けと行の正規化は次回検索時に一度だけベクトル演算で行う
+- 検索はバッチ単位。クエリ行列 (k×V) と履歴行列の疎×密積を
+  「クエリに含まれるn-gram列だけを抜き出して np.bincount で集計」する形で一括計算し、Pythonの組ごとのループは使わない
+
+採用理由: 数万行の履歴に対しても数ミリ秒で1バッチ分を採点できる。外部依存はNumPyのみ
+注意点: IDFは検索直前のスナップショット。追加直後の最初の検索だけ再重み付けのコストがかかる。
+        URLを文字n-gramで比べると、同じ組織の別リポジトリ（github.com/astral-sh/ruff と .../uv）が近似重複になってしまう
+"""
+
+import re
+from collections import Counter
+
+import numpy as np
+
+# 名前に付いていても別のツールにはならない語
+DESCRIPTOR_WORDS = {"terminal", "app", "cli", "editor", "framework", "library", "lib", "tool",
+                    "release", "beta", "alpha", "preview", "rc"}
+
+_VERSION = re.compile(r"v?\d+(?:[.\-]\w+)*")
+_TOKEN = re.compile(r"[\w+#.\-]+")
+
+
+def core_name(name: str) -> str:
+    """
+    版・説明語を除いた比較用の名前（例: "Ghostty terminal 1.1" → "ghostty"）
+
+    名前が版・説明語だけでできている（"V8" / "Terminal" など）ときは、空にせず正規化した名前全体を返す
+    """
+    tokens = (t.strip(".-") for t in _TOKEN.findall((name or "").lower()))
+    core = " ".join(t for t in tokens if t and t not in DESCRIPTOR_WORDS and not _VERSION.fullmatch(t))
+    return core or " ".join((name or "").lower().split())
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    """前後に空白を付けたテキストから文字n-gramの出現回数を数える"""
+    text = f" {' '.join(text.lower().split())} "
+    if len(text) < n:
+        return Counter([text])
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class NgramIndex:
+    def __init__(self, n=3):
+        """
+        Args:
+            n: 文字n-gramの長さ
+        """
+        self.n = n
+        self.vocab = {}
+        self._df = np.zeros(0, dtype=np.float32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._tf = np.zeros(0, dtype=np.float32)
+        self._row_of = np.zeros(0, dtype=np.int32)
+        self._nnz = 0
+        self.n_rows = 0
+        self._weights = None
+        self._idf = None
+
+    def __len__(self):
+        return self.n_rows
+
+    def _grow(self, arr, size):
+        if size <= len(arr):
+            return arr
+        new = np.zeros(max(size, len(arr) * 2, 1024), dtype=arr.dtype)
+        new[:len(arr)] = arr
+        return new
+
+    def add(self, texts):
+        """テキストを行として追記する（既存行の再計算はしない）"""
+        new_ids, new_tf, new_rows = [], [], []
+        for text in texts:
+            for gram, count in char_ngrams(text, self.n).items():
+                idx = self.vocab.get(gram)
+                if idx is None:
+                    idx = self.vocab[gram] = len(self.vocab)
+                new_ids.append(idx)
+                new_tf.append(count)
+                new_rows.append(self.n_rows)
+            self.n_rows += 1
+        if not new_ids:
+            return
+
+        end = self._nnz + len(new_ids)
+        self._indices = self._grow(self._indices, end)
+        self._tf = self._grow(self._tf, end)
+        self._row_of = self._grow(self._row_of, end)
+        self._indices[self._nnz:end] = new_ids
+        self._tf[self._nnz:end] = new_tf
+        self._row_of[self._nnz:end] = new_rows
+
+        self._df = self._grow(self._df, len(self.vocab))
+        np.add.at(self._df, np.asarray(new_ids, dtype=np.int32), 1)
+        self._nnz = end
+        self._weights = None
+
+    def _compile(self):
+        """IDF重み付けとL2正規化を全行まとめて計算する"""
+        indices = self._indices[:self._nnz]
+        rows = self._row_of[:self._nnz]
+        df = self._df[:len(self.vocab)]
+        self._idf = (np.log((1.0 + self.n_rows) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        weights = self._tf[:self._nnz] * self._idf[indices]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=self.n_rows))
+        norms[norms == 0] = 1.0
+        self._weights = (weights / norms[rows]).astype(np.float32)
+
+    def query(self, texts) -> np.ndarray:
+        """
+        テキストのバッチを全履歴行と比較する
+
+        Returns:
+            (len(texts), n_rows) のコサイン類似度行列
+        """
+        k = len(texts)
+        if k == 0 or self.n_rows == 0:
+            return np.zeros((k, self.n_rows), dtype=np.float32)
+        if self._weights is None:
+            self._compile()
+
+        unseen_idf = np.log(1.0 + self.n_rows) + 1.0
+        vocab_size = len(self.vocab)
+        q = np.zeros((k, vocab_size), dtype=np.float32)
+        q_norms = np.zeros(k, dtype=np.float32)
+        for i, text in enumerate(texts):
+            sq = 0.0
+            for gram, count in char_ngrams(text, self.n).items():
+                idx = self.vocab.get(gram)
+                if idx is None:
+                    # 履歴に無いn-gramは内積に寄与しないが、ノルムには含める
+                    sq += (count * unseen_idf) ** 2
+                else:
+                    w = count * self._idf[idx]
+                    q[i, idx] = w
+                    sq += w * w
+            q_norms[i] = np.sqrt(sq) or 1.0
+        q /= q_norms[:, None]
+
+        # クエリに現れるn-gram列を持つ要素だけを抜き出して積和を取る
+        indices = self._indices[:self._nnz]
+        used = q.any(axis=0)
+        mask = used[indices]
+        cols = indices[mask]
+        rows = self._row_of[:self._nnz][mask]
+        contrib = q[:, cols] * self._weights[mask]
+
+        flat_rows = (np.arange(k, dtype=np.int64)[:, None] * self.n_rows + rows).ravel()
+        sims = np.bincount(flat_rows, weights=contrib.ravel(), minlength=k * self.n_rows)
+        return sims.reshape(k, self.n_rows).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, n=3):
+        """
+        名前のn-gramインデックスと、中核の名前・URLキー→履歴エントリの辞書を持つ
+
+        Args:
+            n: 文字n-gramの長さ
+        """
+        self.names = NgramIndex(n)
+        self._name_entries = []
+        self._by_core_name = {}
+        self._by_url = {}
+
+    def add(self, entries, url_key=None):
+        """
+        履歴エントリを追加する
+
+        Args:
+            entries: name/url キーを持つ辞書のリスト
+            url_key: URLを比較用文字列に変換する関数（省略時はそのまま）
+        """
+        url_key = url_key or (lambda u: u)
+        self.names.add([e.get("name", "") for e in entries])
+        self._name_entries.extend(entries)
+        for e in entries:
+            core = core_name(e.get("name", ""))
+            if core:
+                self._by_core_name[core] = e
+            key = url_key(e.get("url", ""))
+            if key:
+                self._by_url[key] = e
+
+    def best_matches(self, items, url_key=None):
+        """
+        各アイテムに最も近い履歴エントリと類似度を返す（中核の名前かURLキーが一致すれば 1.0）
+
+        Args:
+            items: name/url キーを持つ辞書のリスト
+            url_key: URLを比較用文字列に変換する関数
+
+        Returns:
+            [(entry or None, score), ...]
+        """
+        url_key = url_key or (lambda u: u)
+        results = [(None, 0.0)] * len(items)
+        if not items:
+            return results
+
+        name_sims = self.names.query([i.get("name", "") for i in items])
+
+        for i, item in enumerate(items):
+            key = url_key(item.get("url", ""))
+            exact = self._by_core_name.get(core_name(item.get("name", ""))) or (key and self._by_url.get(key))
+            if exact:
+                results[i] = (exact, 1.0)
+            elif name_sims.shape[1]:
+                j = int(name_sims[i].argmax())
+                results[i] = (self._name_entries[j], float(name_sims[i, j]))
+        return results
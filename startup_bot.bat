@@ -1,4 +1,4 @@
 @echo off
 cd /d "c:\Users\osa\Web_Scraping"
-python bot.py
+python scheduler.py
 pause
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+import bot
+import notifier
+
+TRENDS = {
+    "date": "2026-10-17",
+    "trends": [
+        {"name": "Ruff", "description": "速いリンター", "url": "https://github.com/astral-sh/ruff",
+         "buzz_factor": "【Alpha Trend】"},
+        {"name": "Error Lens", "description": "エラーを行内に表示",
+         "url": "https://marketplace.visualstudio.com/items?itemName=usernamehw.errorlens",
+         "buzz_factor": "【Power Tip】"},
+        {"name": "Zellij", "description": "ターミナルワークスペース", "url": "https://zellij.dev",
+         "buzz_factor": "【Hidden Gem】"},
+    ],
+    "one_line_summary": "今日のハイライト",
+}
+
+
+@pytest.fixture
+def production(tmp_path, monkeypatch):
+    """本番の作業ディレクトリに見立てたディレクトリ（状態ファイルとカセットを置く）"""
+    config = {
+        "search_category": "Dev Tools",
+        "target_languages": "Rust",
+        "hedge_delay_sec": None,
+        "stream_generation": False,
+        "url_check": {"enabled": False},
+    }
+    (tmp_path / "bot_config.json").write_text(json.dumps(config), encoding="utf-8")
+    (tmp_path / "known_tools.json").write_text(json.dumps({"known_tools": ["VS Code"]}), encoding="utf-8")
+    (tmp_path / "last_run.txt").write_text("2026-10-16", encoding="utf-8")
+    (tmp_path / "trend_history.jsonl").write_text(
+        json.dumps({"name": "Zed", "url": "https://zed.dev", "date": "2026-10-16"}) + "\n", encoding="utf-8")
+    (tmp_path / "cassettes").mkdir()
+    records = [
+        {"type": "list_models", "elapsed_sec": 0, "models": [{"name": "models/gemini-2.5-flash",
+                                                              "methods": ["generateContent"]}]},
+        {"type": "generate", "model": "gemini-2.5-flash", "prompt_sha": "x", "prompt_kind": "single",
+         "stream": False, "text": json.dumps(TRENDS, ensure_ascii=False), "elapsed_sec": 0},
+    ]
+    (tmp_path / "cassettes" / "gemini.jsonl").write_text(
+        "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records), encoding="utf-8")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("sys.argv", ["bot.py", "--replay"])
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.setenv("DISCORD_BOT_TOKEN", "production-token")
+    monkeypatch.setenv("DISCORD_CHANNEL_ID", "1")
+    monkeypatch.setattr(bot, "load_env", lambda: None)
+
+    def no_discord(*args, **kwargs):
+        raise AssertionError("replay must not create a real Discord transport")
+    monkeypatch.setattr(notifier, "DiscordTransport", no_discord)
+    return tmp_path
+
+
+def _snapshot(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, root)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def test_replay_twice_leaves_production_state_untouched(production, capsys):
+    before = _snapshot(production)
+
+    for _ in range(2):
+        results = bot.main()
+        # 2回目も「今日は実行済み」で止まらず、送信待ち → コンソールまで通る
+        assert results == {"default": "sent"}
+        assert os.getcwd() == str(production)
+
+    assert _snapshot(production) == before
+    assert capsys.readouterr().out.count("[console] POST /channels/1/messages") == 2
@@ -0,0 +1,45 @@
+from filter_engine import AhoCorasick, TrendFilter
+
+
+def item(name, url="", description="", pillar="Alpha Trend"):
+    return {"name": name, "url": url, "description": description, "buzz_factor": f"【{pillar}】"}
+
+
+def test_automaton_finds_overlapping_patterns():
+    matcher = AhoCorasick(["he", "she", "hers"])
+    found = sorted((start, end, matcher.patterns[i]) for start, end, i in matcher.finditer("ushers"))
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_known_tools_match_only_on_word_boundaries():
+    trend_filter = TrendFilter(["Arc", "Go"])
+    assert trend_filter.check(item("Search Pilot")) is None
+    assert trend_filter.check(item("Gopher Lua")) is None
+    assert trend_filter.check(item("Arc Browser")) == "known tool 'Arc' in name"
+    assert trend_filter.check(item("arc-boost")) == "known tool 'Arc' in name"
+
+
+def test_non_ascii_edges_do_not_need_boundaries():
+    trend_filter = TrendFilter(excluded_keywords="暗号")
+    assert trend_filter.check(item("Vault", description="暗号資産ウォレット")) == "excluded keyword '暗号' in description"
+
+
+def test_power_tip_may_name_a_known_tool():
+    trend_filter = TrendFilter(["Obsidian"], excluded_keywords="crypto")
+    assert trend_filter.check(item("Obsidian Git", pillar="Power Tip")) is None
+    assert trend_filter.check(item("Obsidian Git")) == "known tool 'Obsidian' in name"
+    # 除外キーワードは Power Tip でも除外する
+    assert trend_filter.check(item("Obsidian Crypto", pillar="Power Tip")) == "excluded keyword 'crypto' in name"
+
+
+def test_aliases_report_the_canonical_name():
+    trend_filter = TrendFilter(["Visual Studio Code"], aliases={"Visual Studio Code": ["VS Code"]})
+    assert trend_filter.check(item("VS Code Insiders")) == "known tool 'Visual Studio Code' in name"
+
+
+def test_code_hosts_are_not_matched_against_known_tools():
+    trend_filter = TrendFilter(["GitHub", "Go", "Arc"])
+    assert trend_filter.check(item("Ruff", "https://github.com/astral-sh/ruff")) is None
+    assert trend_filter.check(item("Copilot Workspace", "https://githubnext.com/projects/copilot-workspace")) is None
+    # コードホスト以外のホストは引き続き照合する
+    assert trend_filter.check(item("New Browser", "https://arc.net/max")) == "known tool 'Arc' in url"
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from json_stream import JsonStreamParser, StreamInvalid
+
+DOC = {
+    "date": "2026-10-17",
+    "trends": [
+        {"name": "Ruff", "description": "括弧 {} と [] とカンマ, を含む説明", "url": "https://github.com/astral-sh/ruff",
+         "buzz_factor": "【Alpha Trend】"},
+        {"name": "Quote \"q\" \\ back\\slash", "description": "改行\nタブ\t", "url": "https://example.com/?a=1&b=2",
+         "buzz_factor": "【Power Tip】"},
+        {"name": "絵文字 🚀 と あ", "description": "}]\",", "url": "", "buzz_factor": "【Hidden Gem】"},
+    ],
+    "one_line_summary": "今日は \"3つ\" {です}",
+}
+
+EXPECTED = [("field", "date", DOC["date"])] + [("item", "trends", t) for t in DOC["trends"]] + \
+    [("field", "one_line_summary", DOC["one_line_summary"])]
+
+
+def parse(chunks, validator=None):
+    parser = JsonStreamParser(validator)
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+def test_every_chunk_boundary_gives_the_same_events(ensure_ascii):
+    # ensure_ascii=True では \" \\ \n \uXXXX（サロゲートペア含む）のエスケープの途中でも切れる
+    text = "```json\n" + json.dumps(DOC, ensure_ascii=ensure_ascii, indent=2) + "\n```"
+    for cut in range(len(text) + 1):
+        parser, events = parse([text[:cut], text[cut:]])
+        assert events == EXPECTED, cut
+        assert parser.close() == DOC
+
+
+def test_one_character_at_a_time():
+    text = json.dumps(DOC, ensure_ascii=False)
+    parser, events = parse(text)
+    assert events == EXPECTED
+    assert parser.close() == DOC
+
+
+def test_items_are_emitted_as_soon_as_they_complete():
+    text = json.dumps(DOC, ensure_ascii=False)
+    first_item = json.dumps(DOC["trends"][0], ensure_ascii=False)
+    first_item_end = text.index(first_item) + len(first_item)
+    parser = JsonStreamParser()
+    assert parser.feed(text[:first_item_end - 1]) == [("field", "date", DOC["date"])]
+    assert parser.feed(text[first_item_end - 1:first_item_end]) == [("item", "trends", DOC["trends"][0])]
+
+
+@pytest.mark.parametrize("cut", [1, 30, 120, -40, -2])
+def test_truncated_stream_fails_on_close(cut):
+    text = json.dumps(DOC, ensure_ascii=False)
+    parser, _ = parse([text[:cut]])
+    with pytest.raises(StreamInvalid):
+        parser.close()
+
+
+def test_non_json_prefix_fails_on_the_first_chunk():
+    with pytest.raises(StreamInvalid):
+        JsonStreamParser().feed("Sure! Here are today's trends:")
+    # フェンスの途中までは待つ
+    assert JsonStreamParser().feed("``") == []
+
+
+def test_validator_rejects_an_item_mid_stream():
+    def validator(key, item):
+        if not item.get("url"):
+            raise ValueError(f"{item['name']} has no url")
+
+    text = json.dumps(DOC, ensure_ascii=False)
+    parser = JsonStreamParser(validator)
+    with pytest.raises(StreamInvalid, match="has no url"):
+        for i in range(0, len(text), 16):
+            parser.feed(text[i:i + 16])
+    assert len(parser.text) < len(text)  # 最後まで待たずに打ち切れる
+
+
+def test_malformed_item_is_reported():
+    with pytest.raises(StreamInvalid):
+        JsonStreamParser().feed('{"trends": [{"name": "a",}]}')
@@ -0,0 +1,101 @@
+import pytest
+
+import model_router
+from model_router import ModelRouter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_router.time, "time", clock.time)
+    return clock
+
+
+@pytest.fixture
+def router(tmp_path, clock):
+    return ModelRouter(path=str(tmp_path / "model_stats.json"), failure_threshold=3, cooldown_sec=600,
+                       max_cooldown_sec=2000)
+
+
+MODELS = ["gemini-2.5-pro", "gemini-2.5-flash"]
+
+
+def test_opens_after_three_failures_in_a_row(router):
+    for _ in range(2):
+        router.record("gemini-2.5-pro", 1.0, RuntimeError("503 UNAVAILABLE"))
+    assert router.order(MODELS) == ["gemini-2.5-flash", "gemini-2.5-pro"]  # 成功率が下がって後ろへ
+    router.record("gemini-2.5-pro", 1.0, RuntimeError("503 UNAVAILABLE"))
+    assert router.order(MODELS) == ["gemini-2.5-flash"]
+
+
+def test_success_resets_the_failure_streak(router):
+    for error in (RuntimeError("503"), RuntimeError("503"), None, RuntimeError("503"), RuntimeError("503")):
+        router.record("gemini-2.5-pro", 1.0, error)
+    assert not router.is_open("gemini-2.5-pro")
+
+
+def test_auth_error_opens_at_once(router):
+    router.record("gemini-2.5-pro", 0.1, RuntimeError("401 API_KEY_INVALID"))
+    assert router.is_open("gemini-2.5-pro")
+
+
+def test_half_open_probe_failure_doubles_the_cooldown(router, clock):
+    for _ in range(3):
+        router.record("gemini-2.5-pro", 1.0, RuntimeError("503"))
+    assert router._stats["gemini-2.5-pro"]["cooldown_sec"] == 600
+
+    clock.now += 601  # 期間が過ぎたら1回だけ試す
+    assert "gemini-2.5-pro" in router.order(MODELS)
+    router.record("gemini-2.5-pro", 1.0, RuntimeError("503"))
+    assert router.is_open("gemini-2.5-pro")
+    assert router._stats["gemini-2.5-pro"]["open_until"] == clock.now + 1200
+
+    clock.now += 1201
+    router.record("gemini-2.5-pro", 1.0, RuntimeError("503"))
+    assert router._stats["gemini-2.5-pro"]["cooldown_sec"] == 2000  # max_cooldown_sec まで
+
+    clock.now += 2001
+    router.record("gemini-2.5-pro", 1.0)  # 試しの1回が成功したら閉じる
+    assert not router.is_open("gemini-2.5-pro")
+    assert router._stats["gemini-2.5-pro"]["cooldown_sec"] == 0
+
+
+def test_all_open_returns_models_in_order_of_recovery(router, clock):
+    router.record("gemini-2.5-flash", 0.1, RuntimeError("403"))
+    clock.now += 10
+    router.record("gemini-2.5-pro", 0.1, RuntimeError("403"))
+    assert router.order(MODELS) == ["gemini-2.5-flash", "gemini-2.5-pro"]
+
+
+def test_fast_failures_do_not_lower_the_latency_estimate(router):
+    router.record("gemini-2.5-pro", 8.0)
+    for _ in range(2):
+        router.record("gemini-2.5-pro", 0.05, RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert router._stats["gemini-2.5-pro"]["latency_sec"] == 8.0
+    # 失敗していないモデルより速いとは見積もらない
+    router.record("gemini-2.5-flash", 9.0)
+    assert router.expected_sec("gemini-2.5-pro") > router.expected_sec("gemini-2.5-flash")
+
+
+def test_first_success_replaces_the_prior_latency(router):
+    router.record("gemini-2.5-flash", 0.2, RuntimeError("503"))
+    router.record("gemini-2.5-flash", 3.0)
+    assert router._stats["gemini-2.5-flash"]["latency_sec"] == 3.0
+
+
+def test_stats_persist_across_instances(router):
+    router.record("gemini-2.5-pro", 2.0)
+    router.record("gemini-2.5-flash", 0.1, RuntimeError("401"))
+
+    reloaded = ModelRouter(path=router.path)
+    assert reloaded._stats["gemini-2.5-pro"]["latency_sec"] == 2.0
+    assert reloaded.is_open("gemini-2.5-flash")
+    assert reloaded.order(MODELS) == ["gemini-2.5-pro"]
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+
+import pytest
+
+from outbox import Outbox
+
+
+class HttpError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code, "text": ""})()
+
+
+class FakeTransport:
+    """DiscordTransport の代わり。nonce が同じ投稿は Discord と同じく1つにまとめる"""
+
+    def __init__(self, fail_with=None):
+        self.fail_with = list(fail_with or [])
+        self.posts = []
+        self.messages = {}
+        self.before_post = None
+
+    def post(self, path, payload):
+        if self.before_post:
+            self.before_post()
+        self.posts.append((path, payload))
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        if payload.get("enforce_nonce"):
+            self.messages.setdefault(payload["nonce"], payload)
+        else:
+            self.messages[len(self.messages)] = payload
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(directory=str(tmp_path / "outbox"), base_delay_sec=0.01, lease_sec=60)
+
+
+def enqueue(outbox):
+    return outbox.enqueue("default", "1", {"embeds": [{"title": "t"}]}, [{"name": "Ruff", "url": ""}])
+
+
+def test_retry_reuses_the_nonce(outbox):
+    entry = enqueue(outbox)
+    transport = FakeTransport(fail_with=[HttpError(503)])
+
+    assert not outbox.deliver(entry, transport)
+    [queued] = outbox.pending()
+    assert queued["attempts"] == 1 and queued["next_attempt_at"] > queued["created_at"]
+
+    assert outbox.deliver(queued, transport)
+    assert [p["nonce"] for _, p in transport.posts] == [entry["id"], entry["id"]]
+    assert all(p["enforce_nonce"] for _, p in transport.posts)
+    assert outbox.pending() == []
+
+
+def test_on_delivered_runs_before_the_entry_is_removed(outbox):
+    entry = enqueue(outbox)
+    seen = []
+    outbox.deliver(entry, FakeTransport(), lambda e: seen.append(os.path.exists(outbox._path(e["id"]))))
+    assert seen == [True]
+    assert not os.path.exists(outbox._path(entry["id"]))
+
+
+def test_crash_after_send_is_resent_with_the_same_nonce(outbox):
+    entry = enqueue(outbox)
+    transport = FakeTransport()
+
+    def crash(_):
+        raise RuntimeError("process died before unlink")
+    with pytest.raises(RuntimeError):
+        outbox.deliver(entry, transport, crash)
+
+    # エントリは残り、次の実行で同じ nonce のまま送り直す（Discord 側では1件にまとまる）
+    [queued] = outbox.pending()
+    delivered = []
+    assert outbox.deliver(queued, transport, delivered.append)
+    assert len(transport.posts) == 2 and len(transport.messages) == 1
+    assert [e["id"] for e in delivered] == [entry["id"]]
+
+
+def test_lock_left_by_a_dead_process_is_taken_over_after_the_lease(outbox):
+    entry = enqueue(outbox)
+    lock = outbox._path(entry["id"], ".lock")
+    with open(lock, "w", encoding="utf-8") as f:
+        f.write("12345 0")
+    transport = FakeTransport()
+
+    assert not outbox.deliver(entry, transport)
+    assert transport.posts == []
+
+    expired = time.time() - outbox.lease_sec - 1
+    os.utime(lock, (expired, expired))
+    assert outbox.deliver(entry, transport)
+    assert len(transport.posts) == 1
+    assert not os.path.exists(lock)
+
+
+def test_concurrent_deliveries_post_once(outbox):
+    entry = enqueue(outbox)
+    transport = FakeTransport()
+    posting, release = threading.Event(), threading.Event()
+
+    def block():
+        posting.set()
+        release.wait(5)
+    transport.before_post = block
+
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", outbox.deliver(dict(entry), transport)))
+    first.start()
+    posting.wait(5)
+    # 送信中のエントリは別の送り手が取れない
+    results["second"] = outbox.deliver(dict(entry), transport)
+    release.set()
+    first.join(5)
+
+    assert results == {"first": True, "second": False}
+    assert len(transport.posts) == 1
+
+    # 送り終えたあとの呼び出しは、送信済みとして何もしない
+    assert outbox.deliver(dict(entry), transport)
+    assert len(transport.posts) == 1
+
+
+def test_non_retryable_4xx_moves_to_failed(outbox):
+    entry = enqueue(outbox)
+    transport = FakeTransport(fail_with=[HttpError(400)])
+
+    assert not outbox.deliver(entry, transport)
+    assert outbox.pending() == []
+    assert os.path.exists(outbox._path(entry["id"], ".failed.json"))
+    # 諦めたエントリは送信済み扱いにもしない
+    assert not outbox.deliver(entry, transport)
+    assert len(transport.posts) == 1
+
+
+def test_429_is_retried(outbox):
+    entry = enqueue(outbox)
+    assert not outbox.deliver(entry, FakeTransport(fail_with=[HttpError(429)]))
+    [queued] = outbox.pending()
+    assert queued["attempts"] == 1
+    assert not os.path.exists(outbox._path(entry["id"], ".failed.json"))
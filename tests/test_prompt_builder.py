@@ -0,0 +1,42 @@
+import pytest
+
+from prompt_builder import PromptBuilder
+
+TOOLS = [f"Tool{i}" for i in range(200)]
+
+
+def test_fixed_prompt_over_budget_sends_no_tools_and_warns(capsys):
+    prompt, stats = PromptBuilder(budget_tokens=500).build(TOOLS, "Dev Tools")
+    assert stats["known_tools_sent"] == 0
+    assert stats["over_budget"] is True
+    assert "over the budget of 500" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("budget", [600, 700, 1000])
+def test_prompt_with_tools_stays_within_budget(budget):
+    _, stats = PromptBuilder(budget_tokens=budget).build(TOOLS, "Dev Tools")
+    assert 0 < stats["known_tools_sent"] < len(TOOLS)
+    assert stats["tokens"] <= budget
+    assert stats["over_budget"] is False
+
+
+def test_batch_prompt_stays_within_budget():
+    requests = [("r1", "Dev Tools", "Rust"), ("r2", "PKM", "")]
+    _, stats = PromptBuilder(budget_tokens=900).build_batch(TOOLS, requests)
+    assert stats["known_tools_sent"] > 0
+    assert stats["tokens"] <= 900
+
+
+def test_memo_keeps_one_entry_per_category():
+    tools = TOOLS[:10]
+    builder = PromptBuilder(budget_tokens=2000)
+    first, _ = builder.build(tools, "Dev Tools")
+    assert builder.build(tools, "Dev Tools")[0] == first
+
+    # 既知ツールが変わったら同じ分野のメモを置き換える（増え続けない）
+    for n in range(5):
+        builder.build(tools + [f"New{n}"], "Dev Tools")
+    builder.build(tools, "PKM")
+    assert len(builder._memo) == 2
+    assert "New4" in builder.build(tools + ["New4"], "Dev Tools")[0]
+    assert "New4" not in builder.build(tools, "Dev Tools")[0]
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from scheduler import CronSchedule
+
+
+def test_stepped_day_of_month_is_anded_with_weekday():
+    # cron と同じく */2 は「指定なし」扱いなので、奇数日かつ月曜だけ
+    schedule = CronSchedule("0 8 */2 * 1")
+    fired = schedule.next_after(datetime(2026, 10, 1))
+    # 「どちらかに一致」なら 10/1（木曜・奇数日）に動いてしまう
+    assert fired == datetime(2026, 10, 5, 8, 0)
+    assert schedule.next_after(fired) == datetime(2026, 10, 19, 8, 0)
+
+
+def test_stepped_weekday_is_anded_with_day_of_month():
+    schedule = CronSchedule("0 8 15 * */3")  # 15日かつ（日・水・土曜）
+    fired = schedule.next_after(datetime(2026, 10, 1))
+    assert fired.day == 15 and (fired.weekday() + 1) % 7 in {0, 3, 6}
+
+
+def test_restricted_day_and_weekday_are_ored():
+    schedule = CronSchedule("0 8 15 * 1")  # 15日か月曜
+    assert schedule.next_after(datetime(2026, 10, 13)) == datetime(2026, 10, 15, 8, 0)
+    assert schedule.next_after(datetime(2026, 10, 16)) == datetime(2026, 10, 19, 8, 0)
@@ -0,0 +1,64 @@
+import pytest
+
+from similarity import core_name
+from trend_history import TrendHistory, normalize_url
+
+
+def make_history(tmp_path, entries):
+    history = TrendHistory(path=str(tmp_path / "history.jsonl"), legacy_path=str(tmp_path / "missing.json"))
+    history.add_many(entries)
+    return history
+
+
+def test_core_name_strips_versions_and_descriptors():
+    assert core_name("Ghostty terminal 1.1") == "ghostty"
+    assert core_name("Deno v2.0-beta") == "deno"
+    assert core_name("React Router") == "react router"
+
+
+def test_normalize_url_collapses_code_host_paths():
+    assert normalize_url("https://github.com/Astral-sh/ruff/releases/tag/v1") == "github.com/astral-sh/ruff"
+    assert normalize_url("https://github.com/astral-sh/uv.git") == "github.com/astral-sh/uv"
+    assert normalize_url("https://www.Example.com/Foo/?ref=x") == "example.com/Foo"
+
+
+def test_version_suffix_is_near_duplicate(tmp_path):
+    history = make_history(tmp_path, [{"name": "Ghostty", "url": "https://ghostty.org"}])
+    [(entry, score)] = history.find_similar([{"name": "Ghostty terminal 1.1", "url": "https://ghostty.org/download"}])
+    assert entry is not None and entry["name"] == "Ghostty"
+    assert score == 1.0
+
+
+def test_same_repo_different_path_is_near_duplicate(tmp_path):
+    history = make_history(tmp_path, [{"name": "Ruff", "url": "https://github.com/astral-sh/ruff"}])
+    [(entry, _)] = history.find_similar([{"name": "Ruff linter", "url": "https://github.com/astral-sh/ruff/blob/main/README.md"}])
+    assert entry is not None
+
+
+def test_sibling_repos_on_same_org_are_not_near_duplicates(tmp_path):
+    history = make_history(tmp_path, [
+        {"name": "uv", "url": "https://github.com/astral-sh/uv"},
+    ])
+    matches = history.find_similar([
+        {"name": "Ruff", "url": "https://github.com/astral-sh/ruff"},
+        {"name": "ty", "url": "https://github.com/astral-sh/ty"},
+    ])
+    assert [entry for entry, _ in matches] == [None, None]
+
+
+def test_core_name_falls_back_to_the_full_name():
+    assert core_name("V8") == "v8"
+    assert core_name("Terminal") == "terminal"
+
+
+@pytest.mark.parametrize("known, proposed", [
+    ("React", "React Native"),
+    ("Deno", "Deno Deploy"),
+    ("Tailwind CSS", "Tailwind UI"),
+    ("Obsidian", "Obsidian Sync"),
+    ("Rust", "Rust Analyzer"),
+])
+def test_sibling_products_are_not_near_duplicates(tmp_path, known, proposed):
+    history = make_history(tmp_path, [{"name": known, "url": ""}])
+    [(entry, score)] = history.find_similar([{"name": proposed, "url": ""}])
+    assert entry is None, score
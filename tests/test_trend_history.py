@@ -0,0 +1,80 @@
+import json
+from datetime import datetime, timedelta
+
+from trend_history import TrendHistory, normalize_url
+
+
+def test_changed_on_disk_detects_appends_from_another_instance(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    daemon = TrendHistory(path=path, legacy_path=None)
+    daemon.add("Ghostty", "https://ghostty.org")
+    assert not daemon.changed_on_disk()
+
+    # ダッシュボード・手動実行など別のプロセスが追記する
+    TrendHistory(path=path, legacy_path=None).add("Zed", "https://zed.dev")
+    assert daemon.changed_on_disk()
+    assert not daemon.is_duplicate("Zed")
+
+    daemon.load()
+    assert not daemon.changed_on_disk()
+    assert daemon.is_duplicate("Zed")
+
+
+def test_marketplace_extensions_are_not_duplicates_of_each_other(tmp_path):
+    history = TrendHistory(path=str(tmp_path / "history.jsonl"), legacy_path=None)
+    history.add("Error Lens", "https://marketplace.visualstudio.com/items?itemName=usernamehw.errorlens")
+
+    assert not history.is_duplicate("GitLens", "https://marketplace.visualstudio.com/items?itemName=eamodio.gitlens")
+    # 計測用のパラメータ・パラメータの順序・スキームの違いは同じページ
+    assert history.is_duplicate(
+        "Error Lens extension",
+        "http://marketplace.visualstudio.com/items?utm_source=x&itemName=usernamehw.errorlens&ref=hn")
+
+
+def test_normalize_url_keeps_identifying_query_params():
+    assert normalize_url("https://news.ycombinator.com/item?id=1") != normalize_url("https://news.ycombinator.com/item?id=2")
+    assert normalize_url("https://example.com/?p=3&utm_campaign=a#top") == "example.com?p=3"
+
+
+def test_legacy_json_is_migrated_to_the_journal(tmp_path):
+    legacy = tmp_path / "history.json"
+    now = datetime.now().isoformat()
+    legacy.write_text(json.dumps({"history": [{"name": "Ghostty", "url": "https://ghostty.org", "notified_at": now}]}),
+                      encoding="utf-8")
+    path = tmp_path / "history.jsonl"
+
+    history = TrendHistory(path=str(path), legacy_path=str(legacy))
+    assert history.is_duplicate("Ghostty")
+    assert [json.loads(line)["name"] for line in path.read_text(encoding="utf-8").splitlines()] == ["Ghostty"]
+
+    # 移行後はジャーナルだけを読む（旧ファイルが残っていても二重に取り込まない）
+    assert len(TrendHistory(path=str(path), legacy_path=str(legacy)).history) == 1
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / "history.jsonl"
+    TrendHistory(path=str(path), legacy_path=None).add_many([("Zed", "https://zed.dev"), ("Helix", "https://helix-editor.com")])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"name": "Ruff", "url": "https://git')  # 追記中のクラッシュ
+
+    history = TrendHistory(path=str(path), legacy_path=None, compact_ratio=0.9)
+    assert [e["name"] for e in history.history] == ["Zed", "Helix"]
+    assert not history.is_duplicate("Ruff")
+
+    # 続きの追記は壊れた行に混ざらない
+    history.add("Ruff", "https://github.com/astral-sh/ruff")
+    assert [e["name"] for e in TrendHistory(path=str(path), legacy_path=None).history] == ["Zed", "Helix", "Ruff"]
+
+
+def test_compact_drops_expired_and_broken_lines(tmp_path):
+    path = tmp_path / "history.jsonl"
+    old = (datetime.now() - timedelta(days=30)).isoformat()
+    now = datetime.now().isoformat()
+    lines = [json.dumps({"name": f"Old {i}", "url": "", "notified_at": old}) for i in range(3)]
+    lines += ["not json", json.dumps({"name": "Zed", "url": "https://zed.dev", "notified_at": now})]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    # 不要行（期限切れ3 + 壊れた行1）が compact_ratio を超えるので、読み込み時に書き直される
+    history = TrendHistory(path=str(path), legacy_path=None)
+    assert [json.loads(line)["name"] for line in path.read_text(encoding="utf-8").splitlines()] == ["Zed"]
+    assert not history.changed_on_disk()
@@ -2,111 +2,304 @@
 トレンド履歴管理モジュール
 
 処理の肝:
-- ツール名をキーに通知済みかどうかを判定
-- retention_days（デフォルト7日）より古いエントリは自動削除
-- JSONファイルベースでシンプルに永続化
+- 追記専用のJSONLジャーナル（1行1エントリ）に永続化
+- 読み込み時に一度だけ「正規化名 / 正規化URL」→エントリの辞書インデックスを構築し、重複判定はO(1)
+- add_many で1回の実行分をまとめて1回だけ追記 + fsync
+- 表記ゆれ（"Ghostty" と "Ghostty terminal 1.1" など）は similarity.SimilarityIndex で近似判定。
+  URLは正規化したキー（GitHub などはリポジトリ単位、それ以外はページを特定するクエリまで）の一致だけを見る
+- retention_days より古いエントリはメモリ上から即座に除外し、
+  ジャーナル上の不要行が一定割合を超えたら定期的にコンパクション（書き直し）する
 
-採用理由: DBセットアップ不要、小規模データに最適
-注意点: ファイル破損リスクあり（1日1回の書き込みなので許容範囲）
+採用理由: DBセットアップ不要。180日以上・複数チャンネル分の履歴でも
+          毎回の全件書き直し・全件走査が発生しない
+注意点: ジャーナル末尾の書きかけ行（クラッシュ時）は読み込み時にスキップする。
+        別のプロセスが同じジャーナルに追記したかは changed_on_disk で分かる（常駐モードが読み直しに使う）
 """
 
 import json
 import os
 from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import metrics
+from config_store import signature
+
+
+def normalize_name(name: str) -> str:
+    """ツール名を比較用に正規化（大文字小文字・前後空白・連続空白を無視）"""
+    return " ".join((name or "").lower().split())
+
+
+# パスの先頭2階層（owner/repo）が1つのツールを表すホスト
+CODE_HOSTS = {"github.com", "gitlab.com", "codeberg.org", "bitbucket.org", "sr.ht", "git.sr.ht"}
+
+# ページの中身を変えない（流入元の計測用の）クエリパラメータ。utm_* は前方一致で除く
+TRACKING_PARAMS = {"ref", "ref_src", "source", "fbclid", "gclid", "mc_cid", "mc_eid"}
+
+
+def _identifying_query(query: str) -> str:
+    """計測用のパラメータを除き、残りをキー順に並べたクエリ"""
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+              if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS]
+    return urlencode(sorted(params))
+
+
+def normalize_url(url: str) -> str:
+    """
+    URLを比較用に正規化
+
+    スキーム・www.・末尾スラッシュ・フラグメント・計測用のクエリ（utm_* / ref など）の違いを無視する
+    （例: https://www.Example.com/foo/?ref=x → example.com/foo）。
+    ページを特定するクエリは残す
+    （例: https://marketplace.visualstudio.com/items?itemName=a.b → marketplace.visualstudio.com/items?itemName=a.b）。
+    コードホストはリポジトリ単位にまとめる
+    （例: https://github.com/Astral-sh/ruff/releases/tag/v1 → github.com/astral-sh/ruff）
+    """
+    url = (url or "").strip()
+    if not url:
+        return ""
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    if host in CODE_HOSTS:
+        segments = [s for s in path.split("/") if s][:2]
+        if segments:
+            segments[-1] = segments[-1].removesuffix(".git")
+        path = "".join(f"/{s}" for s in segments).lower()
+        return f"{host}{path}"
+    query = _identifying_query(parts.query)
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
 
 
 class TrendHistory:
-    def __init__(self, path="trend_history.json", retention_days=7):
+    def __init__(self, path="trend_history.jsonl", retention_days=7,
+                 legacy_path="trend_history.json", compact_ratio=0.25):
         """
         Args:
-            path: 履歴ファイルのパス
+            path: 履歴ジャーナル（JSONL）のパス
             retention_days: 履歴を保持する日数（デフォルト7日）
+            legacy_path: 旧形式（JSON一括保存）の履歴ファイル。ジャーナルが無い場合のみ移行元として読む
+            compact_ratio: ジャーナル中の不要行がこの割合を超えたらコンパクションする
         """
         self.path = path
         self.retention_days = retention_days
+        self.legacy_path = legacy_path
+        self.compact_ratio = compact_ratio
         self.history = []
+        self._by_name = {}
+        self._by_url = {}
+        self._dead_lines = 0
+        self._similarity = None
+        self._signature = None
         self.load()
-    
+
     def load(self):
-        """履歴ファイルを読み込む"""
+        """ジャーナルを読み込み、インデックスを構築する"""
+        with metrics.span("history.load", path=self.path) as span:
+            self._load()
+            span["entries"] = len(self.history)
+        self._signature = signature(self.path)
+
+    def changed_on_disk(self) -> bool:
+        """このインスタンスが最後に読み書きしたあと、ジャーナルが（別のプロセスに）変更されたか"""
+        return signature(self.path) != self._signature
+
+    def _load(self):
+        entries = []
+        migrated = False
+        self._dead_lines = 0
+
         if os.path.exists(self.path):
             try:
                 with open(self.path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.history = data.get("history", [])
-            except (json.JSONDecodeError, IOError) as e:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            entries.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            # クラッシュ時の書きかけ行など
+                            self._dead_lines += 1
+            except IOError as e:
                 print(f"Warning: Failed to load history file: {e}")
-                self.history = []
-        else:
-            self.history = []
-        
-        # 読み込み時に古いエントリを削除
+                entries = []
+        elif self.legacy_path and os.path.exists(self.legacy_path):
+            entries = self._load_legacy()
+            if entries:
+                print(f"Migrating {len(entries)} history entries from {self.legacy_path} to {self.path}.")
+                migrated = True
+
+        self.history = entries
+        self._rebuild_index()
+
+        # 読み込み時に古いエントリを除外
         self.cleanup()
-    
-    def save(self):
-        """履歴をファイルに保存"""
+
+        if migrated and not os.path.exists(self.path):
+            self.compact()
+
+    def _load_legacy(self) -> list:
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("history", [])
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Failed to load legacy history file: {e}")
+            return []
+
+    def _rebuild_index(self):
+        self._by_name = {}
+        self._by_url = {}
+        # 近似重複用のインデックスは次回 find_similar 時に作り直す
+        self._similarity = None
+        for entry in self.history:
+            self._index(entry)
+
+    def _index(self, entry: dict):
+        name_key = normalize_name(entry.get("name", ""))
+        if name_key:
+            self._by_name[name_key] = entry
+        url_key = normalize_url(entry.get("url", ""))
+        if url_key:
+            self._by_url[url_key] = entry
+
+    def _ends_with_newline(self) -> bool:
         try:
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump({"history": self.history}, f, ensure_ascii=False, indent=2)
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b"\n"
+        except OSError:
+            return True  # 空・未作成
+
+    def _append(self, entries: list):
+        """ジャーナル末尾にまとめて追記し、fsyncで確実にディスクへ書き出す"""
+        try:
+            # 末尾が書きかけ行なら改行で区切ってから書く（最初の行が壊れた行に繋がらないように）
+            lead = "" if self._ends_with_newline() else "\n"
+            with metrics.span("history.append", entries=len(entries)), open(self.path, "a", encoding="utf-8") as f:
+                f.write(lead + "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+                f.flush()
+                os.fsync(f.fileno())
+            self._signature = signature(self.path)
         except IOError as e:
-            print(f"Error: Failed to save history file: {e}")
-    
-    def is_duplicate(self, name: str) -> bool:
+            print(f"Error: Failed to append history file: {e}")
+
+    def compact(self):
+        """有効なエントリだけでジャーナルを書き直す（一時ファイル経由で置き換え）"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with metrics.span("history.compact", entries=len(self.history)), open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self.history))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._dead_lines = 0
+            self._signature = signature(self.path)
+        except IOError as e:
+            print(f"Error: Failed to compact history file: {e}")
+
+    def is_duplicate(self, name: str, url: str = "") -> bool:
         """
-        指定されたツール名が履歴に存在するかチェック
-        
+        指定されたツールが履歴に存在するかチェック
+
         Args:
             name: チェックするツール名
-        
+            url: ツールのURL（指定時はURL一致も重複とみなす）
+
         Returns:
             True: 重複（既に通知済み）
             False: 新規
         """
-        # 大文字小文字を無視して比較
-        name_lower = name.lower()
-        for entry in self.history:
-            if entry.get("name", "").lower() == name_lower:
-                return True
-        return False
-    
+        if normalize_name(name) in self._by_name:
+            return True
+        url_key = normalize_url(url)
+        return bool(url_key) and url_key in self._by_url
+
+    def find_similar(self, items, threshold=0.8) -> list:
+        """
+        履歴と表記ゆれ程度しか違わないアイテムを一括で探す
+
+        Args:
+            items: name/url キーを持つ辞書のリスト
+            threshold: 近似重複とみなす類似度の下限（0〜1。版・説明語を除いた名前か正規化URLが一致すれば 1.0）
+
+        Returns:
+            各アイテムについて (一致した履歴エントリ, 類似度)。閾値未満なら (None, 類似度)
+        """
+        if self._similarity is None:
+            # NumPyの読み込みは近似判定を使うときだけ
+            from similarity import SimilarityIndex
+            self._similarity = SimilarityIndex()
+            self._similarity.add(self.history, url_key=normalize_url)
+
+        with metrics.span("history.find_similar", items=len(items), rows=len(self.history)):
+            matches = self._similarity.best_matches(items, url_key=normalize_url)
+        return [(entry if score >= threshold else None, score) for entry, score in matches]
+
     def add(self, name: str, url: str = ""):
         """
-        履歴にエントリを追加
-        
+        履歴にエントリを1件追加
+
         Args:
             name: ツール名
             url: ツールのURL
         """
-        entry = {
-            "name": name,
-            "url": url,
-            "notified_at": datetime.now().isoformat()
-        }
-        self.history.append(entry)
-        self.save()
-    
+        self.add_many([(name, url)])
+
+    def add_many(self, items):
+        """
+        履歴に複数エントリをまとめて追加（ジャーナルへの追記は1回）
+
+        Args:
+            items: (name, url) のタプル、または name/url キーを持つ辞書のリスト
+        """
+        now = datetime.now().isoformat()
+        entries = []
+        for item in items:
+            if isinstance(item, dict):
+                name, url = item.get("name", ""), item.get("url", "")
+            else:
+                name, url = item
+            entries.append({"name": name, "url": url or "", "notified_at": now})
+        if not entries:
+            return
+
+        self.history.extend(entries)
+        for entry in entries:
+            self._index(entry)
+        if self._similarity is not None:
+            self._similarity.add(entries, url_key=normalize_url)
+        self._append(entries)
+
     def cleanup(self):
-        """retention_daysより古いエントリを削除"""
+        """retention_daysより古いエントリを除外し、必要ならコンパクションする"""
         cutoff = datetime.now() - timedelta(days=self.retention_days)
         original_count = len(self.history)
-        
+
         new_history = []
         for entry in self.history:
             try:
                 notified_at = datetime.fromisoformat(entry.get("notified_at", ""))
                 if notified_at > cutoff:
                     new_history.append(entry)
-            except ValueError:
+            except (TypeError, ValueError):
                 # 日付パースに失敗した場合は削除
                 pass
-        
+
         self.history = new_history
-        
+
         removed = original_count - len(self.history)
         if removed > 0:
             print(f"Cleaned up {removed} old history entries.")
-            self.save()
-    
+            self._dead_lines += removed
+            self._rebuild_index()
+
+        total_lines = len(self.history) + self._dead_lines
+        if self._dead_lines and self._dead_lines >= total_lines * self.compact_ratio:
+            self.compact()
+
     def get_history(self) -> list:
         """現在の履歴を取得"""
         return self.history
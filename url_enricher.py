@@ -0,0 +1,340 @@
+"""
+トレンドURLの検証とメタデータ取得
+
+処理の肝:
+- 全アイテムのURLを共有の requests.Session（コネクションプール）で並行に確認する。
+  同じホストへの同時接続数は per_host までに制限し、短いタイムアウトで打ち切る
+- リダイレクトを辿った先（<link rel="canonical"> があればそちら）を正規URLとし、
+  <title> / og:title と meta description / og:description を <head> の範囲だけ読んで取り出す
+- 結果は cache/url_metadata.json に保存し、生きているURLは ttl 秒、死んでいる・判定できなかったURLは
+  negative_ttl 秒の間、再確認せずに使い回す（タイムアウトと一時的な接続エラーは保存せず、次回もう一度確認する）
+- 全体の待ち時間は budget_sec で打ち切り、間に合わなかったURLは「未確認」として元のまま残す
+
+採用理由: モデルが作った存在しないURL・リンク切れがそのまま Discord に流れるのを防ぐ。
+          通知のたびに同じURLを確認し直さずに済む
+注意点: 既定では無効。bot_config.json（またはプロファイル）の url_check に "enabled": true を指定すると使う。
+        404 / 410 と名前解決の失敗・接続拒否だけを「リンク切れ」として除外する。
+        401 / 403 / 429 / 5xx・タイムアウト・SSL / プロキシのエラーや接続のリセットは、ボット対策・一時的な障害の
+        可能性があるため除外しない（GitHub やネットワークの一時的な不調で全候補が落ち、ストックが空になるのを防ぐ）
+"""
+
+import codecs
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+URL_CACHE_FILE = os.path.join("cache", "url_metadata.json")
+USER_AGENT = "Mozilla/5.0 (compatible; TrendBot/1.0; +link-check)"
+
+DEAD_STATUSES = {404, 410}
+
+# 次回もう一度確認する（キャッシュしない）エラー
+TRANSIENT_ERRORS = {"timeout", "connection"}
+
+
+def _is_unreachable(error):
+    """名前解決の失敗・接続拒否か（requests / urllib3 が包んだ元の例外まで辿る）"""
+    stack, seen = [error], set()
+    while stack:
+        e = stack.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if isinstance(e, (socket.gaierror, ConnectionRefusedError)) or type(e).__name__ == "NameResolutionError":
+            return True
+        stack.extend([getattr(e, "reason", None), e.__cause__, e.__context__])
+        stack.extend(a for a in getattr(e, "args", ()) if isinstance(a, BaseException))
+    return False
+
+
+class _HeadParser(HTMLParser):
+    """<head> からタイトル・説明文・canonical を拾う（</head> か <body> で打ち切る）"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.meta = {}
+        self.canonical = None
+        self.done = False
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k.lower(): (v or "") for k, v in attrs}
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key in ("og:title", "og:description", "description") and key not in self.meta:
+                self.meta[key] = attrs.get("content", "").strip()
+        elif tag == "link" and "canonical" in attrs.get("rel", "").lower().split():
+            self.canonical = attrs.get("href") or None
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def _clean(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class UrlEnricher:
+    def __init__(self, cache_path=URL_CACHE_FILE, ttl=7 * 24 * 60 * 60, negative_ttl=6 * 60 * 60,
+                 timeout=(3, 4), budget_sec=8.0, max_workers=8, per_host=2, max_bytes=256 * 1024):
+        """
+        Args:
+            cache_path: 確認結果のキャッシュファイル
+            ttl: 生きているURLの結果の有効期間（秒）
+            negative_ttl: リンク切れ・判定不能だったURLの結果の有効期間（秒）
+            timeout: 1リクエストの (接続, 読み取り) タイムアウト秒
+            budget_sec: 1回の enrich 全体で待つ最大秒数
+            max_workers: 同時に確認するURLの最大数
+            per_host: 同じホストへの同時リクエストの最大数
+            max_bytes: 1ページから読む最大バイト数（<head> だけ読めれば十分）
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.budget_sec = budget_sec
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept": "text/html,*/*;q=0.5"})
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._host_slots = {}
+        self._cache = self._load_cache()
+
+    # --- キャッシュ ---
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: Failed to load URL cache: {e}")
+            return {}
+
+    def _save_cache(self):
+        now = time.time()
+        with self._lock:
+            # 期限切れのエントリは書き出さない
+            entries = {url: e for url, e in self._cache.items() if not self._expired(e, now)}
+            self._cache = entries
+        try:
+            with self._save_lock:
+                os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+                tmp_path = f"{self.cache_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.cache_path)
+        except IOError as e:
+            print(f"Warning: Failed to save URL cache: {e}")
+
+    def _expired(self, entry, now):
+        ttl = self.ttl if entry.get("status") == "ok" else self.negative_ttl
+        return now - entry.get("checked_at", 0) > ttl
+
+    def cached(self, url):
+        """有効なキャッシュがあれば返す"""
+        with self._lock:
+            entry = self._cache.get(url)
+        if entry and not self._expired(entry, time.time()):
+            return entry
+        return None
+
+    # --- 確認 ---
+
+    def _slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def check(self, url):
+        """
+        1つのURLを確認する
+
+        Returns:
+            {"status": "ok" | "dead" | "unknown", "final_url", "http_status", "title", "description", "checked_at"}
+        """
+        entry = {"status": "unknown", "final_url": url, "http_status": None,
+                 "title": "", "description": "", "checked_at": time.time()}
+        if urlsplit(url).scheme not in ("http", "https") or not _host(url):
+            entry["status"] = "dead"
+            entry["error"] = "invalid url"
+            return entry
+
+        with self._slot(_host(url)), metrics.span("enrich.fetch", host=_host(url)) as span:
+            try:
+                with self.session.get(url, timeout=self.timeout, allow_redirects=True, stream=True) as response:
+                    entry["http_status"] = span["status"] = response.status_code
+                    entry["final_url"] = response.url
+                    if response.status_code in DEAD_STATUSES:
+                        entry["status"] = "dead"
+                    elif response.ok:
+                        entry["status"] = "ok"
+                        if "html" in response.headers.get("Content-Type", ""):
+                            try:
+                                self._read_head(response, entry)
+                            except requests.RequestException:
+                                pass  # 本文の途中で切れてもリンク自体は生きている
+            except requests.exceptions.Timeout:
+                # タイムアウトは判定不能として扱う
+                entry["error"] = "timeout"
+            except requests.exceptions.InvalidURL as e:
+                entry["status"] = "dead"
+                entry["error"] = type(e).__name__
+            except requests.exceptions.ConnectionError as e:
+                if _is_unreachable(e):
+                    # 存在しないホスト・接続拒否
+                    entry["status"] = "dead"
+                    entry["error"] = type(e).__name__
+                else:
+                    # SSL・プロキシのエラーや接続のリセットは判定不能として扱う
+                    entry["error"] = "connection"
+            except requests.RequestException as e:
+                entry["error"] = type(e).__name__
+        return entry
+
+    def _read_head(self, response, entry):
+        parser = _HeadParser()
+        # charset の指定が無いときに requests が ISO-8859-1 を仮定するのを避ける
+        encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else "utf-8"
+        try:
+            decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        read = 0
+        for chunk in response.iter_content(chunk_size=16 * 1024):
+            read += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done or read >= self.max_bytes:
+                break
+
+        entry["title"] = _clean(parser.meta.get("og:title") or parser.title, 200)
+        entry["description"] = _clean(parser.meta.get("og:description") or parser.meta.get("description"), 300)
+        if parser.canonical:
+            canonical = urljoin(response.url, parser.canonical)
+            if urlsplit(canonical).scheme in ("http", "https"):
+                entry["final_url"] = canonical
+
+    def check_many(self, urls):
+        """
+        複数URLを並行に確認する（キャッシュ済みはリクエストしない）
+
+        Returns:
+            URL -> 確認結果。budget_sec 内に終わらなかったURLは含まれない
+        """
+        results = {}
+        pending = []
+        for url in dict.fromkeys(u for u in urls if u):
+            entry = self.cached(url)
+            if entry is not None:
+                results[url] = entry
+                metrics.add("enrich.cache_hits")
+            else:
+                pending.append(url)
+        if not pending:
+            return results
+
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending)), thread_name_prefix="url-check")
+        check = metrics.profiled(self.check)
+        futures = {pool.submit(check, url): url for url in pending}
+        done, not_done = wait(futures, timeout=self.budget_sec)
+        # 予算切れのリクエストは待たない（各リクエストはタイムアウトで自然に終わる）
+        pool.shutdown(wait=False, cancel_futures=True)
+        if not_done:
+            print(f"URL check budget ({self.budget_sec}s) exceeded. {len(not_done)} URL(s) left unchecked.")
+            metrics.add("enrich.over_budget", len(not_done))
+
+        for future in done:
+            url = futures[future]
+            entry = future.result()
+            results[url] = entry
+            # タイムアウト・一時的な接続エラーは次回もう一度試す
+            if entry.get("error") not in TRANSIENT_ERRORS:
+                with self._lock:
+                    self._cache[url] = entry
+        self._save_cache()
+        return results
+
+    def enrich(self, trends):
+        """
+        アイテムのURLを確認し、リンク切れを除外、生きているURLは正規URLとページ情報で補う
+
+        Returns:
+            (残したアイテム, [(除外したアイテム, 理由)])
+        """
+        with metrics.span("enrich.total", urls=len(trends)):
+            results = self.check_many([t.get("url", "") for t in trends])
+
+        kept, dropped = [], []
+        for item in trends:
+            entry = results.get(item.get("url", ""))
+            if entry is None:
+                kept.append(item)
+            elif entry["status"] == "dead":
+                reason = f"HTTP {entry['http_status']}" if entry.get("http_status") else entry.get("error", "dead link")
+                dropped.append((item, f"dead link: {reason}"))
+            else:
+                if entry["status"] == "ok":
+                    item = {**item, "url": entry["final_url"],
+                            "page_title": entry["title"], "page_description": entry["description"]}
+                kept.append(item)
+        return kept, dropped
+
+
+_enrichers = {}
+_enrichers_lock = threading.Lock()
+
+
+def get_enricher(options=None):
+    """
+    設定ごとに共有の UrlEnricher を返す（接続プールとキャッシュを実行間・プロファイル間で使い回す）
+
+    Args:
+        options: bot_config.json の url_check（enabled 以外は UrlEnricher の引数名で指定）
+    """
+    kwargs = {k: v for k, v in (options or {}).items() if k != "enabled"}
+    if "timeout" in kwargs and isinstance(kwargs["timeout"], list):
+        kwargs["timeout"] = tuple(kwargs["timeout"])
+    key = json.dumps(kwargs, sort_keys=True)
+    with _enrichers_lock:
+        enricher = _enrichers.get(key)
+        if enricher is None:
+            enricher = _enrichers[key] = UrlEnricher(**kwargs)
+        return enricher